@@ -1,16 +1,19 @@
+import asyncio
 import datetime
-import json
 import re
-import urllib.request
+import sys
 
 import yaml
 
+# 复用 MSC 的共享模型目录 (磁盘缓存 + ETag 重新验证)，避免每次全量下载；
+# 需在安装了 msc 的项目环境中运行 (uv run)
+from msc.oracle.catalog import get_catalog
+
 
 def fetch_and_format():
-    url = 'https://openrouter.ai/api/v1/models'
     try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
+        catalog = get_catalog()
+        asyncio.run(catalog.refresh())
         
         core7_pattern = re.compile(r'gpt|claude|gemini|deepseek|qwen|kimi|grok', re.I)
         
@@ -19,13 +22,13 @@ def fetch_and_format():
         six_months_ago = now - datetime.timedelta(days=180)
         
         filtered = []
-        for m in data['data']:
+        for m in catalog.models():
             # Core 7 filter
-            if not core7_pattern.search(m['id']):
+            if not core7_pattern.search(m.id):
                 continue
             
             # Date filter (OpenRouter uses 'created' timestamp)
-            created_ts = m.get('created')
+            created_ts = m.created
             if created_ts:
                 created_date = datetime.datetime.fromtimestamp(created_ts)
                 if created_date < six_months_ago:
@@ -34,25 +37,20 @@ def fetch_and_format():
             filtered.append(m)
         
         # Sort by input price
-        sorted_models = sorted(filtered, key=lambda x: float(x['pricing'].get('prompt', 0)))
+        sorted_models = sorted(filtered, key=lambda x: x.pricing.get('input_1m', 0))
         
         output_data = []
         for m in sorted_models:
-            p = m['pricing']
-            # Convert to $/1M tokens
-            i_p = float(p.get('prompt', 0)) * 1000000
-            o_p = float(p.get('completion', 0)) * 1000000
-            
             model_info = {
-                "id": m['id'],
-                "name": m['name'],
+                "id": m.id,
+                "name": m.name,
                 "pricing": {
-                    "input_1m": round(i_p, 4),
-                    "output_1m": round(o_p, 4)
+                    "input_1m": m.pricing.get('input_1m', 0),
+                    "output_1m": m.pricing.get('output_1m', 0)
                 },
-                "context_window": m.get('context_length', 0),
-                "created": datetime.datetime.fromtimestamp(m.get('created', 0)).strftime('%Y-%m-%d') if m.get('created') else "Unknown",
-                "introduce": m.get('description', "No description available.")
+                "context_window": m.context_window,
+                "created": datetime.datetime.fromtimestamp(m.created).strftime('%Y-%m-%d') if m.created else "Unknown",
+                "introduce": m.description or "No description available."
             }
             output_data.append(model_info)
             
@@ -61,6 +59,7 @@ def fetch_and_format():
     except Exception:
         import traceback
         traceback.print_exc()
+        sys.exit(1)
 
 if __name__ == "__main__":
     fetch_and_format()
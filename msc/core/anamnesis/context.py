@@ -5,11 +5,19 @@ from typing import Any
 
 from msc.core.anamnesis.types import AnamnesisConfig, KnowledgeCard, SessionMetadata
 from msc.core.anamnesis.parser import ToolParser
+from msc.core.anamnesis.store import MessageStore
+from msc.oracle.cache import VOLATILE_HEADING
+from msc.oracle.tokens import TokenEstimator
 
 class ContextFactory:
-    def __init__(self, config: AnamnesisConfig, metadata: SessionMetadata):
+    def __init__(self, config: AnamnesisConfig, metadata: SessionMetadata, estimator: TokenEstimator | None = None):
         self.config = config
         self.metadata = metadata
+        # 与 Oracle 共享同一估算器，使裁剪预算与路由时的窗口判断一致
+        self.estimator = estimator or TokenEstimator()
+        # 按消息 (lineage, seq) 缓存规范化结果与 Token 计数，每轮只处理新增消息
+        self._normalized: dict[tuple[str, int], dict[str, Any]] = {}
+        self._costs: dict[tuple[str, int], int] = {}
 
     def should_trigger_rag(self, step: int) -> bool:
         return step > 0 and step % self.config.trigger_interval == 0
@@ -60,17 +68,33 @@ class ContextFactory:
         except Exception:
             return content
 
-    def _normalize_history(self, history: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    @staticmethod
+    def _history_keys(history: list[dict[str, Any]]) -> list[tuple[str, int] | None]:
+        if isinstance(history, MessageStore):
+            return [(history.lineage, seq) for seq, _ in history.entries()]
+        return [None] * len(history)
+
+    def _normalize_history(
+        self, history: list[dict[str, Any]], keys: list[tuple[str, int] | None] | None = None
+    ) -> list[dict[str, Any]]:
         if not history:
             return []
         
         new_history = []
-        for msg in history:
-            new_msg = copy.deepcopy(msg)
-            # 对 user 角色且符合跨代理模式的消息进行重序列化
-            if new_msg.get("role") == "user" and isinstance(new_msg.get("content"), str):
-                new_msg["content"] = self._render_inter_agent_message(new_msg["content"])
-            new_history.append(new_msg)
+        cache: dict[tuple[str, int], dict[str, Any]] = {}
+        for key, msg in zip(keys or [None] * len(history), history, strict=True):
+            new_msg = self._normalized.get(key) if key is not None else None
+            if new_msg is None:
+                new_msg = copy.deepcopy(msg)
+                # 对 user 角色且符合跨代理模式的消息进行重序列化
+                if new_msg.get("role") == "user" and isinstance(new_msg.get("content"), str):
+                    new_msg["content"] = self._render_inter_agent_message(new_msg["content"])
+            if key is not None:
+                cache[key] = new_msg
+            # 浅拷贝，避免下游修改污染缓存
+            new_history.append(dict(new_msg))
+        # 只保留当前历史中的消息，缓存规模不超过历史长度
+        self._normalized = cache
         
         last_msg = new_history[-1]
         if last_msg.get("role") == "assistant" and last_msg.get("content"):
@@ -84,6 +108,30 @@ class ContextFactory:
             
         return new_history
 
+    def _fit_history(
+        self, history: list[dict[str, Any]], budget: int, keys: list[tuple[str, int] | None] | None = None
+    ) -> list[dict[str, Any]]:
+        """丢弃最早的历史消息直至估算 Token 数不超过预算，且不以孤立的 tool 响应开头"""
+        costs = []
+        cache: dict[tuple[str, int], int] = {}
+        for key, msg in zip(keys or [None] * len(history), history, strict=True):
+            cost = self._costs.get(key) if key is not None else None
+            if cost is None:
+                cost = self.estimator.count([msg])
+            if key is not None:
+                cache[key] = cost
+            costs.append(cost)
+        self._costs = cache
+        total = sum(costs)
+        start = 0
+        while start < len(history) and total > budget:
+            total -= costs[start]
+            start += 1
+        if start:
+            while start < len(history) and history[start].get("role") == "tool":
+                start += 1
+        return history[start:]
+
     def _render_metadata(self) -> str:
         desc = (
             "Runtime environment metadata (time, path, Agent ID, etc.), "
@@ -91,7 +139,7 @@ class ContextFactory:
             "**DO NOT mention or discuss this section in your response.**"
         )
         return (
-            f"## Metadata\n\n"
+            f"{VOLATILE_HEADING}"
             f"{desc}\n"
             f"- **Current Time**: {self.metadata.start_time.isoformat()}\n"
             f"- **Workspace Root**: {self.metadata.workspace_root}\n"
@@ -119,14 +167,22 @@ class ContextFactory:
         notebook_hot_memory: str,
         project_specific_rules: str,
         trace_history: list[dict[str, Any]],
-        rag_cards: list[KnowledgeCard]
+        rag_cards: list[KnowledgeCard],
+        *,
+        token_budget: int | None = None,
+        native_tools: bool = False
     ) -> list[dict[str, Any]]:
-        """构建发送给 Oracle 的消息列表"""
+        """
+        构建发送给 Oracle 的消息列表；给定 token_budget 时从最早的历史开始裁剪。
+        native_tools 为 True 时工具以原生声明传给 Provider，省略文本格式的工具调用示例。
+        """
         
         # 1. 组装 System Prompt
-        system_parts = [
-            f"# Task Instruction\n\n{task_instruction}",
-            f"## Mode Instruction\n\n{mode_instruction}",
+        tool_guidelines = (
+            "## Tool Use Guidelines\n\n"
+            "You have access to a set of tools that are executed upon the user's approval. "
+            "Parallel tool calls are supported. Every turn MUST include at least one tool call."
+        ) if native_tools else (
             "## Tool Use Guidelines\n\n"
             "You have access to a set of tools that are executed upon the user's approval. "
             "Output tool calls in JSON format: `{\"name\": \"...\", \"parameters\": {...}}`.\n"
@@ -137,7 +193,12 @@ class ContextFactory:
             "{\"name\": \"write_file\", \"parameters\": {\"path\": \"test.txt\", \"content\": \"hello\"}}\n"
             "{\"name\": \"apply_diff\", \"parameters\": {\"path\": \"test.txt\", \"diff\": \"<<<<<<< SEARCH\\nhello\\n=======\\nworld\\n>>>>>>> REPLACE\"}}\n"
             "{\"name\": \"complete_task\", \"parameters\": {\"summary\": \"Task completed successfully.\"}}\n"
-            "```",
+            "```"
+        )
+        system_parts = [
+            f"# Task Instruction\n\n{task_instruction}",
+            f"## Mode Instruction\n\n{mode_instruction}",
+            tool_guidelines,
             f"## Notebook\n\n{notebook_hot_memory or 'No hot memory yet.'}",
             f"## Project Rules\n\n{project_specific_rules or 'No specific rules discovered.'}"
         ]
@@ -145,18 +206,24 @@ class ContextFactory:
         system_prompt = "\n\n".join(system_parts)
         
         # 2. 规范化历史记录 (包含 Markdown 重序列化)
-        normalized_history = self._normalize_history(trace_history)
+        keys = self._history_keys(trace_history)
+        normalized_history = self._normalize_history(trace_history, keys)
         
         # 3. 组装最终消息列表
         messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(normalized_history)
         
-        # 4. 尾部注入 Metadata 和 Idea Cards (作为独立的 user 消息以提高权重)
+        # 4. 尾部注入 Idea Cards 和 Metadata (作为独立的 user 消息以提高权重)
+        # Metadata 必须位于最末：Oracle 计算请求键时截去该段落
         tail_content = [
-            self._render_metadata(),
-            self._render_idea_cards(rag_cards)
+            self._render_idea_cards(rag_cards),
+            self._render_metadata()
         ]
         
+        if token_budget is not None:
+            fixed = messages + [{"role": "user", "content": "\n\n".join(tail_content)}]
+            normalized_history = self._fit_history(normalized_history, token_budget - self.estimator.count(fixed), keys)
+        messages.extend(normalized_history)
+        
         # 检查最后一条消息是否为 user，如果是则合并，否则追加
         if messages and messages[-1]["role"] == "user":
             messages[-1]["content"] += "\n\n" + "\n\n".join(tail_content)
@@ -188,5 +255,7 @@ class ContextFactory:
             notebook_hot_memory=notebook_hot_memory,
             project_specific_rules=kwargs.get("project_specific_rules", ""),
             trace_history=kwargs.get("trace_history", []),
-            rag_cards=kwargs.get("rag_cards", [])
+            rag_cards=kwargs.get("rag_cards", []),
+            token_budget=kwargs.get("token_budget"),
+            native_tools=kwargs.get("native_tools", False)
         )
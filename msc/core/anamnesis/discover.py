@@ -1,5 +1,13 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import os
+import platform
 from pathlib import Path
 
+from pydantic import BaseModel, ConfigDict
+
 
 class RulesDiscoverer:
     def __init__(self, workspace_root: str):
@@ -23,3 +31,192 @@ class RulesDiscoverer:
                     except Exception:
                         continue
         return rules
+
+
+class RulesBundle(BaseModel):
+    """不可变的规则快照：files 保持发现顺序，rendered 为注入 System Prompt 的文本"""
+    model_config = ConfigDict(frozen=True)
+
+    files: tuple[tuple[str, str], ...] = ()
+    rendered: str = ""
+    content_hash: str = ""
+
+    def as_dict(self) -> dict[str, str]:
+        return dict(self.files)
+
+
+def render_rules(files: list[tuple[str, str]]) -> RulesBundle:
+    rendered = "\n\n".join(f"### {name}\n\n{content.strip()}" for name, content in files)
+    return RulesBundle(
+        files=tuple(files),
+        rendered=rendered,
+        content_hash=hashlib.sha256(rendered.encode("utf-8")).hexdigest(),
+    )
+
+
+class _Inotify:
+    """Linux inotify 的最小封装 (ctypes)，仅用作 "可能有变更" 的信号"""
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    )
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, path: Path) -> bool:
+        # 对同一路径重复添加返回相同的 watch descriptor，可安全地反复调用
+        return bool(self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK) >= 0)
+
+    def drain(self) -> bool:
+        """读出所有待处理事件，返回期间是否发生过事件"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            if not data:
+                return changed
+            changed = True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class RulesCache:
+    def __init__(self, workspace_root: str, patterns: list[str] | None = None, use_inotify: bool | None = None):
+        """
+        工作区级规则缓存：以目录与文件的 (mtime, size) 戳检测变更，只重新读取变化的文件；
+        未变化时返回同一个 RulesBundle 对象。
+        use_inotify 为 None 时在 Linux 上自动尝试 inotify：无事件时连 stat 也省去。
+        """
+        self.workspace_root = Path(workspace_root)
+        self.patterns = patterns or RulesDiscoverer(workspace_root).rule_patterns
+        self._dir_stamps: dict[Path, int | None] = {}
+        self._listings: dict[Path, list[str]] = {}
+        self._file_stamps: dict[Path, tuple[int, int]] = {}
+        self._contents: dict[Path, str] = {}
+        self._bundle: RulesBundle | None = None
+        self._watcher: _Inotify | None = None
+        self.scans = 0
+        self.reads = 0
+        if use_inotify or (use_inotify is None and platform.system() == "Linux"):
+            try:
+                self._watcher = _Inotify()
+            except (OSError, AttributeError):
+                self._watcher = None
+
+    def _watch_dirs(self) -> None:
+        assert self._watcher is not None
+        dirs = {self.workspace_root}
+        for pattern in self.patterns:
+            # 同时监听尚不存在的规则目录的各级父目录，以便感知其创建
+            parent = Path(pattern).parent
+            while parent != Path("."):
+                dirs.add(self.workspace_root / parent)
+                parent = parent.parent
+        for directory in dirs:
+            if directory.is_dir():
+                self._watcher.watch(directory)
+
+    def get(self) -> RulesBundle:
+        if self._bundle is not None and self._watcher is not None and not self._watcher.drain():
+            return self._bundle
+        if self._watcher is not None:
+            self._watch_dirs()
+        if self._refresh() or self._bundle is None:
+            files: dict[str, str] = {}
+            for path in self._candidates():
+                if path in self._contents:
+                    files[path.name] = self._contents[path]
+            self._bundle = render_rules(list(files.items()))
+        return self._bundle
+
+    def _candidates(self) -> list[Path]:
+        paths: list[Path] = []
+        for pattern in self.patterns:
+            directory = self.workspace_root / Path(pattern).parent
+            paths.extend(directory / name for name in self._listings.get(directory / pattern, []))
+        return paths
+
+    def _refresh(self) -> bool:
+        """按时间戳检查变化，返回规则内容是否有变"""
+        self.scans += 1
+        listings_changed = self._refresh_listings()
+        contents_changed = self._refresh_contents()
+        return listings_changed or contents_changed
+
+    def _refresh_listings(self) -> bool:
+        """目录 mtime 变化时重新列出匹配的文件名，返回文件集合是否有变"""
+        changed = False
+        for pattern in self.patterns:
+            directory = self.workspace_root / Path(pattern).parent
+            key = directory / pattern
+            try:
+                stamp: int | None = directory.stat().st_mtime_ns
+            except OSError:
+                stamp = None
+            if key in self._listings and self._dir_stamps.get(key) == stamp:
+                continue
+            self._dir_stamps[key] = stamp
+            names = self._list_matching(directory, Path(pattern).name) if stamp is not None else []
+            if names != self._listings.get(key):
+                changed = True
+            self._listings[key] = names
+        return changed
+
+    @staticmethod
+    def _list_matching(directory: Path, name_pattern: str) -> list[str]:
+        try:
+            return sorted(n for n in os.listdir(directory) if fnmatch.fnmatch(n, name_pattern))
+        except OSError:
+            return []
+
+    def _refresh_contents(self) -> bool:
+        """只重新读取 (mtime, size) 变化的文件，返回内容是否有变"""
+        live = set(self._candidates())
+        changed = False
+        for path in list(self._contents):
+            if path not in live:
+                del self._contents[path]
+                self._file_stamps.pop(path, None)
+                changed = True
+        for path in live:
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            stamp_pair = (st.st_mtime_ns, st.st_size)
+            if self._file_stamps.get(path) == stamp_pair:
+                continue
+            try:
+                content = path.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                continue
+            self.reads += 1
+            self._file_stamps[path] = stamp_pair
+            if self._contents.get(path) != content:
+                self._contents[path] = content
+                changed = True
+        return changed
+
+    def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
@@ -1,15 +1,90 @@
 import os
+import threading
+import time
 from datetime import datetime
+from pathlib import Path
+from typing import Any
 
 from msc.core.anamnesis.types import SessionMetadata
 
+SHELLS = ["bash", "zsh", "fish", "sh"]
+
+
+def _proc_terminals(proc_root: Path) -> list[str]:
+    """从 /proc/<pid>/comm 读取进程名，无需派生子进程"""
+    running = set()
+    for entry in os.scandir(proc_root):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(os.path.join(entry.path, "comm"), encoding="utf-8", errors="replace") as f:
+                running.add(f.read().strip())
+        except OSError:
+            # 进程在扫描期间退出
+            continue
+    return [shell for shell in SHELLS if shell in running]
+
+
+def _process_list_terminals() -> list[str]:
+    """无 /proc 的平台 (Windows / macOS) 退化为进程列表命令"""
+    import subprocess
+    active_terminals = []
+    if os.name == "nt":
+        try:
+            output = subprocess.check_output(["tasklist"], text=True)
+            if "pwsh.exe" in output:
+                active_terminals.append("pwsh")
+            if "cmd.exe" in output:
+                active_terminals.append("cmd")
+        except Exception:
+            pass
+    else:
+        try:
+            output = subprocess.check_output(["ps", "-A", "-o", "comm="], text=True)
+            running = {os.path.basename(line.strip()).lstrip("-") for line in output.splitlines()}
+            active_terminals.extend(shell for shell in SHELLS if shell in running)
+        except Exception:
+            pass
+    return active_terminals
+
+
+class RuntimeFacts:
+    def __init__(self, ttl: float = 5.0, proc_root: str = "/proc"):
+        """
+        运行环境事实：静态部分 (cpu_count) 只采集一次；
+        易变部分 (活跃终端) 按 ttl 缓存，由网关内所有 Session 共享。
+        工作目录可能在运行期间改变，不在此缓存，由 MetadataProvider.collect 每次读取。
+        """
+        self.ttl = ttl
+        self.proc_root = Path(proc_root)
+        self.resource_limits: dict[str, Any] = {"cpu_count": os.cpu_count() or 1}
+        self._terminals: list[dict[str, Any]] = []
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._expires_at = 0.0
+
+    def terminals(self) -> list[dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires_at:
+                names = _proc_terminals(self.proc_root) if self.proc_root.is_dir() else _process_list_terminals()
+                self._terminals = [{"name": name} for name in names]
+                self._expires_at = now + self.ttl
+                self.refreshes += 1
+            return [dict(t) for t in self._terminals]
+
 
 class MetadataProvider:
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, facts: RuntimeFacts | None = None):
         self.agent_id = agent_id
         self.model_name: str = ""
         self.gas_used: float = 0.0
         self.gas_limit: float = 0.0
+        self.facts = facts or RuntimeFacts()
 
     def set_pfms_status(self, model_name: str, gas_used: float, gas_limit: float) -> None:
         self.model_name = model_name
@@ -17,28 +92,6 @@ class MetadataProvider:
         self.gas_limit = gas_limit
 
     def collect(self) -> SessionMetadata:
-        active_terminals = []
-        import subprocess
-        if os.name == "nt":
-            try:
-                output = subprocess.check_output(["tasklist"], text=True)
-                if "pwsh.exe" in output:
-                    active_terminals.append("pwsh")
-                if "cmd.exe" in output:
-                    active_terminals.append("cmd")
-            except Exception:
-                pass
-        else:
-            # Linux/macOS compatibility
-            try:
-                # Check for common shells in process list
-                output = subprocess.check_output(["ps", "-A"], text=True)
-                for shell in ["bash", "zsh", "fish", "sh"]:
-                    if shell in output:
-                        active_terminals.append(shell)
-            except Exception:
-                pass
-        
         capabilities = ["fs_read", "fs_write", "execute"]
         if self.model_name:
             capabilities.append("llm_inference")
@@ -50,7 +103,7 @@ class MetadataProvider:
             model_name=self.model_name,
             gas_used=self.gas_used,
             gas_limit=self.gas_limit,
-            active_terminals=[{"name": t} for t in active_terminals],
-            resource_limits={"cpu_count": os.cpu_count() or 1},
+            active_terminals=self.facts.terminals(),
+            resource_limits=dict(self.facts.resource_limits),
             capabilities=capabilities
         )
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from msc.core.anamnesis.session import SessionManager
+from msc.core.anamnesis.types import SessionMetadata
+
+# 写入时才调用，返回当前的 (元数据, 历史)
+SessionSource = Callable[[], tuple[SessionMetadata, list[dict[str, Any]]]]
+# 写入失败时回调 (session_id, agent_id, 异常)
+ErrorHandler = Callable[[str, str, Exception], None]
+
+class PersistenceService:
+    def __init__(
+        self,
+        manager: SessionManager,
+        max_workers: int = 2,
+        latency_window: int = 64,
+        on_error: ErrorHandler | None = None,
+    ):
+        """
+        会话的后台持久化：Session 只登记脏标记，写入任务在线程池中执行，不阻塞事件循环。
+        同一 Agent 的多次登记在写入前合并为一次，且同一 Agent 不会并发写入。
+        写入失败计入 errors，并交给 on_error (网关将其发布到事件总线)。
+        """
+        self.manager = manager
+        self.on_error = on_error
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="msc-persist")
+        self._dirty: dict[tuple[str, str], SessionSource] = {}
+        self._writing: set[tuple[str, str]] = set()
+        self._wake: asyncio.Event | None = None
+        self._changed: asyncio.Condition | None = None
+        self._writer: asyncio.Task[None] | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self.writes = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def mark_dirty(self, session_id: str, agent_id: str, source: SessionSource) -> None:
+        key = (session_id, agent_id)
+        if key in self._dirty:
+            self.coalesced += 1
+        self._dirty[key] = source
+        self._ensure_writer()
+        if self._wake is not None:
+            self._wake.set()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._wake = asyncio.Event()
+            self._changed = asyncio.Condition()
+            self._writer = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            for key in [k for k in self._dirty if k not in self._writing]:
+                source = self._dirty.pop(key)
+                self._writing.add(key)
+                task = asyncio.create_task(self._write(key, source))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, key: tuple[str, str], source: SessionSource) -> None:
+        session_id, agent_id = key
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._save, session_id, source)
+            self.writes += 1
+            self._latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            self.errors += 1
+            if self.on_error is not None:
+                self.on_error(session_id, agent_id, e)
+        finally:
+            self._writing.discard(key)
+            if key in self._dirty and self._wake is not None:
+                # 写入期间再次变脏，重新排队
+                self._wake.set()
+            if self._changed is not None:
+                async with self._changed:
+                    self._changed.notify_all()
+
+    def _save(self, session_id: str, source: SessionSource) -> None:
+        metadata, history = source()
+        # MessageStore 的切片保留 seq，供日志判断是否为纯追加
+        self.manager.save_session(session_id, metadata, history[:])
+
+    async def flush(self) -> None:
+        """等待所有已登记的写入完成"""
+        if self._changed is None:
+            return
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self._dirty and not self._writing)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        # 等待线程池与后台合并结束均为阻塞调用，移出事件循环
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+        await asyncio.to_thread(self.manager.close)
+
+    def stats(self) -> dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "queue_depth": len(self._dirty),
+            "in_flight": len(self._writing),
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "write_latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "write_latency_p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        }
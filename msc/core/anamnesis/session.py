@@ -1,21 +1,97 @@
+import hashlib
 import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
+from typing import Any, Literal
+
 from pydantic import BaseModel
+
+from msc.core.anamnesis.store import MessageStore
 from msc.core.anamnesis.types import SessionMetadata
 
+FsyncPolicy = Literal["always", "interval", "never"]
+
 class ThreadedSessionRecord(BaseModel):
     metadata: SessionMetadata
     history: list[dict[str, Any]]
 
+class _JournalState:
+    """单个 Agent 日志的写入进度 (仅存在于内存)"""
+    def __init__(self, seq: int = 0, snapshot_seq: int = 0) -> None:
+        # seq 跨进程单调递增：从磁盘上已有的快照与日志续接
+        self.seq = seq
+        self.snapshot_seq = snapshot_seq
+        self.messages = 0
+        self.last_marker: str | None = None
+        self.metadata: dict[str, Any] = {}
+        self.pending = 0
+        self.last_fsync = 0.0
+        self.compacting: Future[None] | None = None
+        self.lock = threading.Lock()
+
+def _marker(history: list[dict[str, Any]], index: int) -> str:
+    """标识 history[index]：MessageStore 使用其 seq (含 generation，非追加修改后必然不同)，普通列表退化为内容摘要"""
+    if isinstance(history, MessageStore):
+        return f"{history.lineage}:{history.generation}:{history.seq_at(index)}"
+    return hashlib.sha1(json.dumps(history[index], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 class SessionManager:
-    def __init__(self, storage_root: str):
+    def __init__(
+        self,
+        storage_root: str,
+        fsync: FsyncPolicy = "interval",
+        fsync_interval: float = 1.0,
+        compact_after: int = 256,
+    ):
+        """
+        会话持久化：每个 Agent 一个只追加的 JSONL 日志 ({agent_id}.jsonl) 加快照 ({agent_id}.json)。
+        每轮只追加新消息与元数据增量；日志记录数超过 compact_after 时在后台线程合并为快照。
+        fsync 决定追加后何时落盘："always" 每次、"interval" 至多每 fsync_interval 秒一次、"never" 交给操作系统。
+        """
         self.storage_root = Path(storage_root)
         self.storage_root.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self._states: dict[tuple[str, str], _JournalState] = {}
+        self._states_lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
 
     def get_session_dir(self, session_id: str) -> Path:
         return self.storage_root / session_id
 
+    def _paths(self, session_id: str, agent_id: str) -> tuple[Path, Path]:
+        session_dir = self.get_session_dir(session_id)
+        return session_dir / f"{agent_id}.json", session_dir / f"{agent_id}.jsonl"
+
+    def _state(self, session_id: str, agent_id: str) -> tuple[_JournalState, bool]:
+        with self._states_lock:
+            key = (session_id, agent_id)
+            state = self._states.get(key)
+            if state is None:
+                snapshot_seq, journal_seq = self._stored_seqs(session_id, agent_id)
+                state = self._states[key] = _JournalState(max(snapshot_seq, journal_seq), snapshot_seq)
+                return state, True
+            return state, False
+
+    def _stored_seqs(self, session_id: str, agent_id: str) -> tuple[int, int]:
+        """
+        读取磁盘上快照记录的 seq 与日志中最大的 seq。
+        若新快照写出后、旧日志删除前崩溃，旧日志记录的 seq 均不大于快照 seq，回放时被跳过。
+        """
+        snapshot_path, journal_path = self._paths(session_id, agent_id)
+        snapshot_seq = 0
+        try:
+            with open(snapshot_path, encoding="utf-8") as f:
+                snapshot_seq = int(json.load(f).get("seq", 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            snapshot_seq = 0
+        journal_seq = max((r["seq"] for r in _read_journal(journal_path)), default=0)
+        return snapshot_seq, journal_seq
+
     def save_session(
         self,
         session_id: str,
@@ -24,20 +100,180 @@ class SessionManager:
     ) -> str:
         session_dir = self.get_session_dir(session_id)
         session_dir.mkdir(parents=True, exist_ok=True)
+        state, fresh = self._state(session_id, metadata.agent_id)
+        meta = metadata.model_dump(mode="json")
 
-        record = ThreadedSessionRecord(metadata=metadata, history=history)
-        file_path = session_dir / f"{metadata.agent_id}.json"
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(record.model_dump_json(indent=2))
+        with state.lock:
+            appendable = (
+                not fresh
+                and len(history) >= state.messages
+                and (state.messages == 0 or _marker(history, state.messages - 1) == state.last_marker)
+            )
+            if appendable:
+                self._append(session_id, metadata.agent_id, state, meta, history)
+            else:
+                # 本进程首次写入或历史被改写 (非追加)：同步写出完整快照，并清除可能残缺的日志尾部
+                self._write_snapshot(session_id, metadata.agent_id, state, meta, history)
+            compact = state.pending >= self.compact_after and state.compacting is None
+            if compact:
+                state.compacting = self._submit(session_id, metadata.agent_id, state, meta, list(history))
 
         return str(session_dir)
 
+    def _append(
+        self,
+        session_id: str,
+        agent_id: str,
+        state: _JournalState,
+        meta: dict[str, Any],
+        history: list[dict[str, Any]],
+    ) -> None:
+        records = []
+        delta = {k: v for k, v in meta.items() if state.metadata.get(k) != v}
+        if delta:
+            state.seq += 1
+            records.append({"seq": state.seq, "type": "metadata", "data": delta})
+        for message in history[state.messages:]:
+            state.seq += 1
+            records.append({"seq": state.seq, "type": "message", "data": message})
+        if not records:
+            return
+
+        _, journal_path = self._paths(session_id, agent_id)
+        with open(journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records))
+            f.flush()
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - state.last_fsync >= self.fsync_interval):
+                os.fsync(f.fileno())
+                state.last_fsync = now
+
+        state.pending += len(records)
+        state.metadata = meta
+        state.messages = len(history)
+        state.last_marker = _marker(history, -1) if history else None
+
+    def _write_snapshot(
+        self,
+        session_id: str,
+        agent_id: str,
+        state: _JournalState,
+        meta: dict[str, Any],
+        history: list[dict[str, Any]],
+    ) -> None:
+        snapshot_path, journal_path = self._paths(session_id, agent_id)
+        _write_atomic(snapshot_path, _snapshot_json(meta, history, state.seq))
+        journal_path.unlink(missing_ok=True)
+        state.snapshot_seq = state.seq
+        state.pending = 0
+        state.metadata = meta
+        state.messages = len(history)
+        state.last_marker = _marker(history, -1) if history else None
+
+    def _submit(
+        self,
+        session_id: str,
+        agent_id: str,
+        state: _JournalState,
+        meta: dict[str, Any],
+        history: list[dict[str, Any]],
+    ) -> Future[None]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="msc-compact")
+        return self._executor.submit(self._compact, session_id, agent_id, state, meta, history, seq=state.seq)
+
+    def _compact(
+        self,
+        session_id: str,
+        agent_id: str,
+        state: _JournalState,
+        meta: dict[str, Any],
+        history: list[dict[str, Any]],
+        *,
+        seq: int,
+    ) -> None:
+        """后台合并：快照的序列化在锁外进行，只有替换快照与截断日志需要持锁"""
+        snapshot_path, journal_path = self._paths(session_id, agent_id)
+        tmp_path = snapshot_path.with_suffix(".json.compact")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(_snapshot_json(meta, history, seq))
+                f.flush()
+                os.fsync(f.fileno())
+            with state.lock:
+                if seq <= state.snapshot_seq:
+                    # 期间已有更新的同步快照
+                    tmp_path.unlink(missing_ok=True)
+                    return
+                os.replace(tmp_path, snapshot_path)
+                tail = [r for r in _read_journal(journal_path) if r["seq"] > seq]
+                _write_atomic(
+                    journal_path,
+                    "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in tail),
+                )
+                state.snapshot_seq = seq
+                state.pending = len(tail)
+        finally:
+            state.compacting = None
+
+    def wait_compaction(self, session_id: str, agent_id: str) -> None:
+        """等待进行中的后台合并完成"""
+        state = self._states.get((session_id, agent_id))
+        future = state.compacting if state else None
+        if future is not None:
+            future.result()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
     def load_session(self, session_id: str, agent_id: str) -> ThreadedSessionRecord | None:
-        file_path = self.get_session_dir(session_id) / f"{agent_id}.json"
-        if not file_path.exists():
+        """回放快照与其后的日志记录；日志末尾因崩溃残缺的记录被忽略"""
+        snapshot_path, journal_path = self._paths(session_id, agent_id)
+        meta: dict[str, Any] | None = None
+        history: list[dict[str, Any]] = []
+        seq = 0
+        if snapshot_path.exists():
+            with open(snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+            meta, history, seq = data["metadata"], data["history"], data.get("seq", 0)
+
+        for record in _read_journal(journal_path):
+            if record["seq"] <= seq:
+                continue
+            if record["type"] == "metadata":
+                meta = {**(meta or {}), **record["data"]}
+            elif record["type"] == "message":
+                history.append(record["data"])
+
+        if meta is None:
             return None
+        return ThreadedSessionRecord(metadata=SessionMetadata(**meta), history=history)
+
+def _snapshot_json(meta: dict[str, Any], history: list[dict[str, Any]], seq: int) -> str:
+    return json.dumps({"seq": seq, "metadata": meta, "history": history}, ensure_ascii=False, indent=2, default=str)
+
+def _write_atomic(path: Path, payload: str) -> None:
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return ThreadedSessionRecord(**data)
+def _read_journal(path: Path) -> list[dict[str, Any]]:
+    records: list[dict[str, Any]] = []
+    if not path.exists():
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 残缺的尾部记录 (写入中途崩溃)，其后的内容不可信
+                break
+            if not isinstance(record, dict) or "seq" not in record:
+                break
+            records.append(record)
+    return records
@@ -0,0 +1,189 @@
+import bisect
+import json
+import uuid
+from collections.abc import Iterable
+from typing import Any, SupportsIndex
+
+Message = dict[str, Any]
+
+
+def content_key(content: Any) -> str | tuple[str, str]:
+    """消息内容的去重键：文本直接使用 (str 自带哈希缓存)，其他内容规范化序列化"""
+    if isinstance(content, str):
+        return content
+    return "json", json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class MessageStore(list[Message]):
+    """
+    Session.history 的索引化存储：行为与 list 一致，额外为每条消息分配唯一的 seq 与稳定 id，
+    并维护内容哈希、role、tool_call_id 索引，供去重与 "seq N 之后的消息" 查询使用。
+    追加为 O(1) 增量索引；其他原地修改 (插入、删除、排序等) 重建索引，
+    保留消息原有的 seq，只为新加入的消息分配新 seq，并递增 generation。
+    """
+
+    def __init__(
+        self,
+        messages: Iterable[Message] = (),
+        seqs: list[int] | None = None,
+        lineage: str | None = None,
+        generation: int = 0,
+    ):
+        super().__init__()
+        # 同一 lineage 内 seq 唯一标识一条消息；切片与副本沿用原 lineage
+        self.lineage = lineage or uuid.uuid4().hex
+        # 每次非追加修改递增，使 "末尾消息相同" 不被误判为纯追加
+        self.generation = generation
+        self._seqs: list[int] = []
+        self._next_seq = 1
+        self._max_seq = 0
+        # seq 是否沿列表顺序递增 (插入、排序后可能不再成立)，决定 since 能否二分
+        self._ordered = True
+        self._content: dict[str | tuple[str, str], int] = {}
+        self._roles: dict[str, list[int]] = {}
+        self._tool_calls: dict[str, int] = {}
+        messages = list(messages)
+        if seqs is not None and len(seqs) == len(messages):
+            for seq, msg in zip(seqs, messages, strict=True):
+                self._add(msg, seq)
+        else:
+            for msg in messages:
+                self._add(msg, self._next_seq)
+
+    def _add(self, msg: Message, seq: int) -> None:
+        index = list.__len__(self)
+        # 先更新索引再追加，使并发读取者按 len 截取时索引总是完整的
+        if self._seqs and seq <= self._seqs[-1]:
+            self._ordered = False
+        self._seqs.append(seq)
+        self._next_seq = max(self._next_seq, seq + 1)
+        self._max_seq = max(self._max_seq, seq)
+        if isinstance(msg, dict):
+            key = content_key(msg.get("content"))
+            self._content[key] = self._content.get(key, 0) + 1
+            self._roles.setdefault(msg.get("role", ""), []).append(index)
+            if msg.get("tool_call_id"):
+                self._tool_calls[msg["tool_call_id"]] = index
+        super().append(msg)
+
+    def _reindex(self, previous: list[tuple[int, Message]]) -> None:
+        """previous 为修改前的 (seq, 消息)；按对象身份找回仍在列表中的消息的 seq"""
+        known: dict[int, list[int]] = {}
+        for seq, msg in previous:
+            known.setdefault(id(msg), []).append(seq)
+        messages = list(self)
+        super().clear()
+        self._seqs = []
+        self._max_seq = 0
+        self._ordered = True
+        self._content = {}
+        self._roles = {}
+        self._tool_calls = {}
+        self.generation += 1
+        for msg in messages:
+            seqs = known.get(id(msg))
+            self._add(msg, seqs.pop(0) if seqs else self._next_seq)
+
+    def _snapshot(self) -> list[tuple[int, Message]]:
+        return list(zip(self._seqs, list.__iter__(self), strict=True))
+
+    # --- list 接口 ---
+
+    def append(self, msg: Message) -> None:
+        self._add(msg, self._next_seq)
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for msg in messages:
+            self._add(msg, self._next_seq)
+
+    def __iadd__(self, messages: Iterable[Message]) -> "MessageStore":  # type: ignore[override,misc]
+        self.extend(messages)
+        return self
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            # 切片保留原 seq，使下游可按 seq 缓存逐条消息的处理结果
+            n = list.__len__(self)
+            ordered = index.step is None or index.step > 0
+            seqs = self._seqs[:n][index] if ordered else None
+            return MessageStore(
+                list.__getitem__(self, index), seqs, self.lineage if ordered else None, self.generation
+            )
+        return list.__getitem__(self, index)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return MessageStore, (list(self), list(self._seqs), self.lineage, self.generation)
+
+    def insert(self, index: SupportsIndex, msg: Message) -> None:
+        previous = self._snapshot()
+        super().insert(index, msg)
+        self._reindex(previous)
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        previous = self._snapshot()
+        super().__setitem__(index, value)
+        self._reindex(previous)
+
+    def __delitem__(self, index: Any) -> None:
+        previous = self._snapshot()
+        super().__delitem__(index)
+        self._reindex(previous)
+
+    def pop(self, index: SupportsIndex = -1) -> Message:
+        previous = self._snapshot()
+        msg = super().pop(index)
+        self._reindex(previous)
+        return msg
+
+    def remove(self, msg: Message) -> None:
+        previous = self._snapshot()
+        super().remove(msg)
+        self._reindex(previous)
+
+    def clear(self) -> None:
+        super().clear()
+        self._reindex([])
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        previous = self._snapshot()
+        super().sort(*args, **kwargs)
+        self._reindex(previous)
+
+    def reverse(self) -> None:
+        previous = self._snapshot()
+        super().reverse()
+        self._reindex(previous)
+
+    # --- 索引查询 ---
+
+    @property
+    def last_seq(self) -> int:
+        """当前消息中最大的 seq；有新消息加入时增大"""
+        return self._max_seq
+
+    def seq_at(self, index: int) -> int:
+        return self._seqs[index]
+
+    def id_at(self, index: int) -> str:
+        return f"{self.lineage[:8]}-{self._seqs[index]}"
+
+    def has_content(self, content: Any) -> bool:
+        return self._content.get(content_key(content), 0) > 0
+
+    def by_role(self, role: str) -> list[Message]:
+        return [list.__getitem__(self, i) for i in self._roles.get(role, [])]
+
+    def by_tool_call_id(self, tool_call_id: str) -> Message | None:
+        index = self._tool_calls.get(tool_call_id)
+        return list.__getitem__(self, index) if index is not None else None
+
+    def since(self, seq: int) -> "MessageStore":
+        """返回 seq 大于给定值的消息 (seq 有序时二分定位，不扫描历史)"""
+        if self._ordered:
+            result: MessageStore = self[bisect.bisect_right(self._seqs, seq):]
+            return result
+        pairs = [(s, msg) for s, msg in self._snapshot() if s > seq]
+        return MessageStore([msg for _, msg in pairs], [s for s, _ in pairs], self.lineage, self.generation)
+
+    def entries(self) -> list[tuple[int, Message]]:
+        return self._snapshot()
@@ -0,0 +1,185 @@
+import asyncio
+from collections import deque
+from typing import Any, ClassVar, Literal
+
+from pydantic import BaseModel, Field
+
+DropPolicy = Literal["drop_oldest", "drop_newest"]
+
+
+class BridgeEvent(BaseModel):
+    """下行 (代理 -> 界面) 的结构化事件，见 docs/plans/2026-02-04-og-bridge-design.md"""
+    method: ClassVar[str]
+    # 队列满时可丢弃；审批请求等关键事件不可丢弃
+    droppable: ClassVar[bool] = True
+
+    def coalesce_key(self) -> tuple[str, ...] | None:
+        """相同键的待投递事件可合并为一条；None 表示不可合并"""
+        return None
+
+    def merge(self, newer: "BridgeEvent") -> "BridgeEvent":
+        return newer
+
+    def to_message(self) -> dict[str, Any]:
+        return {"method": self.method, "params": self.model_dump()}
+
+
+class LogEvent(BridgeEvent):
+    method: ClassVar[str] = "msc/log"
+    agent_id: str
+    content: str
+    # delta: 流式文本增量；info / debug / error: 运行日志
+    type: str = "info"
+
+    def coalesce_key(self) -> tuple[str, ...] | None:
+        # 只合并流式增量：拼接后内容不变，只是投递次数减少
+        return ("msc/log", self.agent_id, "delta") if self.type == "delta" else None
+
+    def merge(self, newer: BridgeEvent) -> BridgeEvent:
+        assert isinstance(newer, LogEvent)
+        return self.model_copy(update={"content": self.content + newer.content})
+
+
+class SessionUpdateEvent(BridgeEvent):
+    method: ClassVar[str] = "msc/session_update"
+    agent_id: str
+    status: str
+    active_agents: list[str] = Field(default_factory=list)
+
+    def coalesce_key(self) -> tuple[str, ...] | None:
+        # 状态是快照语义，只需投递最新一条
+        return ("msc/session_update", self.agent_id)
+
+
+class ApprovalRequiredEvent(BridgeEvent):
+    method: ClassVar[str] = "msc/approval_required"
+    droppable: ClassVar[bool] = False
+    request_id: str
+    agent_id: str
+    action: str
+    data: dict[str, Any] = Field(default_factory=dict)
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus", maxsize: int, policy: DropPolicy, methods: set[str] | None):
+        """
+        单个订阅者的有界队列。发布从不阻塞：队满时按 policy 丢弃可丢弃的事件，
+        可合并的事件 (流式增量、状态快照) 在投递前原地合并。
+        """
+        self._bus = bus
+        self.maxsize = maxsize
+        self.policy = policy
+        self.methods = methods
+        self._queue: deque[list[BridgeEvent]] = deque()
+        self._pending: dict[tuple[str, ...], list[BridgeEvent]] = {}
+        self._ready = asyncio.Event()
+        # 已入队但尚未被消费者确认 (task_done) 的事件数，供 join 等待
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def offer(self, event: BridgeEvent) -> None:
+        if self.methods is not None and event.method not in self.methods:
+            return
+        key = event.coalesce_key()
+        if key is not None and key in self._pending:
+            slot = self._pending[key]
+            slot[0] = slot[0].merge(event)
+            self.coalesced += 1
+            return
+        if (
+            len(self._queue) >= self.maxsize and event.droppable
+            and (self.policy == "drop_newest" or not self._drop_oldest())
+        ):
+            self.dropped += 1
+            return
+        slot = [event]
+        self._queue.append(slot)
+        if key is not None:
+            self._pending[key] = slot
+        self._unfinished += 1
+        self._finished.clear()
+        self._ready.set()
+
+    def _drop_oldest(self) -> bool:
+        for slot in self._queue:
+            if slot[0].droppable:
+                self._queue.remove(slot)
+                self._forget(slot)
+                self.dropped += 1
+                self.task_done()
+                return True
+        return False
+
+    def _forget(self, slot: list[BridgeEvent]) -> None:
+        key = slot[0].coalesce_key()
+        if key is not None and self._pending.get(key) is slot:
+            del self._pending[key]
+
+    def get_nowait(self) -> BridgeEvent | None:
+        if not self._queue:
+            return None
+        slot = self._queue.popleft()
+        self._forget(slot)
+        if not self._queue:
+            self._ready.clear()
+        return slot[0]
+
+    async def get(self) -> BridgeEvent:
+        while True:
+            event = self.get_nowait()
+            if event is not None:
+                return event
+            self._ready.clear()
+            await self._ready.wait()
+
+    def task_done(self) -> None:
+        self._unfinished = max(0, self._unfinished - 1)
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self) -> None:
+        """等待所有已入队事件被消费并确认"""
+        await self._finished.wait()
+
+    def close(self) -> None:
+        self._bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self) -> None:
+        """进程内的异步发布-订阅总线；publish 是同步且非阻塞的，可在任意协程中调用"""
+        self._subscribers: list[Subscription] = []
+        self.published = 0
+
+    def subscribe(
+        self,
+        maxsize: int = 256,
+        policy: DropPolicy = "drop_oldest",
+        methods: list[str] | None = None,
+    ) -> Subscription:
+        subscription = Subscription(self, maxsize, policy, set(methods) if methods else None)
+        self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+
+    def publish(self, event: BridgeEvent) -> None:
+        self.published += 1
+        for subscription in self._subscribers:
+            subscription.offer(event)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "published": self.published,
+            "subscribers": [
+                {"depth": len(s), "dropped": s.dropped, "coalesced": s.coalesced} for s in self._subscribers
+            ],
+        }
@@ -1,18 +1,29 @@
 import asyncio
+import contextlib
 import json
 import os
+import uuid
+from collections.abc import AsyncIterator
 from enum import Enum
 from typing import Any
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, field_validator
 
-from msc.core.anamnesis.parser import ToolParser
-from msc.core.anamnesis.discover import RulesDiscoverer
-from msc.core.anamnesis.metadata import MetadataProvider
+from msc.core.anamnesis.parser import ToolCall, ToolParser
+from msc.core.anamnesis.discover import RulesCache, RulesDiscoverer
+from msc.core.anamnesis.metadata import MetadataProvider, RuntimeFacts
 from msc.core.anamnesis.context import ContextFactory
 from msc.core.anamnesis.types import AnamnesisConfig, SessionMetadata
+from msc.core.anamnesis.persistence import PersistenceService
 from msc.core.anamnesis.session import SessionManager
+from msc.core.anamnesis.store import MessageStore
+from msc.core.bridge import ApprovalRequiredEvent, BridgeEvent, EventBus, LogEvent, SessionUpdateEvent, Subscription
+from msc.core.scheduler import AgentScheduler, TurnSlot
 from msc.core.tools.dispatcher import ToolDispatcher
 from msc.core.tools.base import ToolContext
+from msc.oracle import Oracle
+from msc.oracle.stream import StreamChunk, collect_stream
+from msc.oracle.tokens import TokenEstimator
+from msc.oracle.transport import close_transport
 
 class SessionStatus(Enum):
     IDLE = "idle"
@@ -27,168 +38,480 @@ class Session(BaseModel):
     oracle: Any
     gateway: Any
     workspace_root: str
-    history: list[dict[str, Any]] = Field(default_factory=list)
+    history: MessageStore = Field(default_factory=MessageStore)
     status: SessionStatus = SessionStatus.IDLE
     
-    rules_discoverer: RulesDiscoverer | None = None
+    rules_cache: RulesCache | None = None
     metadata_provider: MetadataProvider | None = None
     context_factory: ContextFactory | None = None
     session_manager: SessionManager | None = None
     available_tools: list[str] = Field(default_factory=ToolDispatcher.get_available_tools)
+    stream: bool = False
+    # 同一轮内并发执行的工具调用上限
+    max_parallel_tools: int = 4
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    # 规则缓存由本 Session 创建 (而非网关共享) 时，stop 负责关闭其 inotify 句柄
+    _owns_rules_cache: bool = False
+
+    @property
+    def rules_discoverer(self) -> RulesDiscoverer:
+        """一次性的规则扫描器；运行时注入的规则由 rules_cache 提供"""
+        return RulesDiscoverer(self.workspace_root)
+
+    @field_validator("history", mode="before")
+    @classmethod
+    def _index_history(cls, value: Any) -> MessageStore:
+        return value if isinstance(value, MessageStore) else MessageStore(value or [])
+
     async def start(self) -> None:
         """初始化 Session，加载规则和元数据"""
         self.status = SessionStatus.RUNNING
-        self.rules_discoverer = RulesDiscoverer(self.workspace_root)
-        self.metadata_provider = MetadataProvider(self.agent_id)
+        # 同一工作区的各 Session (含子代理) 共享网关持有的规则缓存
+        rules_for = getattr(self.gateway, "rules_for", None) if self.gateway else None
+        shared = rules_for(self.workspace_root) if callable(rules_for) else None
+        if isinstance(shared, RulesCache):
+            self.rules_cache = shared
+        elif self.rules_cache is None:
+            self.rules_cache = RulesCache(self.workspace_root)
+            self._owns_rules_cache = True
+        attach_oracle = getattr(self.gateway, "attach_oracle", None) if self.gateway else None
+        if callable(attach_oracle):
+            attach_oracle(self.oracle)
+        facts = getattr(self.gateway, "runtime_facts", None) if self.gateway else None
+        self.metadata_provider = MetadataProvider(
+            self.agent_id, facts=facts if isinstance(facts, RuntimeFacts) else None
+        )
         
         config = AnamnesisConfig()
         metadata = self.metadata_provider.collect()
-        self.context_factory = ContextFactory(config, metadata)
+        estimator = getattr(self.oracle, "estimator", None)
+        self.context_factory = ContextFactory(
+            config, metadata, estimator=estimator if isinstance(estimator, TokenEstimator) else None
+        )
         
         if not self.history:
             self.history.append({
                 "role": "system",
                 "content": "You are an MSC Agent. Follow the instructions carefully."
             })
-        print(f"[Session] Agent {self.agent_id} started.")
+        self._emit_status()
 
     async def stop(self) -> None:
         """停止 Session"""
         self.status = SessionStatus.IDLE
-        print(f"[Session] Agent {self.agent_id} stopped.")
+        if self._owns_rules_cache and self.rules_cache is not None:
+            self.rules_cache.close()
+            self.rules_cache = None
+            self._owns_rules_cache = False
+        self._emit_status()
+
+    def _emit(self, event: BridgeEvent) -> None:
+        """经网关的事件总线发布，非阻塞；界面再慢也不会拖住代理循环"""
+        emit = getattr(self.gateway, "emit", None) if self.gateway else None
+        if callable(emit):
+            emit(event)
+
+    def _log(self, content: str, level: str = "info") -> None:
+        self._emit(LogEvent(agent_id=self.agent_id, content=content, type=level))
+
+    def _emit_status(self) -> None:
+        active_agents = getattr(self.gateway, "active_agents", None) if self.gateway else None
+        agents = active_agents() if callable(active_agents) else []
+        self._emit(SessionUpdateEvent(
+            agent_id=self.agent_id,
+            status=self.status.value,
+            active_agents=agents if isinstance(agents, list) else []
+        ))
+
+    async def _relay_stream(self, chunks: Any) -> Any:
+        """边接收边将文本增量推送至 Bridge，使界面在长补全结束前即可响应"""
+        async for chunk in chunks:
+            if isinstance(chunk, StreamChunk) and chunk.type == "text":
+                self._log(chunk.text, "delta")
+            yield chunk
+
+    @staticmethod
+    def _validate_turn(text: str, tool_calls: list[Any]) -> str | None:
+        """级联路由的响应校验：必须包含可解析且参数合法的工具调用"""
+        try:
+            calls = [c if isinstance(c, ToolCall) else ToolCall(**c) for c in tool_calls] or ToolParser.parse(text)
+        except ValidationError:
+            return "invalid_args"
+        if not calls:
+            return "no_tool_call"
+        for call in calls:
+            if ToolDispatcher.validate_call(call.name, call.parameters) is not None:
+                return "invalid_args"
+        return None
+
+    def _tool_context(self) -> ToolContext:
+        return ToolContext(
+            agent_id=self.agent_id,
+            workspace_root=self.workspace_root,
+            oracle=self.oracle,
+            gateway=self.gateway,
+            allowed_paths=[self.workspace_root]
+        )
+
+    async def _execute_tools(self, tool_calls: list[ToolCall]) -> list[str]:
+        """按冲突分析切分批次，批内调用在信号量限制下并发执行；结果保持原始顺序"""
+        context = self._tool_context()
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel_tools))
+
+        async def run(call: ToolCall) -> str:
+            async with semaphore:
+                self._log(f"Executing tool: {call.name}")
+                return await ToolDispatcher.dispatch(context, call.name, call.parameters)
+
+        results: list[str] = []
+        for batch in ToolDispatcher.plan(context, [(call.name, call.parameters) for call in tool_calls]):
+            results.extend(await asyncio.gather(*(run(tool_calls[i]) for i in batch)))
+        return results
+
+    def _persist_source(self) -> tuple[SessionMetadata, list[dict[str, Any]]]:
+        assert self.metadata_provider is not None
+        return self.metadata_provider.collect(), self.history
+
+    @staticmethod
+    def _compute_gas(usage: dict[str, Any], pricing: dict[str, float]) -> float:
+        # 缓存命中或与并发相同请求合并时未产生上游调用，不计费
+        if usage.get("cached") or usage.get("coalesced"):
+            return 0.0
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        input_price = pricing.get("input_1m", 0)
+        # 缓存写入/读取单独计价，缺省按 Anthropic 的 1.25x / 0.1x 输入价格折算
+        cache_write_tokens = usage.get("cache_creation_input_tokens", 0) or 0
+        cache_read_tokens = usage.get("cache_read_input_tokens", 0) or 0
+        cache_write_price = pricing.get("cache_write_1m", input_price * 1.25)
+        cache_read_price = pricing.get("cache_read_1m", input_price * 0.1)
+        return float(
+            input_tokens * input_price
+            + output_tokens * pricing.get("output_1m", 0)
+            + cache_write_tokens * cache_write_price
+            + cache_read_tokens * cache_read_price
+        ) / 1_000_000
+
+    def _is_running(self) -> bool:
+        # 方法调用使类型检查器不会把 await 之后的状态判断当作已收窄
+        return self.status == SessionStatus.RUNNING
+
+    @contextlib.asynccontextmanager
+    async def _turn_slot(self) -> AsyncIterator[TurnSlot]:
+        """每一轮须先从网关调度器取得槽位，受全局与父代理并发上限约束；退出时归还"""
+        scheduler = getattr(self.gateway, "scheduler", None) if self.gateway else None
+        slot = TurnSlot(scheduler if isinstance(scheduler, AgentScheduler) else None, self.agent_id)
+        await slot.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    async def _call_oracle(
+        self, target_model: str, messages: list[dict[str, Any]], budget: float | None, tools: list[dict[str, Any]] | None
+    ) -> tuple[str, list[Any], dict[str, Any], Any]:
+        """流式模式下边接收边向 Bridge 推送增量，否则在完整响应后推送一次"""
+        if self.stream:
+            return await collect_stream(
+                self._relay_stream(self.oracle.generate_stream(
+                    model_name=target_model,
+                    prompt=messages,
+                    require_caps=[],
+                    budget=budget,
+                    tools=tools,
+                    validate=self._validate_turn
+                ))
+            )
+        response_text, tool_calls, usage, provider = await self.oracle.generate(
+            model_name=target_model,
+            prompt=messages, # 直接传递消息列表
+            require_caps=[],
+            budget=budget,
+            tools=tools,
+            validate=self._validate_turn
+        )
+        self._log(response_text, "response")
+        return response_text, tool_calls, usage, provider
+
+    def _inject_protocol_guidance(self) -> None:
+        guide_msg = (
+            "Notice: You did not provide any tool calls. To maintain operational integrity, "
+            "every turn must include an action. If you are waiting for a subagent or external event, "
+            "you should either:\n"
+            "1. Use 'ask_agent' with agent_id='human' to report your status and suspend the session.\n"
+            "2. Use 'execute' with a wait command (e.g., 'timeout /t 30' or 'Start-Sleep -s 30') to poll later.\n"
+            "Please choose an appropriate tool to proceed."
+        )
+        self._log("No tool calls. Injecting protocol guidance.", "debug")
+        self.history.append({"role": "user", "content": guide_msg})
+
+    async def _request_turn(
+        self, target_model: str, messages: list[dict[str, Any]], budget: float | None, tools: list[dict[str, Any]] | None
+    ) -> tuple[str, list[ToolCall]]:
+        """发起一轮 Oracle 请求并计入 Gas，返回 (响应文本, 原生工具调用)"""
+        assert self.metadata_provider is not None
+        self._log(f"Oracle request ({target_model}).", "debug")
+
+        response_text, tool_calls, usage, provider = await self._call_oracle(target_model, messages, budget, tools)
+        gas_cost = self._compute_gas(usage, provider.pricing)
+        # 对冲模式下被取消或落败的请求、级联中被拒绝的低级响应同样计费
+        for loser in usage.get("hedge_losers", []) + usage.get("cascade_rejected", []):
+            gas_cost += self._compute_gas(loser, loser.get("pricing", {}))
+        self.metadata_provider.gas_used += gas_cost
+        self._log(f"Gas used: {self.metadata_provider.gas_used:.4f}", "debug")
+        # 适配器返回的原生工具调用为 dict，统一为 ToolCall
+        return response_text, [c if isinstance(c, ToolCall) else ToolCall(**c) for c in tool_calls]
+
+    def _assemble_turn(
+        self, user_input: str
+    ) -> tuple[str, list[dict[str, Any]], float | None, list[dict[str, Any]] | None]:
+        """组装一轮请求，返回 (目标模型, 消息列表, 剩余 Gas 预算, 原生工具声明)"""
+        assert self.rules_cache is not None and self.metadata_provider is not None and self.context_factory is not None
+        rules = self.rules_cache.get()
+        metadata = self.metadata_provider.collect()
+        self.context_factory.metadata = metadata
+        target_model = metadata.model_name or "gemini-2.5-flash-lite"
+        # 按候选 Provider 的上下文窗口裁剪历史
+        context_budget = getattr(self.oracle, "context_budget", None)
+        token_budget = context_budget(target_model) if callable(context_budget) else None
+        # 候选 Provider 均支持原生工具调用时，以 tools 参数传递工具声明并省略文本示例
+        supports_native_tools = getattr(self.oracle, "supports_native_tools", None)
+        native_tools = callable(supports_native_tools) and supports_native_tools(target_model) is True
+        tools = ToolDispatcher.get_tool_schemas(self._tool_context(), self.available_tools) if native_tools else None
+        
+        # 使用 ContextFactory 组装消息列表
+        messages = self.context_factory.assemble(
+            task_instruction=user_input or "Continue your task.",
+            mode_instruction=(
+                "You are an MSC Agent. Follow the Thought-Action-Observation-Reflection rhythm.\n"
+                "1. Thought: Analyze the current state and plan the next step.\n"
+                "2. Action: Call a tool if necessary.\n"
+                "3. Observation: Review the tool output (provided in history).\n"
+                "4. Reflection: Assess if the goal is met. If yes, use 'complete_task' to finish."
+            ),
+            notebook_hot_memory="",
+            project_specific_rules=rules.rendered,
+            trace_history=self.history[1:],
+            rag_cards=[],
+            token_budget=token_budget if isinstance(token_budget, int) else None,
+            native_tools=native_tools
+        )
+        
+        # gas_limit 为 0 表示不限额；否则在发起请求前按剩余预算约束路由
+        budget = (
+            max(0.0, metadata.gas_limit - metadata.gas_used) if metadata.gas_limit > 0 else None
+        )
+        return target_model, messages, budget, tools
+
+    def _record_response(self, response_text: str, tool_calls: list[ToolCall]) -> list[ToolCall]:
+        """将响应写入历史，返回本轮要执行的工具调用 (无原生调用时从文本解析)"""
+        assistant_msg: dict[str, Any] = {"role": "assistant", "content": response_text}
+        if tool_calls:
+            # 记录原生工具调用，使后续轮次可按 Provider 原生格式回传 tool result
+            assistant_msg["tool_calls"] = [call.model_dump() for call in tool_calls]
+        self.history.append(assistant_msg)
+        if tool_calls:
+            return tool_calls
+        parsed = ToolParser.parse(response_text)
+        if parsed:
+            self._log(f"Using parsed tool calls: {[call.name for call in parsed]}", "debug")
+        return parsed
+
+    async def _run_tools(self, tool_calls: list[ToolCall]) -> None:
+        for call, result in zip(tool_calls, await self._execute_tools(tool_calls), strict=True):
+            if call.name == "complete_task":
+                self.status = SessionStatus.COMPLETED
+
+            self.history.append({
+                "role": "tool",
+                "content": result,
+                "tool_call_id": call.id
+            })
 
     async def run_loop(self, user_input: str) -> None:
         if self.status != SessionStatus.RUNNING:
             self.status = SessionStatus.RUNNING
             
-        if user_input and not any(m.get("content") == user_input for m in self.history):
+        if user_input and not self.history.has_content(user_input):
             self.history.append({"role": "user", "content": user_input})
             
-        last_processed_idx = len(self.history) - 1
+        last_processed_seq = self.history.last_seq
         
         while self.status == SessionStatus.RUNNING:
-            if len(self.history) - 1 > last_processed_idx:
-                print(f"[Session {self.agent_id}] New messages detected in history. Processing...")
-                last_processed_idx = len(self.history) - 1
+            if self.history.last_seq > last_processed_seq:
+                self._log("New messages detected in history.", "debug")
+                last_processed_seq = self.history.last_seq
 
-            if self.rules_discoverer is None or self.metadata_provider is None or self.context_factory is None:
+            if self.rules_cache is None or self.metadata_provider is None or self.context_factory is None:
                 break
 
-            rules = self.rules_discoverer.scan()
-            metadata = self.metadata_provider.collect()
-            self.context_factory.metadata = metadata
-            
-            # 使用 ContextFactory 组装消息列表
-            messages = self.context_factory.assemble(
-                task_instruction=user_input or "Continue your task.",
-                mode_instruction=(
-                    "You are an MSC Agent. Follow the Thought-Action-Observation-Reflection rhythm.\n"
-                    "1. Thought: Analyze the current state and plan the next step.\n"
-                    "2. Action: Call a tool if necessary.\n"
-                    "3. Observation: Review the tool output (provided in history).\n"
-                    "4. Reflection: Assess if the goal is met. If yes, use 'complete_task' to finish."
-                ),
-                notebook_hot_memory="",
-                project_specific_rules=rules,
-                trace_history=self.history[1:],
-                rag_cards=[]
-            )
-            
-            try:
-                target_model = metadata.model_name or "gemini-2.5-flash-lite"
-                print(f"\n[DEBUG] Oracle Request ({target_model}) - System Prompt Compressed.")
-                
-                response_text, tool_calls, usage, provider = await self.oracle.generate(
-                    model_name=target_model,
-                    prompt=messages, # 直接传递消息列表
-                    require_caps=[]
-                )
-                
-                print(f"\n[DEBUG] Oracle Raw Response ({self.agent_id}):\n{response_text}")
-
-                input_tokens = usage.get("input_tokens", 0)
-                output_tokens = usage.get("output_tokens", 0)
-                pricing = provider.pricing
-                gas_cost = (input_tokens * pricing.get("input_1m", 0) + output_tokens * pricing.get("output_1m", 0)) / 1_000_000
-                self.metadata_provider.gas_used += gas_cost
-                print(f"[Session] Gas Used: {self.metadata_provider.gas_used:.4f}")
-
-                self.history.append({"role": "assistant", "content": response_text})
-                last_processed_idx = len(self.history) - 1
-
-                if not tool_calls:
-                    tool_calls = ToolParser.parse(response_text)
-                    if tool_calls:
-                        print(f"[DEBUG] Using Parsed Tool Calls: {tool_calls}")
-
-                for call in tool_calls:
-                    print(f"[Session] Executing tool: {call.name}...")
-                    tool_context = ToolContext(
-                        agent_id=self.agent_id,
-                        workspace_root=self.workspace_root,
-                        oracle=self.oracle,
-                        gateway=self.gateway,
-                        allowed_paths=[self.workspace_root]
-                    )
-
-                    result = await ToolDispatcher.dispatch(tool_context, call.name, call.parameters)
-                    
-                    if call.name == "complete_task":
-                        self.status = SessionStatus.COMPLETED
-
-                    self.history.append({
-                        "role": "tool",
-                        "content": result,
-                        "tool_call_id": call.id
-                    })
-                    last_processed_idx = len(self.history) - 1
-
-                # 每次工具执行后尝试持久化
-                if self.gateway and self.gateway.session_manager:
-                    self.gateway.session_manager.save_session(
-                        self.session_id, self.metadata_provider.collect(), self.history
-                    )
-
-                if self.status == SessionStatus.COMPLETED:
+            target_model, messages, budget, tools = self._assemble_turn(user_input)
+
+            async with self._turn_slot() as slot:
+                if not self._is_running():
                     break
-                
-                # 协议引导：若无工具调用，引导 Agent 进入合法的挂起或等待状态
-                if not tool_calls:
-                    guide_msg = (
-                        "Notice: You did not provide any tool calls. To maintain operational integrity, "
-                        "every turn must include an action. If you are waiting for a subagent or external event, "
-                        "you should either:\n"
-                        "1. Use 'ask_agent' with agent_id='human' to report your status and suspend the session.\n"
-                        "2. Use 'execute' with a wait command (e.g., 'timeout /t 30' or 'Start-Sleep -s 30') to poll later.\n"
-                        "Please choose an appropriate tool to proceed."
-                    )
-                    print(f"[Session {self.agent_id}] No tool calls. Injecting protocol guidance.")
-                    self.history.append({"role": "user", "content": guide_msg})
-                    continue
-
-            except Exception as e:
-                print(f"[Session] Error in run_loop: {e}")
-                self.history.append({"role": "system", "content": f"Error: {str(e)}"})
-                break
+                try:
+                    response_text, tool_calls = await self._request_turn(target_model, messages, budget, tools)
+
+                    if not self._is_running():
+                        # 请求期间被 msc/abort 终止
+                        break
+
+                    tool_calls = self._record_response(response_text, tool_calls)
+                    # 槽位只覆盖 Oracle 请求；工具执行 (可能等待子代理或审批) 期间归还，下一轮重新获取
+                    slot.release()
+                    await self._run_tools(tool_calls)
+                    last_processed_seq = self.history.last_seq
+
+                    # 每次工具执行后登记持久化，由网关的后台写入服务合并写入
+                    if self.gateway and self.gateway.persistence:
+                        self.gateway.persistence.mark_dirty(self.session_id, self.agent_id, self._persist_source)
+
+                    if not self._is_running():
+                        # complete_task 已结束任务，或工具执行期间被终止
+                        break
+
+                    # 协议引导：若无工具调用，引导 Agent 进入合法的挂起或等待状态
+                    if not tool_calls:
+                        self._inject_protocol_guidance()
+
+                except Exception as e:
+                    self._log(f"Error in run_loop: {e}", "error")
+                    self.history.append({"role": "system", "content": f"Error: {str(e)}"})
+                    break
+
+        self._emit_status()
 
 class OrchestrationGateway:
-    def __init__(self, bridge: Any):
+    def __init__(self, bridge: Any, storage_root: str = "test_storage"):
         self.bridge = bridge
         self.agent_registry: dict[str, Session] = {}
-        self.storage_root = "test_storage"
+        self.storage_root = storage_root
         self.session_manager = SessionManager(self.storage_root)
+        self.persistence = PersistenceService(self.session_manager, on_error=self._persistence_failed)
+        self.rules_caches: dict[str, RulesCache] = {}
+        # 运行环境事实 (活跃终端等) 由所有 Session 共享，按 TTL 刷新
+        self.runtime_facts = RuntimeFacts()
+        # 下行事件总线：Bridge 作为一个有界队列的订阅者，由独立任务转发
+        self.bus = EventBus()
+        self.bridge_queue_size = 256
+        self._bridge_subscription: Subscription | None = None
+        self._forwarder: asyncio.Task[None] | None = None
+        # 所有代理循环经调度器启动，限制同时进行的轮次并保留任务句柄
+        self.scheduler = AgentScheduler()
+        # 为 False 时权限请求挂起，直至界面回复 msc/approve
+        self.auto_approve = True
+        self._approvals: dict[str, tuple[str, asyncio.Future[bool]]] = {}
+        # Session 使用的 Oracle，shutdown 时关闭并写出健康统计
+        self._oracles: list[Oracle] = []
+
+    async def shutdown(self) -> None:
+        """关闭网关持有的共享资源 (如 Provider 共享连接池)，并写出尚未落盘的会话"""
+        await self.scheduler.cancel_all()
+        await self.flush_events()
+        if self._forwarder is not None:
+            self._forwarder.cancel()
+            self._forwarder = None
+        for oracle in self._oracles:
+            await oracle.aclose()
+        await close_transport()
+        await self.persistence.close()
+        for cache in self.rules_caches.values():
+            cache.close()
+
+    def rules_for(self, workspace_root: str) -> RulesCache:
+        key = os.path.normcase(os.path.abspath(workspace_root))
+        cache = self.rules_caches.get(key)
+        if cache is None:
+            cache = self.rules_caches[key] = RulesCache(workspace_root)
+        return cache
+
+    def attach_oracle(self, oracle: Any) -> None:
+        """登记 Session 使用的 Oracle；未配置健康统计存储的写到 storage_root 下，以便重启后热启动"""
+        if not isinstance(oracle, Oracle) or any(known is oracle for known in self._oracles):
+            return
+        self._oracles.append(oracle)
+        if oracle.health.storage_path is None:
+            oracle.health.persist_to(os.path.join(self.storage_root, "oracle_stats.json"))
+
+    def _persistence_failed(self, session_id: str, agent_id: str, error: Exception) -> None:
+        self.emit(LogEvent(agent_id=agent_id, content=f"Failed to save session {session_id}: {error}", type="error"))
+
+    def active_agents(self) -> list[str]:
+        return [agent_id for agent_id, s in self.agent_registry.items() if s.status == SessionStatus.RUNNING]
+
+    def emit(self, event: BridgeEvent) -> None:
+        self._ensure_forwarder()
+        self.bus.publish(event)
+
+    def _ensure_forwarder(self) -> None:
+        if self.bridge is None or (self._forwarder is not None and not self._forwarder.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._bridge_subscription is None:
+            self._bridge_subscription = self.bus.subscribe(maxsize=self.bridge_queue_size)
+        self._forwarder = loop.create_task(self._forward_to_bridge(self._bridge_subscription))
+
+    async def _forward_to_bridge(self, subscription: Subscription) -> None:
+        while True:
+            event = await subscription.get()
+            try:
+                await self.bridge.send_message(event.to_message())
+            except Exception:
+                # 界面断开等错误不影响代理循环
+                pass
+            finally:
+                subscription.task_done()
+
+    async def flush_events(self) -> None:
+        """等待已发布的事件全部送达 Bridge"""
+        if self._bridge_subscription is not None and self._forwarder is not None:
+            await self._bridge_subscription.join()
 
     async def request_permission(self, agent_id: str, action: str, params: dict[str, Any]) -> bool:
-        print(f"\n[HIL] Agent {agent_id} requests {action} with {params}")
-        return True
+        if self.auto_approve:
+            # 自动批准时只记录日志，不向界面发出需要回复 (且不可丢弃) 的审批请求
+            self.emit(LogEvent(agent_id=agent_id, content=f"Auto-approved {action} with {params}", type="debug"))
+            return True
+        request_id = uuid.uuid4().hex
+        self.emit(ApprovalRequiredEvent(request_id=request_id, agent_id=agent_id, action=action, data=params))
+        future: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        self._approvals[request_id] = (agent_id, future)
+        try:
+            return await future
+        finally:
+            self._approvals.pop(request_id, None)
 
-    async def handle_bridge_message(self, message: dict[str, Any]):
+    async def handle_bridge_message(self, message: dict[str, Any]) -> None:
         method = message.get("method")
         params = message.get("params", {})
 
+        if method == "msc/approve":
+            pending = self._approvals.get(params.get("request_id", ""))
+            if pending is not None and not pending[1].done():
+                pending[1].set_result(bool(params.get("approved", False)))
+            return
+
+        if method == "msc/abort":
+            agent_id = params.get("agent_id")
+            targets = [agent_id] if agent_id else list(self.agent_registry)
+            for target in targets:
+                session = self.agent_registry.get(target)
+                if session is not None and session.status in (SessionStatus.RUNNING, SessionStatus.AWAITING_APPROVAL):
+                    session.status = SessionStatus.FAILED
+                    session._emit_status()
+                self.scheduler.cancel(target)
+            # 被终止代理的待审批请求一律拒绝
+            for owner, future in list(self._approvals.values()):
+                if owner in targets and not future.done():
+                    future.set_result(False)
+            return
+
         if method == "msc/chat":
             agent_id = params.get("agent_id", "main-agent")
             user_input = params.get("content", "")
@@ -196,6 +519,6 @@ class OrchestrationGateway:
             session = self.agent_registry.get(agent_id)
             if session:
                 if session.status == SessionStatus.IDLE:
-                    asyncio.create_task(session.run_loop(user_input))
+                    self.scheduler.spawn(agent_id, session.run_loop(user_input))
                 else:
                     session.history.append({"role": "user", "content": user_input})
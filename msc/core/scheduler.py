@@ -0,0 +1,214 @@
+import asyncio
+import functools
+import itertools
+from collections.abc import Coroutine
+from enum import IntEnum
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict
+
+
+class AgentPriority(IntEnum):
+    """数值越小越先获得执行槽位"""
+    MAIN = 0
+    HIGH = 1
+    BACKGROUND = 2
+
+
+class AgentHandle(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    agent_id: str
+    parent: str | None = None
+    task: asyncio.Task[Any]
+    # queued: 任务尚未开始；running: 循环执行中 (可能正在等待槽位)
+    state: str = "queued"
+    turns: int = 0
+
+
+class _Waiter:
+    __slots__ = ("agent_id", "order", "future")
+
+    def __init__(self, agent_id: str, order: int, future: asyncio.Future[None]):
+        self.agent_id = agent_id
+        self.order = order
+        self.future = future
+
+
+class AgentScheduler:
+    def __init__(self, max_concurrent: int = 4, max_per_parent: int = 2):
+        """
+        网关级的代理调度器：Session.run_loop 的每一轮 Oracle 请求须先取得槽位 (工具执行期间归还)。
+        全局最多 max_concurrent 个轮次同时进行，同一父代理的子代理最多占用 max_per_parent 个；
+        等待者按优先级 (主代理 > 高优先级 ask_agent > 后台子代理) 与到达顺序放行。
+        """
+        self.max_concurrent = max_concurrent
+        self.max_per_parent = max_per_parent
+        self.handles: dict[str, AgentHandle] = {}
+        self._parents: dict[str, str] = {}
+        self._priorities: dict[str, AgentPriority] = {}
+        self._waiters: list[_Waiter] = []
+        self._order = itertools.count()
+        self._active: dict[str, int] = {}
+        self._active_per_parent: dict[str, int] = {}
+
+    def priority_of(self, agent_id: str) -> AgentPriority:
+        if agent_id in self._priorities:
+            return self._priorities[agent_id]
+        return AgentPriority.MAIN if agent_id == "main-agent" else AgentPriority.BACKGROUND
+
+    def parent_of(self, agent_id: str) -> str | None:
+        return self._parents.get(agent_id)
+
+    def set_parent(self, agent_id: str, parent: str | None) -> None:
+        if parent:
+            self._parents[agent_id] = parent
+
+    def prioritize(self, agent_id: str, priority: AgentPriority) -> None:
+        """提升 (不降低) 代理在当前循环内的优先级；循环结束后恢复默认"""
+        if priority < self.priority_of(agent_id):
+            self._priorities[agent_id] = priority
+            self._admit()
+
+    # --- 循环句柄 ---
+
+    def spawn(
+        self,
+        agent_id: str,
+        coro: Coroutine[Any, Any, Any],
+        priority: AgentPriority | None = None,
+        parent: str | None = None,
+    ) -> asyncio.Task[Any]:
+        """
+        以受跟踪的任务启动代理循环。若该代理已有尚未开始的循环，则复用它：
+        它开始时自然会处理新追加的消息。
+        """
+        self.set_parent(agent_id, parent)
+        if priority is not None:
+            self.prioritize(agent_id, priority)
+        handle = self.handles.get(agent_id)
+        if handle is not None and handle.state == "queued" and not handle.task.done():
+            coro.close()
+            return handle.task
+
+        handle = AgentHandle(agent_id=agent_id, parent=self.parent_of(agent_id), task=asyncio.get_running_loop().create_task(self._run(agent_id, coro)))
+        self.handles[agent_id] = handle
+        handle.task.add_done_callback(functools.partial(self._finished, handle))
+        return handle.task
+
+    async def _run(self, agent_id: str, coro: Coroutine[Any, Any, Any]) -> Any:
+        # 任务开始前句柄已登记 (create_task 与登记之间没有让出点)
+        handle = self.handles.get(agent_id)
+        if handle is not None:
+            handle.state = "running"
+        return await coro
+
+    def _finished(self, handle: AgentHandle, _task: asyncio.Task[Any]) -> None:
+        if self.handles.get(handle.agent_id) is handle:
+            del self.handles[handle.agent_id]
+            self._priorities.pop(handle.agent_id, None)
+
+    def cancel(self, agent_id: str) -> bool:
+        handle = self.handles.get(agent_id)
+        if handle is None or handle.task.done():
+            return False
+        handle.task.cancel()
+        return True
+
+    async def cancel_all(self) -> None:
+        tasks = [h.task for h in self.handles.values() if not h.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # --- 轮次槽位 ---
+
+    async def acquire(self, agent_id: str) -> None:
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._waiters.append(_Waiter(agent_id, next(self._order), future))
+        self._admit()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已获得槽位但随即被取消，归还槽位
+                self.release(agent_id)
+            else:
+                self._waiters = [w for w in self._waiters if w.future is not future]
+            raise
+        handle = self.handles.get(agent_id)
+        if handle is not None:
+            handle.turns += 1
+
+    def release(self, agent_id: str) -> None:
+        count = self._active.get(agent_id, 0) - 1
+        if count > 0:
+            self._active[agent_id] = count
+        else:
+            self._active.pop(agent_id, None)
+        parent = self.parent_of(agent_id)
+        if parent is not None:
+            self._active_per_parent[parent] = max(0, self._active_per_parent.get(parent, 0) - 1)
+        self._admit()
+
+    def _admit(self) -> None:
+        while self._waiters and sum(self._active.values()) < self.max_concurrent:
+            eligible = [
+                w for w in self._waiters
+                if self.parent_of(w.agent_id) is None
+                or self._active_per_parent.get(self.parent_of(w.agent_id) or "", 0) < self.max_per_parent
+            ]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (self.priority_of(w.agent_id), w.order))
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                continue
+            self._active[waiter.agent_id] = self._active.get(waiter.agent_id, 0) + 1
+            parent = self.parent_of(waiter.agent_id)
+            if parent is not None:
+                self._active_per_parent[parent] = self._active_per_parent.get(parent, 0) + 1
+            waiter.future.set_result(None)
+
+    # --- 观测 ---
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        waiting = {w.agent_id for w in self._waiters}
+        return [
+            {
+                "agent_id": h.agent_id,
+                "parent": h.parent,
+                "priority": self.priority_of(h.agent_id).name.lower(),
+                "state": "waiting" if h.agent_id in waiting else ("active" if h.agent_id in self._active else h.state),
+                "turns": h.turns,
+            }
+            for h in self.handles.values()
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "active_turns": sum(self._active.values()),
+            "waiting_turns": len(self._waiters),
+            "loops": len(self.handles),
+            "max_concurrent": self.max_concurrent,
+            "max_per_parent": self.max_per_parent,
+        }
+
+
+class TurnSlot:
+    """一轮的调度槽位：无调度器时为空操作；release 可在轮次结束前提前调用，重复调用无副作用"""
+
+    def __init__(self, scheduler: AgentScheduler | None, agent_id: str) -> None:
+        self.scheduler = scheduler
+        self.agent_id = agent_id
+        self.held = False
+
+    async def acquire(self) -> None:
+        if self.scheduler is not None:
+            await self.scheduler.acquire(self.agent_id)
+            self.held = True
+
+    def release(self) -> None:
+        if self.held and self.scheduler is not None:
+            self.scheduler.release(self.agent_id)
+            self.held = False
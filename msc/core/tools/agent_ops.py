@@ -1,4 +1,3 @@
-import asyncio
 import json
 import os
 import uuid
@@ -6,7 +5,8 @@ from typing import Any
 
 from pydantic import BaseModel, Field
 
-from msc.core.tools.base import BaseTool
+from msc.core.bridge import LogEvent
+from msc.core.tools.base import BaseTool, ToolAccess
 from msc.core.tools.system_ops import get_sandbox_provider
 
 
@@ -45,9 +45,11 @@ class CreateAgentTool(BaseTool):
             )
             # Register and start the sub-agent session
             self.context.gateway.agent_registry[agent_id] = sub_session
-            asyncio.create_task(sub_session.start())
-            # Start the cognitive loop for the sub-agent
-            asyncio.create_task(sub_session.run_loop(task_description))
+            await sub_session.start()
+            # Start the cognitive loop for the sub-agent as a background child of the caller
+            self.context.gateway.scheduler.spawn(
+                agent_id, sub_session.run_loop(task_description), parent=self.context.agent_id
+            )
 
         # 2. Prepare Sandbox Execution (Simulation of process-level isolation)
         # We use the sandbox provider to wrap a hypothetical 'msc-agent' command
@@ -67,7 +69,13 @@ class CreateAgentTool(BaseTool):
                 final_allowed.append(path)
             else:
                 # Log security violation attempt but continue with restricted set
-                print(f"MSC.SecurityViolation: Sub-agent requested unauthorized path '{path}'. Denied.")
+                emit = getattr(self.context.gateway, "emit", None)
+                if callable(emit):
+                    emit(LogEvent(
+                        agent_id=self.context.agent_id,
+                        content=f"MSC.SecurityViolation: Sub-agent requested unauthorized path '{path}'. Denied.",
+                        type="error"
+                    ))
 
         allowed_paths = list(set(final_allowed))
         blocked_paths = self.context.blocked_paths
@@ -117,10 +125,15 @@ class AskAgentTool(BaseTool):
                 "content": f"Message from {self.context.agent_id}: {message}"
             })
             
+            # 高优先级消息使目标代理在当前循环内优先获得调度槽位
+            from msc.core.scheduler import AgentPriority
+            if priority == "high":
+                self.context.gateway.scheduler.prioritize(agent_id, AgentPriority.HIGH)
+
             # 协议实现：若目标是 main-agent 且处于 IDLE，尝试唤醒它以处理异步结果
             from msc.core.og import SessionStatus
             if agent_id == "main-agent" and target_session.status == SessionStatus.IDLE:
-                asyncio.create_task(target_session.run_loop(""))
+                self.context.gateway.scheduler.spawn(agent_id, target_session.run_loop(""))
 
             return f"Message delivered to {agent_id}."
         
@@ -135,6 +148,10 @@ class CompleteTaskTool(BaseTool):
     description = "Explicitly complete the task and report result to parent agent."
     args_schema = CompleteTaskArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:  # noqa: ARG002
+        # 任务完成须在本轮其余调用之后报告
+        return ToolAccess(exclusive=True)
+
     async def execute(self, **kwargs: Any) -> str:
         from msc.core.og import SessionStatus
         summary: str = kwargs.get("summary", "")
@@ -157,6 +174,6 @@ class CompleteTaskTool(BaseTool):
                 })
                 # Wake up the main agent if it's waiting
                 if main_session.status == SessionStatus.IDLE:
-                    asyncio.create_task(main_session.run_loop(""))
+                    self.context.gateway.scheduler.spawn("main-agent", main_session.run_loop(""))
         
         return f"Task completed. Summary: {summary}"
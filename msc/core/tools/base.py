@@ -1,3 +1,4 @@
+import os
 from abc import ABC, abstractmethod
 from typing import Any
 
@@ -14,6 +15,13 @@ class ToolContext(BaseModel):
     allowed_paths: list[str] = Field(default_factory=list)
     blocked_paths: list[str] = Field(default_factory=list)
 
+class ToolAccess(BaseModel):
+    """工具调用访问的资源声明，用于同一轮内工具调用的冲突分析"""
+    reads: set[str] = Field(default_factory=set)
+    writes: set[str] = Field(default_factory=set)
+    # 独占：等待此前的调用全部完成，其后的调用也在其完成后才开始
+    exclusive: bool = False
+
 class BaseTool(ABC):
     name: str
     description: str
@@ -22,6 +30,13 @@ class BaseTool(ABC):
     def __init__(self, context: ToolContext):
         self.context = context
 
+    def resolve_path(self, path: str) -> str:
+        return os.path.normpath(os.path.abspath(os.path.join(self.context.workspace_root, path)))
+
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:  # noqa: ARG002
+        """声明本次调用读写的资源；默认不与任何调用冲突"""
+        return ToolAccess()
+
     @abstractmethod
     async def execute(self, **kwargs: Any) -> Any:
         pass
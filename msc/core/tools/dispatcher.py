@@ -1,6 +1,8 @@
 import json
+import os
 from typing import Any, Type
-from msc.core.tools.base import BaseTool, ToolContext
+from pydantic import ValidationError
+from msc.core.tools.base import BaseTool, ToolAccess, ToolContext
 from msc.core.tools.agent_ops import CreateAgentTool, AskAgentTool, CompleteTaskTool
 from msc.core.tools.system_ops import ExecuteTool
 from msc.core.tools.file_ops import WriteFileTool, ApplyDiffTool, ListFilesTool
@@ -34,6 +36,73 @@ class ToolDispatcher:
         except Exception as e:
             return f"Error executing tool {name}: {str(e)}"
 
+    @classmethod
+    def validate_call(cls, name: str, parameters: Any) -> str | None:
+        """在执行前校验工具名与参数 (args_schema)，返回错误描述；合法时返回 None"""
+        tool_cls = cls._registry.get(name)
+        if not tool_cls:
+            return f"Tool {name} not found."
+        if not isinstance(parameters, dict):
+            return f"Parameters of {name} must be an object."
+        try:
+            tool_cls.args_schema.model_validate(parameters)
+        except ValidationError as e:
+            return str(e)
+        return None
+
+    @classmethod
+    def access(cls, context: ToolContext, name: str, parameters: Any) -> ToolAccess:
+        tool_cls = cls._registry.get(name)
+        if not tool_cls or not isinstance(parameters, dict):
+            return ToolAccess()
+        try:
+            return tool_cls(context).access(parameters)
+        except (KeyError, TypeError, ValueError):
+            # 参数不完整时无法判断访问范围，保守地独占执行
+            return ToolAccess(exclusive=True)
+
+    @classmethod
+    def plan(cls, context: ToolContext, calls: list[tuple[str, Any]]) -> list[list[int]]:
+        """
+        将同一轮的工具调用按原始顺序切分为连续的批次：批内调用互不冲突，可并发执行。
+        冲突包括写入同一路径 (或其父目录被读取，如 execute 读取整个工作区)、独占调用 (complete_task、serial 的 execute)。
+        """
+        batches: list[list[int]] = []
+        reads: set[str] = set()
+        writes: set[str] = set()
+        exclusive = False
+        for i, (name, parameters) in enumerate(calls):
+            access = cls.access(context, name, parameters)
+            conflict = (
+                access.exclusive
+                or exclusive
+                or _overlaps(access.writes, reads | writes)
+                or _overlaps(access.reads, writes)
+            )
+            if not batches or conflict:
+                batches.append([])
+                reads, writes = set(), set()
+            batches[-1].append(i)
+            reads |= access.reads
+            writes |= access.writes
+            exclusive = access.exclusive
+        return batches
+
     @classmethod
     def get_available_tools(cls) -> list[str]:
         return list(cls._registry.keys())
+
+    @classmethod
+    def get_tool_schemas(cls, context: ToolContext, names: list[str] | None = None) -> list[dict[str, Any]]:
+        """返回工具的原生声明 (BaseTool.get_schema)，供 Provider 以 tools 参数接收"""
+        schemas = []
+        for name in names if names is not None else cls.get_available_tools():
+            tool_cls = cls._registry.get(name)
+            if tool_cls is not None:
+                schemas.append(tool_cls(context).get_schema())
+        return schemas
+
+
+def _overlaps(a: set[str], b: set[str]) -> bool:
+    """资源相同或互为父子路径即视为冲突"""
+    return any(x == y or x.startswith(y + os.sep) or y.startswith(x + os.sep) for x in a for y in b)
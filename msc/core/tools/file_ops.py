@@ -1,7 +1,7 @@
 import os
 from typing import Any
 from pydantic import BaseModel, Field
-from msc.core.tools.base import BaseTool
+from msc.core.tools.base import BaseTool, ToolAccess
 
 class WriteFileArgs(BaseModel):
     path: str = Field(..., description="Path to the file to write")
@@ -12,6 +12,9 @@ class WriteFileTool(BaseTool):
     description = "Atomically write content to a file. Directories will be created if they don't exist."
     args_schema = WriteFileArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:
+        return ToolAccess(writes={self.resolve_path(parameters["path"])})
+
     async def execute(self, **kwargs: Any) -> dict[str, Any]:
         path: str = kwargs["path"]
         content: str = kwargs["content"]
@@ -38,6 +41,9 @@ class ApplyDiffTool(BaseTool):
     description = "Apply precise modifications to a file using SEARCH/REPLACE blocks."
     args_schema = ApplyDiffArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:
+        return ToolAccess(writes={self.resolve_path(parameters["path"])})
+
     async def execute(self, **kwargs: Any) -> dict[str, Any]:
         path: str = kwargs["path"]
         diff_str: str = kwargs["diff"]
@@ -87,6 +93,9 @@ class ListFilesTool(BaseTool):
     description = "List files and directories in a structured format."
     args_schema = ListFilesArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:
+        return ToolAccess(reads={self.resolve_path(parameters.get("path", "."))})
+
     async def execute(self, **kwargs: Any) -> dict[str, Any]:
         path: str = kwargs.get("path", ".")
         recursive: bool = kwargs.get("recursive", False)
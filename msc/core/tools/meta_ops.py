@@ -1,6 +1,7 @@
+import os
 from typing import Any, Literal
 from pydantic import BaseModel, Field
-from msc.core.tools.base import BaseTool
+from msc.core.tools.base import BaseTool, ToolAccess
 
 class MemoryArgs(BaseModel):
     action: Literal["add", "remove", "update", "list"] = Field(..., description="Action to perform on memory")
@@ -12,6 +13,12 @@ class MemoryTool(BaseTool):
     description = "Manage the agent's long-term memory (Notebook/Hot Memory)."
     args_schema = MemoryArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:
+        notebook = self.resolve_path(os.path.join(".msc", "notebook"))
+        if parameters.get("action") == "list":
+            return ToolAccess(reads={notebook})
+        return ToolAccess(writes={notebook})
+
     async def execute(self, **kwargs: Any) -> dict[str, Any]:
         import os
         action = kwargs["action"]
@@ -51,6 +58,9 @@ class ModelSwitchTool(BaseTool):
     description = "Switch the current session's logical model via PFMS."
     args_schema = ModelSwitchArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:  # noqa: ARG002
+        return ToolAccess(writes={"session:model"})
+
     async def execute(self, **kwargs: Any) -> str:
         model_name = kwargs["model_name"]
         # In a real implementation, this would update the session's metadata and PFMS routing
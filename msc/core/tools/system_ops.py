@@ -8,7 +8,7 @@ from typing import Any
 
 from pydantic import BaseModel, Field
 
-from msc.core.tools.base import BaseTool
+from msc.core.tools.base import BaseTool, ToolAccess
 
 try:
     if platform.system() == "Windows":
@@ -132,12 +132,21 @@ def get_sandbox_provider() -> SandboxProvider:
 class ExecuteArgs(BaseModel):
     command: str = Field(..., description="The shell command to execute")
     cwd: str | None = Field(None, description="Working directory for the command")
+    serial: bool = Field(False, description="Run alone, after all earlier tool calls of this turn have finished")
 
 class ExecuteTool(BaseTool):
     name = "execute"
     description = "Execute a system command in a sandboxed subprocess."
     args_schema = ExecuteArgs
 
+    def access(self, parameters: dict[str, Any]) -> ToolAccess:
+        # 命令可能读取工作区内任意文件 (如运行测试)：排在本轮此前的写入之后，
+        # 其后的写入也等它完成；互相之间仍可并发。serial 则完全独占
+        reads = {self.resolve_path(".")}
+        if parameters.get("cwd"):
+            reads.add(self.resolve_path(parameters["cwd"]))
+        return ToolAccess(reads=reads, exclusive=bool(parameters.get("serial")))
+
     async def execute(self, **kwargs: Any) -> Any:
         command: str = kwargs["command"]
         cwd: str | None = kwargs.get("cwd")
@@ -1,7 +1,25 @@
+import asyncio
+import functools
+import inspect
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Iterator
+from contextlib import AbstractAsyncContextManager, nullcontext
 from typing import Any, Optional, Protocol, runtime_checkable
 
 from pydantic import BaseModel
 
+from msc.oracle.cache import ResponseCache, request_key
+from msc.oracle.cascade import CascadeConfig, CascadeStats, ResponseValidator, parse_confidence
+from msc.oracle.cost import BudgetExceededError, estimate_cost, provider_pricing
+from msc.oracle.errors import ErrorKind, RetryPolicy, classify_error, counts_against_provider
+from msc.oracle.health import HealthTracker
+from msc.oracle.ratelimit import ProviderLimiter
+from msc.oracle.routing import RoutingIndex
+from msc.oracle.singleflight import SingleFlight
+from msc.oracle.stream import StreamChunk
+from msc.oracle.tokens import ContextWindowExceededError, TokenEstimator
+
 
 @runtime_checkable
 class ModelCapability(Protocol):
@@ -24,63 +42,702 @@ class ChatProvider(Protocol):
     def model_info(self) -> ModelCapability: ...
     @property
     def pricing(self) -> dict[str, float]: ...
-    async def generate(self, prompt: str, image: str | None = None) -> tuple[str, list[Any], dict[str, Any]]: ...
+    async def generate(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> tuple[str, list[Any], dict[str, Any]]: ...
+    def generate_stream(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> AsyncIterator[StreamChunk]: ...
+
+
+# 延迟样本少于该数量时分位数不可靠，对冲等待改用固定的 hedge_delay
+_MIN_LATENCY_SAMPLES = 5
+
 
 class Oracle:
-    def __init__(self, providers: list[ChatProvider]):
+    def __init__(
+        self,
+        providers: list[ChatProvider],
+        *,
+        hedge_percentile: float | None = None,
+        hedge_delay: float = 2.0,
+        latency_window: int = 64,
+        health: HealthTracker | None = None,
+        cache: ResponseCache | None = None,
+        estimator: TokenEstimator | None = None,
+        routing: str = "priority",
+        expected_output_tokens: int = 1024,
+        retry: RetryPolicy | None = None,
+        cascades: dict[str, CascadeConfig] | None = None,
+        coalesce: bool = True,
+    ):
         """
         Oracle 核心类，负责 Model/Provider Free 的路由与故障转移。
         这里的 providers 列表顺序即为隐式优先级顺序。
+        hedge_percentile 非空时启用对冲模式：首选 Provider 超过其历史延迟分位数仍未返回，
+        则并发发起下一个候选请求，取最先成功者。样本不足时使用 hedge_delay 作为等待阈值。
+        health 负责按健康度对候选者排序并熔断持续失败的 Provider。
+        cache 非空时启用响应缓存，命中时返回原始 usage 并标记 cached。
+        estimator 负责本地 Token 估算，据此跳过上下文窗口 (context_window) 不足的候选者。
+        routing="cost" 时按预估费用 (输入估算 + expected_output_tokens) 从低到高排序，健康度作为平局裁决。
+        retry 决定同一 Provider 上瞬时错误 / 限流的重试；请求本身错误 (fatal) 不再尝试其他候选者。
+        cascades 将一个逻辑模型名映射为由廉价到强力的模型序列，响应未通过校验时逐级升级。
+        coalesce 启用单飞合并：规范化哈希相同的并发请求共享一次上游调用，
+        usage 只归属于发起者，其余调用者的 usage 标记 coalesced。
         """
+        self._index = RoutingIndex()
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self._latencies: dict[str, deque[float]] = {}
+        self._latency_window = latency_window
+        self.health = health or HealthTracker()
+        self.cache = cache
+        self._limiters: dict[str, ProviderLimiter] = {}
+        self.estimator = estimator or TokenEstimator()
+        self.routing = routing
+        self.expected_output_tokens = expected_output_tokens
+        self.retry = retry or RetryPolicy()
+        self.cascades = dict(cascades or {})
+        self._cascade_stats: dict[str, CascadeStats] = {}
+        self.single_flight = SingleFlight() if coalesce else None
+
+    @property
+    def providers(self) -> list[ChatProvider]:
+        return self._providers
+
+    @providers.setter
+    def providers(self, providers: list[ChatProvider]) -> None:
+        self._providers = list(providers)
+        self._index.rebuild(self._providers)
+
+    def add_provider(self, provider: ChatProvider) -> None:
+        self._providers.append(provider)
+        self._index.add(provider)
+
+    def remove_provider(self, provider: ChatProvider) -> None:
+        self._providers = [p for p in self._providers if p is not provider]
+        self._index.remove(provider)
+
+    def reload_providers(self, providers: list[ChatProvider]) -> None:
+        """热重载 Provider 配置 (例如 config.yaml 变更)，重建路由索引"""
         self.providers = providers
 
+    def _limiter_for(self, provider: ChatProvider) -> ProviderLimiter | None:
+        """按 Provider 声明的 rate_limits (rpm / tpm / max_in_flight) 懒加载限流器"""
+        if provider.name in self._limiters:
+            return self._limiters[provider.name]
+        limits = getattr(provider, "rate_limits", None)
+        if not isinstance(limits, dict) or not limits:
+            return None
+        limiter = ProviderLimiter(
+            rpm=limits.get("rpm"),
+            tpm=limits.get("tpm"),
+            max_in_flight=limits.get("max_in_flight"),
+        )
+        self._limiters[provider.name] = limiter
+        return limiter
+
+    def _slot(self, limiter: ProviderLimiter | None, estimated_tokens: int) -> AbstractAsyncContextManager[None]:
+        return limiter.slot(estimated_tokens) if limiter is not None else nullcontext()
+
+    @staticmethod
+    def _context_window(provider: ChatProvider) -> int | None:
+        window = getattr(provider, "context_window", None)
+        return window if isinstance(window, int) and window > 0 else None
+
+    def estimate_tokens(self, prompt: Any, provider: ChatProvider | None = None) -> int:
+        """估算请求的输入 Token 数；指定 provider 时使用其校准系数"""
+        return self.estimator.estimate(prompt, provider.name if provider is not None else None)
+
+    def context_budget(self, model_name: str, output_tokens: int | None = None) -> int | None:
+        """
+        返回该逻辑模型可用的输入预算，供 ContextFactory 裁剪历史；未配置窗口时返回 None。
+        预算以未校准的原始估算 (TokenEstimator.count) 为单位：窗口先预留预期输出，再除以 Provider 的校准系数，
+        与 _select_candidates 中的 scale(raw) <= window 判断一致。
+        """
+        if model_name in self.cascades:
+            # 级联的每一级都可能被调用，取各级预算的最小值
+            budgets = [
+                b for b in (self.context_budget(m, output_tokens) for m in self.cascades[model_name].models)
+                if b is not None
+            ]
+            return min(budgets) if budgets else None
+        output = self.expected_output_tokens if output_tokens is None else output_tokens
+        budgets = []
+        for provider in self._index.lookup(model_name):
+            window = self._context_window(provider)
+            if window is None:
+                return None
+            budgets.append(max(0, int((window - output) / self.estimator.ratio(provider.name))))
+        return max(budgets) if budgets else None
+
+    def estimate_cost(self, provider: ChatProvider, prompt: Any, output_tokens: int | None = None) -> float:
+        """按 Provider 价格与校准后的 Token 估算预估单次请求费用"""
+        return estimate_cost(
+            provider_pricing(provider),
+            self.estimate_tokens(prompt, provider),
+            self.expected_output_tokens if output_tokens is None else output_tokens,
+        )
+
+    def _price_candidates(
+        self,
+        candidates: list[ChatProvider],
+        raw_tokens: int,
+        budget: float | None,
+        output_tokens: int | None,
+    ) -> list[ChatProvider]:
+        """按剩余 Gas 预算过滤 (超预算时降级到更便宜的候选者)，cost 路由下按费用排序"""
+        if budget is None and self.routing != "cost":
+            return candidates
+        output = self.expected_output_tokens if output_tokens is None else output_tokens
+        costs = {
+            id(p): estimate_cost(provider_pricing(p), self.estimator.scale(raw_tokens, p.name), output)
+            for p in candidates
+        }
+        if budget is not None:
+            affordable = [p for p in candidates if costs[id(p)] <= budget]
+            if not affordable:
+                cheapest = min(costs.values())
+                raise BudgetExceededError(f"Estimated cost {cheapest:.6f} exceeds remaining gas budget {budget:.6f}")
+            candidates = affordable
+        if self.routing == "cost":
+            # 稳定排序：费用相同时保留健康度排序 (延迟更低者优先)
+            candidates = sorted(candidates, key=lambda p: costs[id(p)])
+        return candidates
+
+    def supports_native_tools(self, model_name: str) -> bool:
+        """该逻辑模型的所有候选者均支持原生工具调用时，调用方可省略提示词中的文本工具示例"""
+        if model_name in self.cascades:
+            return all(self.supports_native_tools(m) for m in self.cascades[model_name].models)
+        candidates = self._index.lookup(model_name)
+        return bool(candidates) and all(getattr(p.model_info, "has_tools", False) is True for p in candidates)
+
+    @staticmethod
+    def _tool_kwargs(provider: ChatProvider, tools: list[dict[str, Any]] | None) -> dict[str, Any]:
+        # 仅向支持原生工具调用的 Provider 传递工具声明
+        if tools and getattr(provider.model_info, "has_tools", False) is True:
+            return {"tools": tools}
+        return {}
+
+    async def warmup(self, timeout: float = 10.0) -> dict[str, dict[str, Any]]:
+        """
+        启动预热：并发调用各 Provider 的 probe() (建立共享连接池中的连接、预加载本地模型)，
+        以测得的延迟为健康排序提供初始样本。截止时间内未完成或失败的 Provider 记为一次失败。
+        """
+        probes: dict[asyncio.Task[float], ChatProvider] = {}
+        for provider in self._providers:
+            probe = getattr(provider, "probe", None)
+            if probe is None or not inspect.iscoroutinefunction(probe):
+                continue
+            probes[asyncio.create_task(self._timed_probe(probe))] = provider
+        if not probes:
+            return {}
+
+        _, pending = await asyncio.wait(probes, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        results: dict[str, dict[str, Any]] = {}
+        for task, provider in probes.items():
+            error = "timeout" if task in pending else task.exception()
+            if error is not None:
+                self.health.record_failure(provider.name)
+                results[provider.name] = {"ok": False, "error": str(error)}
+            else:
+                latency = task.result()
+                self.health.record_success(provider.name, latency)
+                results[provider.name] = {"ok": True, "latency": latency}
+        return results
+
+    async def aclose(self) -> None:
+        """释放 Provider 持有的远端资源 (如 Gemini 显式缓存句柄)，并写出按 persist_interval 节流尚未落盘的健康统计"""
+        for provider in self._providers:
+            close_caches = getattr(provider, "close_caches", None)
+            if close_caches is not None and inspect.iscoroutinefunction(close_caches):
+                await close_caches()
+        self.health.save()
+
+    @staticmethod
+    async def _timed_probe(probe: Any) -> float:
+        started = time.perf_counter()
+        await probe()
+        return time.perf_counter() - started
+
+    def cascade_stats(self) -> dict[str, dict[str, Any]]:
+        """返回各级联的请求数、各级模型的服务次数与升级原因分布"""
+        return {name: stats.snapshot() for name, stats in self._cascade_stats.items()}
+
+    @staticmethod
+    def _cascade_reject_reason(
+        config: CascadeConfig, text: str, tool_calls: list[Any], validate: ResponseValidator | None
+    ) -> str | None:
+        confidence = parse_confidence(text)
+        if confidence is not None and confidence < config.min_confidence:
+            return "low_confidence"
+        if validate is None:
+            return None
+        try:
+            return validate(text, tool_calls)
+        except Exception:
+            # 校验器无法处理的响应 (如工具调用缺少参数) 同样视为不合格，升级到下一级
+            return "invalid_response"
+
+    async def _generate_cascade(
+        self,
+        name: str,
+        prompt: Any,
+        *,
+        image: str | None,
+        require_caps: list[str] | None,
+        require_thinking: bool,
+        budget: float | None,
+        expected_output_tokens: int | None,
+        tools: list[dict[str, Any]] | None,
+        validate: ResponseValidator | None,
+    ) -> tuple[str, list[Any], dict[str, Any], ChatProvider]:
+        config = self.cascades[name]
+        stats = self._cascade_stats.setdefault(name, CascadeStats())
+        stats.requests += 1
+        reasons: list[str] = []
+        rejected: list[dict[str, Any]] = []
+        for level, model in enumerate(config.models):
+            final = level == len(config.models) - 1
+            reason: str | None
+            try:
+                text, tool_calls, usage, provider = await self.generate(
+                    model, prompt, image, require_caps, require_thinking,
+                    budget=budget, expected_output_tokens=expected_output_tokens, tools=tools,
+                )
+            except Exception:
+                if final:
+                    raise
+                reason = "error"
+            else:
+                reason = None if final else self._cascade_reject_reason(config, text, tool_calls, validate)
+                if reason is None:
+                    stats.served[model] = stats.served.get(model, 0) + 1
+                    if level > 0:
+                        stats.escalated += 1
+                    usage = {**usage, "cascade": {"name": name, "model": model, "escalations": reasons}}
+                    if rejected:
+                        # 被拒绝的低级响应同样产生费用
+                        usage["cascade_rejected"] = rejected
+                    return text, tool_calls, usage, provider
+                pricing = dict(provider_pricing(provider))
+                rejected.append({"provider": provider.name, "pricing": pricing, **usage})
+                if budget is not None and not usage.get("cached") and not usage.get("coalesced"):
+                    budget -= estimate_cost(pricing, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+            reasons.append(reason)
+            stats.reasons[reason] = stats.reasons.get(reason, 0) + 1
+        raise ValueError(f"Cascade {name} has no models")
+
+    def rate_limit_stats(self) -> dict[str, dict[str, Any]]:
+        """返回各 Provider 的排队深度与等待时间，用于评估 Provider 配额"""
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+    def provider_stats(self) -> dict[str, dict[str, Any]]:
+        """返回各 Provider 的健康统计快照 (EWMA 延迟、错误率、熔断状态)"""
+        return self.health.snapshot()
+
+    def _record_latency(self, provider: ChatProvider, latency: float) -> None:
+        samples = self._latencies.setdefault(provider.name, deque(maxlen=self._latency_window))
+        samples.append(latency)
+
+    def latency_percentile(self, provider: ChatProvider, percentile: float) -> float | None:
+        samples = self._latencies.get(provider.name)
+        if not samples or len(samples) < _MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def _hedge_delay_for(self, provider: ChatProvider) -> float:
+        observed = self.latency_percentile(provider, self.hedge_percentile or 0.95)
+        return observed if observed is not None else self.hedge_delay
+
+    async def _timed_generate(
+        self,
+        provider: ChatProvider,
+        prompt: Any,
+        image: str | None,
+        raw_tokens: int | None = None,
+        tools: list[dict[str, Any]] | None = None,
+    ) -> tuple[str, list[Any], dict[str, Any]]:
+        limiter = self._limiter_for(provider)
+        if raw_tokens is None:
+            raw_tokens = self.estimator.count(prompt)
+        estimated = self.estimator.scale(raw_tokens, provider.name)
+        try:
+            async with self._slot(limiter, estimated):
+                # 排队等待不计入 Provider 延迟
+                started = time.perf_counter()
+                result = await provider.generate(prompt, image=image, **self._tool_kwargs(provider, tools))
+        except asyncio.CancelledError:
+            self.health.release(provider.name)
+            raise
+        except Exception as e:
+            self._record_error(provider, e)
+            raise
+        latency = time.perf_counter() - started
+        self._record_latency(provider, latency)
+        self.health.record_success(provider.name, latency)
+        self._settle(provider, limiter, raw_tokens, estimated, result[2])
+        return result
+
+    def _record_error(self, provider: ChatProvider, error: BaseException) -> None:
+        if counts_against_provider(classify_error(error)):
+            self.health.record_failure(provider.name)
+        else:
+            self.health.release(provider.name)
+
+    async def _generate_with_retry(
+        self,
+        provider: ChatProvider,
+        prompt: Any,
+        image: str | None,
+        raw_tokens: int | None = None,
+        tools: list[dict[str, Any]] | None = None,
+    ) -> tuple[str, list[Any], dict[str, Any]]:
+        attempt = 0
+        while True:
+            try:
+                return await self._timed_generate(provider, prompt, image, raw_tokens, tools)
+            except Exception as e:
+                delay = self.retry.delay(classify_error(e), attempt)
+                # 熔断器已打开时不再重试该 Provider
+                if delay is None or not self.health.allow(provider.name):
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _settle(
+        self,
+        provider: ChatProvider,
+        limiter: ProviderLimiter | None,
+        raw_tokens: int,
+        estimated: int,
+        usage: dict[str, Any],
+    ) -> None:
+        input_tokens = usage.get("input_tokens", 0) or 0
+        # 以实际 usage 校准该 Provider 的估算系数 (缓存读写部分同样属于输入)
+        prompt_tokens = (
+            input_tokens
+            + (usage.get("cache_read_input_tokens", 0) or 0)
+            + (usage.get("cache_creation_input_tokens", 0) or 0)
+        )
+        self.estimator.calibrate(provider.name, raw_tokens, prompt_tokens)
+        if limiter is not None:
+            limiter.settle(estimated, input_tokens + (usage.get("output_tokens", 0) or 0))
+
+    async def _generate_hedged(
+        self,
+        candidates: list[ChatProvider],
+        prompt: Any,
+        image: str | None,
+        raw_tokens: int | None = None,
+        tools: list[dict[str, Any]] | None = None,
+    ) -> tuple[str, list[Any], dict[str, Any], ChatProvider]:
+        queue = list(candidates)
+        pending: dict[asyncio.Task[tuple[str, list[Any], dict[str, Any]]], ChatProvider] = {}
+        latest: ChatProvider | None = None
+        last_exception: BaseException | None = None
+
+        def launch() -> None:
+            nonlocal latest
+            while queue:
+                provider = queue.pop(0)
+                if self.health.allow(provider.name):
+                    latest = provider
+                    pending[asyncio.create_task(self._generate_with_retry(provider, prompt, image, raw_tokens, tools))] = provider
+                    return
+
+        launch()
+        winner: tuple[str, list[Any], dict[str, Any], ChatProvider] | None = None
+        losers: list[dict[str, Any]] = []
+        try:
+            while pending and winner is None:
+                timeout = self._hedge_delay_for(latest) if queue and latest else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 首选者超出延迟分位数，发起对冲请求
+                    launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        last_exception = error
+                        if classify_error(error).kind == ErrorKind.FATAL:
+                            raise error
+                        continue
+                    text, tool_calls, usage = task.result()
+                    if winner is None:
+                        winner = (text, tool_calls, usage, provider)
+                    else:
+                        losers.append({
+                            "provider": provider.name,
+                            "pricing": dict(getattr(provider, "pricing", {}) or {}),
+                            **usage,
+                        })
+                if winner is None and not pending and queue:
+                    launch()
+        finally:
+            # 被取消的请求已发送给 Provider，其输入同样计费：以校准后的估算计入，并标记为估算值
+            prompt_raw = raw_tokens if raw_tokens is not None else self.estimator.count(prompt)
+            for task, provider in pending.items():
+                task.cancel()
+                losers.append({
+                    "provider": provider.name,
+                    "pricing": dict(getattr(provider, "pricing", {}) or {}),
+                    "input_tokens": self.estimator.scale(prompt_raw, provider.name),
+                    "output_tokens": 0,
+                    "cancelled": True,
+                    "estimated": True,
+                })
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if winner is None:
+            raise last_exception if last_exception else RuntimeError("All providers failed or circuit open")
+        text, tool_calls, usage, provider = winner
+        if losers:
+            # 败者的用量仍需计入 Gas
+            usage = {**usage, "hedge_losers": losers}
+        return text, tool_calls, usage, provider
+
+    def _select_candidates(
+        self,
+        model_name: str,
+        image: str | None,
+        require_caps: list[str] | None,
+        require_thinking: bool,
+        raw_tokens: int | None = None,
+    ) -> list[ChatProvider]:
+        # 1. 通过预计算索引筛选符合条件的候选者 (能力标签 / 多模态 / CoT / 原生工具调用)
+        candidates = self._index.lookup(model_name, require_caps, bool(image), require_thinking)
+
+        if not candidates:
+            raise ValueError(f"No provider found for {model_name}")
+
+        # 跳过上下文窗口放不下本次请求的候选者，避免必然失败的远程调用与无效故障转移
+        if raw_tokens is not None:
+            fitting = []
+            for p in candidates:
+                window = self._context_window(p)
+                if window is None or self.estimator.scale(raw_tokens, p.name) <= window:
+                    fitting.append(p)
+            if not fitting:
+                raise ContextWindowExceededError(
+                    f"Estimated {raw_tokens} tokens exceed the context window of every provider for {model_name}"
+                )
+            candidates = fitting
+
+        # 按健康度排序，熔断中的 Provider 在发起请求前被跳过
+        position: dict[str, int] = {}
+        for i, name in enumerate(self.health.rank([p.name for p in candidates])):
+            position.setdefault(name, i)
+        candidates.sort(key=lambda p: position[p.name])
+        return candidates
+
     async def generate(
         self,
         model_name: str,
         prompt: str,
         image: str | None = None,
         require_caps: list[str] | None = None,
-        require_thinking: bool = False
+        require_thinking: bool = False,
+        *,
+        budget: float | None = None,
+        expected_output_tokens: int | None = None,
+        tools: list[dict[str, Any]] | None = None,
+        validate: ResponseValidator | None = None,
     ) -> tuple[str, list[Any], dict[str, Any], ChatProvider]:
-        # 1. 筛选符合条件的候选者
-        candidates = []
-        for p in self.providers:
-            if p.model_name != model_name:
-                continue
-            
-            # 验证能力标签 (如 green-tea)
-            if require_caps:
-                if not all(cap in p.capabilities for cap in require_caps):
-                    continue
-            
-            # 验证多模态支持
-            if image and not p.model_info.has_vision:
-                continue
-            
-            # 验证 CoT 支持
-            if require_thinking and not p.model_info.has_thinking:
-                continue
+        """
+        budget 为剩余 Gas (美元)；预估费用超出时降级到更便宜的候选者，全部超出则抛出 BudgetExceededError。
+        tools 为 BaseTool.get_schema 格式的工具声明，以原生方式传给支持工具调用的 Provider。
+        validate 仅用于级联模型名：返回失败原因时升级到下一级模型。
+        """
+        if model_name in self.cascades:
+            return await self._generate_cascade(
+                model_name, prompt, image=image, require_caps=require_caps, require_thinking=require_thinking,
+                budget=budget, expected_output_tokens=expected_output_tokens, tools=tools, validate=validate,
+            )
+        raw_tokens = self.estimator.count(prompt)
+        candidates = self._select_candidates(model_name, image, require_caps, require_thinking, raw_tokens)
 
-            # 验证原生工具调用支持
-            if "tool" in (require_caps or []) and not p.model_info.has_tools:
-                continue
-                
-            candidates.append(p)
+        key = request_key(model_name, prompt, image, require_caps, require_thinking, tools=tools)
+        cache_key = None
+        if self.cache is not None and self.cache.enabled_for(model_name):
+            cache_key = key
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                provider = next((p for p in candidates if p.name == entry.provider), candidates[0])
+                return entry.text, entry.tool_calls, {**entry.usage, "cached": True}, provider
 
-        if not candidates:
-            raise ValueError(f"No provider found for {model_name}")
+        # 缓存命中不产生费用，预算检查放在缓存查询之后
+        candidates = self._price_candidates(candidates, raw_tokens, budget, expected_output_tokens)
+
+        async def dispatch() -> tuple[str, list[Any], dict[str, Any], ChatProvider]:
+            text, tool_calls, usage, provider = await self._dispatch(candidates, prompt, image, raw_tokens, tools)
+            if cache_key is not None and self.cache is not None:
+                self.cache.put(cache_key, model_name, provider.name, text=text, tool_calls=tool_calls, usage=usage)
+            return text, tool_calls, usage, provider
+
+        if self.single_flight is None:
+            return await dispatch()
+        (text, tool_calls, usage, provider), shared = await self.single_flight.do(key, dispatch)
+        if shared:
+            # 费用已由发起者承担，合并调用者不再重复计费
+            usage = {k: v for k, v in usage.items() if k != "hedge_losers"}
+            usage["coalesced"] = True
+        return text, tool_calls, usage, provider
+
+    async def _dispatch(
+        self,
+        candidates: list[ChatProvider],
+        prompt: Any,
+        image: str | None,
+        raw_tokens: int | None = None,
+        tools: list[dict[str, Any]] | None = None,
+    ) -> tuple[str, list[Any], dict[str, Any], ChatProvider]:
+        if self.hedge_percentile is not None and len(candidates) > 1:
+            return await self._generate_hedged(candidates, prompt, image, raw_tokens, tools)
 
         # 2. 顺序尝试 (故障转移)
         last_exception = None
         for provider in candidates:
+            if not self.health.allow(provider.name):
+                continue
             try:
-                text, tool_calls, usage = await provider.generate(prompt, image=image)
+                text, tool_calls, usage = await self._generate_with_retry(provider, prompt, image, raw_tokens, tools)
                 return text, tool_calls, usage, provider
             except Exception as e:
+                # 请求本身有误 (如参数错误)，换 Provider 也会失败
+                if classify_error(e).kind == ErrorKind.FATAL:
+                    raise
                 last_exception = e
                 continue
         
-        raise last_exception if last_exception else RuntimeError("All providers failed")
+        raise last_exception if last_exception else RuntimeError("All providers failed or circuit open")
+
+    async def _open_stream(
+        self, provider: ChatProvider, prompt: Any, image: str | None, tools: list[dict[str, Any]] | None = None
+    ) -> AsyncGenerator[StreamChunk]:
+        tool_kwargs = self._tool_kwargs(provider, tools)
+        generate_stream = getattr(provider, "generate_stream", None)
+        if generate_stream is not None:
+            async for chunk in generate_stream(prompt, image=image, **tool_kwargs):
+                yield chunk
+            return
+        # 不支持流式的 Provider 退化为一次性生成
+        text, tool_calls, usage = await provider.generate(prompt, image=image, **tool_kwargs)
+        for chunk in self._replay(text, tool_calls):
+            yield chunk
+        yield StreamChunk(type="usage", usage=usage)
+
+    @staticmethod
+    def _replay(text: str, tool_calls: list[Any]) -> Iterator[StreamChunk]:
+        """将一次性生成的结果回放为文本与工具调用片段"""
+        if text:
+            yield StreamChunk(type="text", text=text)
+        for index, call in enumerate(tool_calls):
+            if isinstance(call, dict):
+                yield StreamChunk(
+                    type="tool_call", index=index, tool_call_id=call.get("id"), tool_name=call.get("name"), parameters=call.get("parameters", {})
+                )
+
+    @staticmethod
+    async def _forward(
+        provider: ChatProvider,
+        first: StreamChunk,
+        stream: AsyncGenerator[StreamChunk],
+        settle: Callable[[dict[str, Any]], None],
+    ) -> AsyncIterator[StreamChunk]:
+        """转发首个片段之后的流；usage 片段标记实际服务的 Provider 并结算限流与估算校准"""
+        try:
+            chunk: StreamChunk | None = first
+            while chunk is not None:
+                if chunk.type == "usage":
+                    chunk.provider = provider
+                    settle(chunk.usage)
+                yield chunk
+                chunk = await anext(stream, None)
+        finally:
+            await stream.aclose()
+
+    async def generate_stream(
+        self,
+        model_name: str,
+        prompt: Any,
+        image: str | None = None,
+        require_caps: list[str] | None = None,
+        require_thinking: bool = False,
+        *,
+        budget: float | None = None,
+        expected_output_tokens: int | None = None,
+        tools: list[dict[str, Any]] | None = None,
+        validate: ResponseValidator | None = None,
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        流式生成：在收到首个片段前保持与 generate 相同的故障转移语义，
+        首个片段送出后错误将直接抛给调用方。最后一个 usage 片段携带实际服务的 Provider。
+        级联模型需要完整响应才能校验，因此以一次性生成的结果回放为片段。
+        """
+        if model_name in self.cascades:
+            text, tool_calls, usage, provider = await self.generate(
+                model_name, prompt, image, require_caps, require_thinking,
+                budget=budget, expected_output_tokens=expected_output_tokens, tools=tools, validate=validate,
+            )
+            for replayed in self._replay(text, tool_calls):
+                yield replayed
+            yield StreamChunk(type="usage", usage=usage, provider=provider)
+            return
+        raw_tokens = self.estimator.count(prompt)
+        candidates = self._select_candidates(model_name, image, require_caps, require_thinking, raw_tokens)
+        candidates = self._price_candidates(candidates, raw_tokens, budget, expected_output_tokens)
+
+        last_exception: BaseException | None = None
+        for provider in candidates:
+            if not self.health.allow(provider.name):
+                continue
+            limiter = self._limiter_for(provider)
+            estimated = self.estimator.scale(raw_tokens, provider.name)
+            attempt = 0
+            while True:
+                async with self._slot(limiter, estimated):
+                    started = time.perf_counter()
+                    stream = self._open_stream(provider, prompt, image, tools)
+                    try:
+                        first = await anext(stream)
+                    except asyncio.CancelledError:
+                        self.health.release(provider.name)
+                        raise
+                    except Exception as e:
+                        self._record_error(provider, e)
+                        error = e
+                    else:
+                        # 以首 Token 延迟 (TTFT) 作为流式请求的延迟样本
+                        latency = time.perf_counter() - started
+                        self._record_latency(provider, latency)
+                        self.health.record_success(provider.name, latency)
+
+                        settle = functools.partial(self._settle, provider, limiter, raw_tokens, estimated)
+                        async for chunk in self._forward(provider, first, stream, settle):
+                            yield chunk
+                        return
+
+                # 首个片段之前的错误：按分类决定重试、转移或立即失败 (重试等待不占用限流槽位)
+                classified = classify_error(error)
+                if classified.kind == ErrorKind.FATAL:
+                    raise error
+                delay = self.retry.delay(classified, attempt)
+                if delay is None or not self.health.allow(provider.name):
+                    last_exception = error
+                    break
+                attempt += 1
+                await asyncio.sleep(delay)
+
+        raise last_exception if last_exception else RuntimeError("All providers failed or circuit open")
 
 def create_adapter(provider_type: str, **kwargs: Any) -> ChatProvider:
     """
@@ -1,7 +1,12 @@
+from collections.abc import AsyncIterator
 from typing import Any
 
 from anthropic import AsyncAnthropic
 
+from msc.oracle.messages import as_messages, native_tool_calls, text_of, tool_result_text
+from msc.oracle.stream import StreamChunk
+from msc.oracle.transport import shared_client_kwargs
+
 
 class AnthropicAdapter:
     def __init__(
@@ -16,6 +21,10 @@ class AnthropicAdapter:
         has_tools: bool = False,
         pricing: dict[str, float] | None = None,
         default_max_tokens: int = 4096,
+        *,
+        rate_limits: dict[str, int] | None = None,
+        context_window: int | None = None,
+        prompt_caching: bool = True,
         **kwargs: Any
     ):
         self.name = name
@@ -23,36 +32,109 @@ class AnthropicAdapter:
         self.capabilities = capabilities or []
         self.model_info = MagicModelInfo(has_vision, has_thinking, has_tools)
         self._pricing = pricing or {"input_1m": 0.0, "output_1m": 0.0}
+        self.rate_limits = rate_limits or {}
+        self.context_window = context_window
         self.default_max_tokens = default_max_tokens
-        self.client = AsyncAnthropic(api_key=api_key, base_url=base_url, **kwargs)
+        self.prompt_caching = prompt_caching
+        self.client = AsyncAnthropic(api_key=api_key, base_url=base_url, **shared_client_kwargs(kwargs))
 
     @property
     def pricing(self) -> dict[str, float]:
         return self._pricing
 
-    async def generate(self, prompt: str, image: str | None = None) -> tuple[str, list[Any], dict[str, Any]]:
-        content = []
+    async def probe(self) -> None:
+        """预热探测：轻量请求 /models 以建立连接并确认端点可达，不重试"""
+        await self.client.with_options(max_retries=0).models.list(limit=1)
+
+    def _image_block(self, image: str | None) -> dict[str, Any] | None:
         if image and self.model_info.has_vision:
             if image.startswith("data:"):
                 res = image[5:].split(";base64,", 1)
                 if len(res) == 2:
                     media_type, data = res
-                    content.append({
+                    return {
                         "type": "image",
                         "source": {
                             "type": "base64",
                             "media_type": media_type,
                             "data": data,
                         },
-                    })
-        
-        content.append({"type": "text", "text": prompt})
+                    }
+        return None
+
+    @staticmethod
+    def _message_blocks(msg: dict[str, Any], declared: dict[str, str]) -> tuple[str, list[dict[str, Any]]]:
+        """将一条消息转换为 (role, content blocks)；非 assistant 消息一律以 user 角色发送"""
+        role = msg.get("role")
+        text = text_of(msg)
+        blocks: list[dict[str, Any]] = [{"type": "text", "text": text}] if text else []
+        if role == "assistant":
+            blocks += [
+                {"type": "tool_use", "id": call["id"], "name": call["name"], "input": call.get("parameters", {})}
+                for call in msg.get("tool_calls") or []
+            ]
+        elif role == "tool" and msg.get("tool_call_id") in declared:
+            blocks = [{"type": "tool_result", "tool_use_id": msg["tool_call_id"], "content": text}]
+        elif role == "tool":
+            # 文本解析的工具调用没有对应的 tool_use 块，以用户消息形式回传观测结果
+            blocks = [{"type": "text", "text": tool_result_text(msg)}]
+        return "assistant" if role == "assistant" else "user", blocks or [{"type": "text", "text": text or "..."}]
+
+    def _build_request(self, prompt: Any, image: str | None, tools: list[dict[str, Any]] | None = None) -> dict[str, Any]:
+        """
+        将 prompt (字符串或消息列表) 转换为 Anthropic 请求参数。
+        system 消息进入 system 参数；原生工具调用转换为 tool_use / tool_result 块；
+        启用 prompt_caching 时在 system 与稳定历史前缀末尾设置 cache_control 断点。
+        """
+        source = as_messages(prompt)
+        declared = native_tool_calls(source)
+
+        system_blocks: list[dict[str, Any]] = []
+        messages: list[dict[str, Any]] = []
+        for index, msg in enumerate(source):
+            if msg.get("role") == "system" and index == 0:
+                system_blocks.append({"type": "text", "text": text_of(msg)})
+                continue
+            role, blocks = self._message_blocks(msg, declared)
+            if messages and messages[-1]["role"] == role:
+                messages[-1]["content"].extend(blocks)
+            else:
+                messages.append({"role": role, "content": blocks})
+
+        if not messages or messages[-1]["role"] != "user":
+            messages.append({"role": "user", "content": [{"type": "text", "text": "Continue."}]})
 
+        image_block = self._image_block(image)
+        if image_block:
+            messages[-1]["content"].insert(0, image_block)
+
+        if self.prompt_caching:
+            cache_control = {"type": "ephemeral"}
+            if system_blocks:
+                system_blocks[-1]["cache_control"] = cache_control
+            # 最后一条消息携带易变的 Metadata，缓存断点设在其之前的稳定前缀上
+            if len(messages) > 1:
+                messages[-2]["content"][-1]["cache_control"] = cache_control
+
+        request: dict[str, Any] = {"messages": messages}
+        if system_blocks:
+            request["system"] = system_blocks
+        if tools:
+            # tools 位于缓存前缀最前端，system 上的断点同时覆盖工具声明
+            request["tools"] = [
+                {"name": t["name"], "description": t.get("description", ""), "input_schema": t["parameters"]}
+                for t in tools
+            ]
+        return request
+
+    async def generate(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> tuple[str, list[Any], dict[str, Any]]:
         from anthropic.types import Message, TextBlock, ToolUseBlock
         response = await self.client.messages.create(
             model=self.model_name,
             max_tokens=self.default_max_tokens,
-            messages=[{"role": "user", "content": content}],  # type: ignore
+            **self._build_request(prompt, image, tools),
             stream=False
         )
         if isinstance(response, Message):
@@ -63,6 +145,7 @@ class AnthropicAdapter:
             for block in response.content:
                 if isinstance(block, ToolUseBlock):
                     tool_calls.append({
+                        "id": block.id,
                         "name": block.name,
                         "parameters": block.input
                     })
@@ -70,12 +153,44 @@ class AnthropicAdapter:
             usage = {
                 "input_tokens": response.usage.input_tokens,
                 "output_tokens": response.usage.output_tokens,
-                "cache_creation_input_tokens": getattr(response.usage, "cache_creation_input_tokens", 0),
-                "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", 0),
+                "cache_creation_input_tokens": getattr(response.usage, "cache_creation_input_tokens", 0) or 0,
+                "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", 0) or 0,
             }
             return text_content, tool_calls, usage
         return "", [], {}
 
+    async def generate_stream(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> AsyncIterator[StreamChunk]:
+        stream = await self.client.messages.create(
+            model=self.model_name,
+            max_tokens=self.default_max_tokens,
+            **self._build_request(prompt, image, tools),
+            stream=True
+        )
+        usage: dict[str, Any] = {"input_tokens": 0, "output_tokens": 0}
+        async for event in stream:
+            if event.type == "message_start":
+                msg_usage = event.message.usage
+                usage["input_tokens"] = msg_usage.input_tokens
+                usage["cache_creation_input_tokens"] = getattr(msg_usage, "cache_creation_input_tokens", 0) or 0
+                usage["cache_read_input_tokens"] = getattr(msg_usage, "cache_read_input_tokens", 0) or 0
+            elif event.type == "content_block_start" and event.content_block.type == "tool_use":
+                yield StreamChunk(
+                    type="tool_call",
+                    index=event.index,
+                    tool_call_id=event.content_block.id,
+                    tool_name=event.content_block.name,
+                )
+            elif event.type == "content_block_delta":
+                if event.delta.type == "text_delta":
+                    yield StreamChunk(type="text", text=event.delta.text)
+                elif event.delta.type == "input_json_delta":
+                    yield StreamChunk(type="tool_call", index=event.index, arguments=event.delta.partial_json)
+            elif event.type == "message_delta":
+                usage["output_tokens"] = event.usage.output_tokens
+        yield StreamChunk(type="usage", usage=usage)
+
 class MagicModelInfo:
     def __init__(self, has_vision: bool, has_thinking: bool, has_tools: bool):
         self._has_vision = has_vision
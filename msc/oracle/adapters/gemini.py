@@ -1,7 +1,29 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from http import HTTPStatus
 from typing import Any
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+
+from msc.oracle.messages import (
+    as_messages,
+    native_tool_calls,
+    split_system,
+    text_of,
+    tool_result_text,
+)
+from msc.oracle.stream import StreamChunk
+from msc.oracle.tokens import TokenEstimator
+from msc.oracle.transport import get_transport
+
+# 不可缓存前缀的记录上限，超出时淘汰最久未命中的
+_MAX_UNCACHEABLE = 256
 
 
 class GeminiAdapter:
@@ -17,15 +39,43 @@ class GeminiAdapter:
         has_tools: bool = False,
         vertexai: bool = False,
         pricing: dict[str, float] | None = None,
+        *,
+        rate_limits: dict[str, int] | None = None,
+        context_window: int | None = None,
+        context_caching: bool = False,
+        cache_ttl: float = 600.0,
+        cache_min_tokens: int = 1024,
+        cache_max_entries: int = 4,
         **kwargs: Any
     ):
+        """
+        context_caching 启用显式上下文缓存：system_instruction 与工具声明组成的稳定前缀
+        按内容哈希创建 cached content 句柄并在 TTL 内复用，超出 cache_max_entries 时删除最旧句柄。
+        估算 Token 数低于 cache_min_tokens 的前缀 (低于 Gemini 的缓存下限) 不缓存。
+        """
         self.name = name
         self.model_name = model
         self.capabilities = capabilities or []
         self.model_info = MagicModelInfo(has_vision, has_thinking, has_tools)
         self._pricing = pricing or {"input_1m": 0.0, "output_1m": 0.0}
+        self.rate_limits = rate_limits or {}
+        self.context_window = context_window
+        self.context_caching = context_caching
+        self.cache_ttl = cache_ttl
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_max_entries = cache_max_entries
+        # 前缀哈希 → (cached content 名称, 过期时间)
+        self._cached_contents: dict[str, tuple[str, float]] = {}
+        # 服务端明确拒绝缓存的前缀哈希 (LRU，有上限)
+        self._uncacheable: OrderedDict[str, None] = OrderedDict()
+        # 正在创建中的前缀哈希 → 创建任务，并发请求共享同一次创建
+        self._creating: dict[str, asyncio.Task[str | None]] = {}
+        self._cache_lock = asyncio.Lock()
         
-        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        http_options = types.HttpOptions(
+            base_url=base_url,
+            httpx_async_client=get_transport().shared_client(),
+        )
         self.client = genai.Client(
             api_key=api_key,
             vertexai=vertexai,
@@ -37,10 +87,44 @@ class GeminiAdapter:
     def pricing(self) -> dict[str, float]:
         return self._pricing
 
-    async def generate(self, prompt: str, image: str | None = None) -> tuple[str, list[Any], dict[str, Any]]:
-        contents = []
-        parts = [types.Part.from_text(text=prompt)]
-        
+    async def probe(self) -> None:
+        """预热探测：读取模型元数据以建立连接并确认模型可用"""
+        await self.client.aio.models.get(model=self.model_name)
+
+    def _build_contents(self, prompt: Any, image: str | None) -> tuple[str | None, list[types.Content]]:
+        """返回 (system_instruction, contents)；assistant 映射为 model，原生工具结果映射为 function_response"""
+        system, source = split_system(as_messages(prompt))
+        declared = native_tool_calls(source)
+        contents: list[types.Content] = []
+        for msg in source:
+            role = msg.get("role")
+            text = text_of(msg)
+            parts: list[types.Part] = [types.Part.from_text(text=text)] if text else []
+            if role == "assistant":
+                role = "model"
+                parts += [
+                    types.Part(function_call=types.FunctionCall(id=call["id"], name=call["name"], args=call.get("parameters", {})))
+                    for call in msg.get("tool_calls") or []
+                ]
+            elif role == "tool" and msg.get("tool_call_id") in declared:
+                role = "user"
+                parts = [types.Part(function_response=types.FunctionResponse(
+                    id=msg["tool_call_id"], name=declared[msg["tool_call_id"]], response={"result": text}
+                ))]
+            elif role == "tool":
+                role, parts = "user", [types.Part.from_text(text=tool_result_text(msg))]
+            else:
+                role = "user"
+            if not parts:
+                continue
+            if contents and contents[-1].role == role:
+                contents[-1].parts = (contents[-1].parts or []) + parts
+            else:
+                contents.append(types.Content(role=role, parts=parts))
+
+        if not contents or contents[-1].role != "user":
+            contents.append(types.Content(role="user", parts=[types.Part.from_text(text="Continue.")]))
+
         if image and self.model_info.has_vision:
             if image.startswith("data:"):
                 res = image[5:].split(";base64,", 1)
@@ -48,36 +132,227 @@ class GeminiAdapter:
                     media_type, data_b64 = res
                     import base64
                     data_bytes = base64.b64decode(data_b64)
-                    parts.append(types.Part.from_bytes(data=data_bytes, mime_type=media_type))
-            
-        contents.append(types.Content(role="user", parts=parts))
-
-        response = await self.client.aio.models.generate_content(
-            model=self.model_name,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(include_thoughts=True) if self.model_info.has_thinking else None
+                    contents[-1].parts = (contents[-1].parts or []) + [types.Part.from_bytes(data=data_bytes, mime_type=media_type)]
+        return system, contents
+
+    @staticmethod
+    def _tool_declarations(tools: list[dict[str, Any]] | None) -> list[types.Tool] | None:
+        if not tools:
+            return None
+        return [types.Tool(function_declarations=[
+            types.FunctionDeclaration(
+                name=t["name"], description=t.get("description", ""), parameters_json_schema=t["parameters"]
             )
+            for t in tools
+        ])]
+
+    def _build_config(
+        self,
+        system: str | None = None,
+        tools: list[dict[str, Any]] | None = None,
+        cached_content: str | None = None,
+    ) -> types.GenerateContentConfig:
+        thinking_config = types.ThinkingConfig(include_thoughts=True) if self.model_info.has_thinking else None
+        if cached_content:
+            # system_instruction 与 tools 已包含在缓存句柄中，不可重复发送
+            return types.GenerateContentConfig(cached_content=cached_content, thinking_config=thinking_config)
+        declarations = self._tool_declarations(tools)
+        return types.GenerateContentConfig(
+            system_instruction=system,
+            # 以新列表传入：该字段的元素类型更宽 (还接受可调用对象)，list 不变
+            tools=[*declarations] if declarations else None,
+            thinking_config=thinking_config
         )
-        
-        # 提取原生工具调用
+
+    def _prefix_key(self, system: str | None, tools: list[dict[str, Any]] | None) -> str:
+        canonical = json.dumps({"model": self.model_name, "system": system, "tools": tools}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _mark_uncacheable(self, key: str) -> None:
+        self._uncacheable[key] = None
+        self._uncacheable.move_to_end(key)
+        while len(self._uncacheable) > _MAX_UNCACHEABLE:
+            self._uncacheable.popitem(last=False)
+
+    async def _cached_content_for(self, system: str | None, tools: list[dict[str, Any]] | None) -> str | None:
+        """返回稳定前缀对应的 cached content 名称，必要时创建；不可缓存或创建失败时返回 None"""
+        if not self.context_caching or not system:
+            return None
+        key = self._prefix_key(system, tools)
+        if key in self._uncacheable:
+            self._uncacheable.move_to_end(key)
+            return None
+        async with self._cache_lock:
+            entry = self._cached_contents.get(key)
+            # 预留余量，避免句柄在请求途中过期
+            if entry is not None and entry[1] - time.time() > min(30.0, self.cache_ttl / 10):
+                return entry[0]
+            if TokenEstimator().count(system) < self.cache_min_tokens:
+                self._mark_uncacheable(key)
+                return None
+            creating = self._creating.get(key)
+            if creating is None:
+                creating = asyncio.get_running_loop().create_task(self._create_cached_content(key, system, tools))
+                self._creating[key] = creating
+        # 网络调用不持有锁；shield 使单个请求被取消时不打断其他请求共享的创建
+        return await asyncio.shield(creating)
+
+    async def _create_cached_content(self, key: str, system: str, tools: list[dict[str, Any]] | None) -> str | None:
+        try:
+            name = await self._request_cached_content(key, system, tools)
+            if not name:
+                return None
+            async with self._cache_lock:
+                now = time.time()
+                self._cached_contents.pop(key, None)
+                self._cached_contents[key] = (name, now + self.cache_ttl)
+                # 先登记句柄再移除创建标记 (同一临界区)，等锁的请求不会因两者皆无而重复创建
+                self._creating.pop(key, None)
+                evicted = self._evict_cached_contents(now)
+        finally:
+            # 创建失败或被取消时同样移除标记，后续请求可再次尝试
+            self._creating.pop(key, None)
+        for stale in evicted:
+            await self._delete_cached_content(stale)
+        return name
+
+    async def _request_cached_content(self, key: str, system: str, tools: list[dict[str, Any]] | None) -> str | None:
+        try:
+            cached = await self.client.aio.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system,
+                    tools=self._tool_declarations(tools),
+                    ttl=f"{int(self.cache_ttl)}s",
+                    display_name=f"msc-{key[:16]}",
+                ),
+            )
+        except errors.ClientError as e:
+            # 模型不支持或前缀低于服务端下限：后续请求直接发送完整内容；限流属于暂时性错误，下次重试
+            if e.code != HTTPStatus.TOO_MANY_REQUESTS:
+                self._mark_uncacheable(key)
+            return None
+        except Exception:
+            # 5xx、超时等暂时性错误：本次发送完整内容，不影响后续请求再次尝试
+            return None
+        return cached.name
+
+    def _evict_cached_contents(self, now: float) -> list[str]:
+        """移除过期与超出上限的句柄，返回仍需在服务端删除的名称"""
+        stale = [k for k, (_, expires_at) in self._cached_contents.items() if expires_at <= now]
+        overflow = len(self._cached_contents) - len(stale) - self.cache_max_entries
+        if overflow > 0:
+            live = [k for k in self._cached_contents if k not in stale]
+            stale += live[:overflow]
+        names = []
+        for key in stale:
+            name, expires_at = self._cached_contents.pop(key)
+            if expires_at > now:
+                names.append(name)
+        return names
+
+    async def _delete_cached_content(self, name: str) -> None:
+        with contextlib.suppress(Exception):
+            await self.client.aio.caches.delete(name=name)
+
+    async def _forget_cached_content(self, name: str) -> None:
+        """丢弃服务端已不认可的句柄 (已过期或被删除)，下次请求重新创建"""
+        async with self._cache_lock:
+            for key in [k for k, (n, _) in self._cached_contents.items() if n == name]:
+                del self._cached_contents[key]
+
+    async def close_caches(self) -> None:
+        """删除本适配器创建的所有 cached content (按存储时长计费，退出时应主动清理)"""
+        async with self._cache_lock:
+            entries = list(self._cached_contents.values())
+            self._cached_contents.clear()
+        now = time.time()
+        for name, expires_at in entries:
+            if expires_at > now:
+                await self._delete_cached_content(name)
+
+    @staticmethod
+    def _rejects_cached_content(error: errors.ClientError) -> bool:
+        return error.code in {HTTPStatus.BAD_REQUEST, HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND} and (
+            "cache" in str(error).lower()
+        )
+
+    async def _send(
+        self, method: Callable[..., Awaitable[Any]], prompt: Any, image: str | None, tools: list[dict[str, Any]] | None
+    ) -> Any:
+        system, contents = self._build_contents(prompt, image)
+        cached_content = await self._cached_content_for(system, tools)
+        try:
+            return await method(
+                model=self.model_name, contents=contents, config=self._build_config(system, tools, cached_content)
+            )
+        except errors.ClientError as e:
+            if not cached_content or not self._rejects_cached_content(e):
+                raise
+            # 句柄在服务端已失效：丢弃后以完整内容重发一次
+            await self._forget_cached_content(cached_content)
+            return await method(model=self.model_name, contents=contents, config=self._build_config(system, tools))
+
+    @staticmethod
+    def _extract_usage(response: types.GenerateContentResponse) -> dict[str, Any]:
+        meta = response.usage_metadata
+        if not meta:
+            return {"input_tokens": 0, "output_tokens": 0}
+        # prompt_token_count 包含缓存命中部分；与 Anthropic 口径一致，缓存读取单独计入 cache_read_input_tokens
+        cached = meta.cached_content_token_count or 0
+        return {
+            "input_tokens": (meta.prompt_token_count or 0) - cached,
+            "output_tokens": meta.candidates_token_count or 0,
+            "cache_read_input_tokens": cached,
+        }
+
+    @staticmethod
+    def _extract_tool_calls(response: types.GenerateContentResponse) -> list[dict[str, Any]]:
         tool_calls = []
         if response.candidates:
             for candidate in response.candidates:
                 if candidate.content and candidate.content.parts:
                     for part in candidate.content.parts:
                         if part.function_call:
-                            tool_calls.append({
+                            # 无参数的调用 args 为 None，统一为空字典以满足 ToolCall 校验
+                            call = {
                                 "name": part.function_call.name,
-                                "parameters": part.function_call.args
-                            })
+                                "parameters": part.function_call.args or {}
+                            }
+                            if part.function_call.id:
+                                call["id"] = part.function_call.id
+                            tool_calls.append(call)
+        return tool_calls
 
-        usage = {
-            "input_tokens": response.usage_metadata.prompt_token_count if response.usage_metadata else 0,
-            "output_tokens": response.usage_metadata.candidates_token_count if response.usage_metadata else 0,
-        }
+    async def generate(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> tuple[str, list[Any], dict[str, Any]]:
+        response = await self._send(self.client.aio.models.generate_content, prompt, image, tools)
+        
+        # 提取原生工具调用
+        tool_calls = self._extract_tool_calls(response)
+        usage = self._extract_usage(response)
         return response.text or "", tool_calls, usage
 
+    async def generate_stream(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> AsyncIterator[StreamChunk]:
+        stream = await self._send(self.client.aio.models.generate_content_stream, prompt, image, tools)
+        usage: dict[str, Any] = {"input_tokens": 0, "output_tokens": 0}
+        index = 0
+        async for chunk in stream:
+            if chunk.text:
+                yield StreamChunk(type="text", text=chunk.text)
+            # Gemini 以完整对象下发 function_call，无需拼接参数
+            for call in self._extract_tool_calls(chunk):
+                yield StreamChunk(
+                    type="tool_call", index=index, tool_call_id=call.get("id"), tool_name=call["name"], parameters=call["parameters"]
+                )
+                index += 1
+            if chunk.usage_metadata:
+                usage = self._extract_usage(chunk)
+        yield StreamChunk(type="usage", usage=usage)
+
 class MagicModelInfo:
     def __init__(self, has_vision: bool, has_thinking: bool, has_tools: bool):
         self._has_vision = has_vision
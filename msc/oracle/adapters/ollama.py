@@ -1,6 +1,7 @@
 from typing import Any
 
 from msc.oracle.adapters.openai import OpenAIAdapter
+from msc.oracle.transport import get_transport
 
 
 class OllamaAdapter(OpenAIAdapter):
@@ -14,6 +15,8 @@ class OllamaAdapter(OpenAIAdapter):
         has_vision: bool = False,
         has_thinking: bool = False,
         has_tools: bool = False,
+        *,
+        keep_alive: str = "30m",
         **kwargs: Any
     ):
         actual_base_url = base_url or "http://localhost:11434/v1"
@@ -29,3 +32,13 @@ class OllamaAdapter(OpenAIAdapter):
             has_tools=has_tools,
             **kwargs
         )
+        self.keep_alive = keep_alive
+
+    async def probe(self) -> None:
+        """预热探测：通过原生 /api/generate 让本地服务预加载模型 (空 prompt 只加载不生成)，并以 keep_alive 保持驻留"""
+        root = str(self.client.base_url).rstrip("/").removesuffix("/v1")
+        response = await get_transport().client().post(
+            f"{root}/api/generate",
+            json={"model": self.model_name, "keep_alive": self.keep_alive},
+        )
+        response.raise_for_status()
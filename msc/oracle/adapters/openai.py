@@ -1,7 +1,13 @@
+import json
+from collections.abc import AsyncIterator
 from typing import Any
 
 from openai import AsyncOpenAI
 
+from msc.oracle.messages import as_messages, native_tool_calls, text_of, tool_result_text
+from msc.oracle.stream import StreamChunk
+from msc.oracle.transport import shared_client_kwargs
+
 
 class OpenAIAdapter:
     def __init__(
@@ -15,6 +21,9 @@ class OpenAIAdapter:
         has_thinking: bool = False,
         has_tools: bool = False,
         pricing: dict[str, float] | None = None,
+        *,
+        rate_limits: dict[str, int] | None = None,
+        context_window: int | None = None,
         **kwargs: Any
     ):
         self.name = name
@@ -22,25 +31,72 @@ class OpenAIAdapter:
         self.capabilities = capabilities or []
         self.model_info = MagicModelInfo(has_vision, has_thinking, has_tools)
         self._pricing = pricing or {"input_1m": 0.0, "output_1m": 0.0}
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, **kwargs)
+        self.rate_limits = rate_limits or {}
+        self.context_window = context_window
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, **shared_client_kwargs(kwargs))
 
     @property
     def pricing(self) -> dict[str, float]:
         return self._pricing
 
-    async def generate(self, prompt: str, image: str | None = None) -> tuple[str, list[Any], dict[str, Any]]:
-        content: list[dict[str, Any]] = [{"type": "text", "text": prompt}]
+    def _build_messages(self, prompt: Any, image: str | None) -> list[dict[str, Any]]:
+        """按角色保留消息结构；原生工具调用以 assistant.tool_calls / tool 消息回传"""
+        source = as_messages(prompt)
+        declared = native_tool_calls(source)
+        messages: list[dict[str, Any]] = []
+        for msg in source:
+            role = msg.get("role")
+            if role == "assistant" and msg.get("tool_calls"):
+                messages.append({
+                    "role": "assistant",
+                    "content": text_of(msg) or None,
+                    "tool_calls": [
+                        {
+                            "id": call["id"],
+                            "type": "function",
+                            "function": {"name": call["name"], "arguments": json.dumps(call.get("parameters", {}), ensure_ascii=False)},
+                        }
+                        for call in msg["tool_calls"]
+                    ],
+                })
+            elif role == "tool" and msg.get("tool_call_id") in declared:
+                messages.append({"role": "tool", "tool_call_id": msg["tool_call_id"], "content": text_of(msg)})
+            elif role == "tool":
+                # 文本解析的工具调用没有对应的 tool_calls，以用户消息形式回传观测结果
+                messages.append({"role": "user", "content": tool_result_text(msg)})
+            else:
+                messages.append({"role": role if role in ("system", "user", "assistant") else "user", "content": text_of(msg)})
+
         if image and self.model_info.has_vision:
-            content.append({
-                "type": "image_url",
-                "image_url": {"url": image}
-            })
+            last = next((m for m in reversed(messages) if m["role"] == "user"), None)
+            if last is None:
+                last = {"role": "user", "content": ""}
+                messages.append(last)
+            last["content"] = [
+                {"type": "text", "text": last["content"]},
+                {"type": "image_url", "image_url": {"url": image}},
+            ]
+        return messages
+
+    async def probe(self) -> None:
+        """预热探测：轻量请求 /models 以建立连接 (DNS/TLS) 并确认端点可达，不重试"""
+        await self.client.with_options(max_retries=0).models.list()
+
+    @staticmethod
+    def _build_tools(tools: list[dict[str, Any]] | None) -> dict[str, Any]:
+        if not tools:
+            return {}
+        return {"tools": [{"type": "function", "function": tool} for tool in tools]}
 
+    async def generate(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> tuple[str, list[Any], dict[str, Any]]:
         from openai.types.chat import ChatCompletion
         response = await self.client.chat.completions.create(
             model=self.model_name,
-            messages=[{"role": "user", "content": content}],  # type: ignore
-            stream=False
+            messages=self._build_messages(prompt, image),  # type: ignore
+            stream=False,
+            **self._build_tools(tools)
         )
         if isinstance(response, ChatCompletion):
             usage = {
@@ -54,8 +110,8 @@ class OpenAIAdapter:
             if hasattr(msg, "tool_calls") and msg.tool_calls:
                 for tc in msg.tool_calls:
                     try:
-                        import json
                         tool_calls.append({
+                            "id": tc.id,
                             "name": tc.function.name,
                             "parameters": json.loads(tc.function.arguments)
                         })
@@ -65,6 +121,38 @@ class OpenAIAdapter:
             return msg.content or "", tool_calls, usage
         return "", [], {}
 
+    async def generate_stream(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> AsyncIterator[StreamChunk]:
+        stream = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._build_messages(prompt, image),  # type: ignore
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._build_tools(tools)
+        )
+        usage: dict[str, Any] = {"input_tokens": 0, "output_tokens": 0}
+        async for chunk in stream:
+            if chunk.usage:
+                usage = {
+                    "input_tokens": chunk.usage.prompt_tokens,
+                    "output_tokens": chunk.usage.completion_tokens,
+                }
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                yield StreamChunk(type="text", text=delta.content)
+            for tc in delta.tool_calls or []:
+                yield StreamChunk(
+                    type="tool_call",
+                    index=tc.index,
+                    tool_call_id=tc.id,
+                    tool_name=tc.function.name if tc.function else None,
+                    arguments=(tc.function.arguments or "") if tc.function else "",
+                )
+        yield StreamChunk(type="usage", usage=usage)
+
 class MagicModelInfo:
     def __init__(self, has_vision: bool, has_thinking: bool, has_tools: bool):
         self._has_vision = has_vision
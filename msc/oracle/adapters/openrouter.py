@@ -1,8 +1,7 @@
 from typing import Any
 
-import httpx
-
 from msc.oracle.adapters.openai import OpenAIAdapter
+from msc.oracle.catalog import ModelCatalog, get_catalog
 
 
 class OpenRouterAdapter(OpenAIAdapter):
@@ -17,6 +16,8 @@ class OpenRouterAdapter(OpenAIAdapter):
         has_thinking: bool = False,
         has_tools: bool = False,
         pricing: dict[str, float] | None = None,
+        *,
+        catalog: ModelCatalog | None = None,
         **kwargs: Any
     ):
         actual_base_url = base_url or "https://openrouter.ai/api/v1"
@@ -32,31 +33,28 @@ class OpenRouterAdapter(OpenAIAdapter):
             **kwargs
         )
         self._pricing: dict[str, float] = pricing or {"input_1m": 0.0, "output_1m": 0.0}
+        self.catalog = catalog
 
     @property
     def pricing(self) -> dict[str, float]:
         return self._pricing
 
     async def refresh_pricing(self) -> None:
+        # 通过进程级共享目录获取价格，多个实例只下载一次 /models
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get("https://openrouter.ai/api/v1/models")
-                if response.status_code == 200:
-                    data = response.json().get("data", [])
-                    for m in data:
-                        if m.get("id") == self.model_name:
-                            p = m.get("pricing", {})
-                            self.pricing["input_1m"] = round(float(p.get("prompt", 0)) * 1000000, 4)
-                            self.pricing["output_1m"] = round(float(p.get("completion", 0)) * 1000000, 4)
-                            break
+            catalog = self.catalog or get_catalog()
+            await catalog.refresh()
+            catalog.apply_to(self, override=True)
         except Exception:
             pass
 
-    async def generate(self, prompt: str, image: str | None = None) -> tuple[str, list[Any], dict[str, Any]]:
+    async def generate(
+        self, prompt: Any, image: str | None = None, tools: list[dict[str, Any]] | None = None
+    ) -> tuple[str, list[Any], dict[str, Any]]:
         # OpenRouter normalizes the schema to OpenAI format.
         # However, it also provides a 'generation' endpoint to get detailed cost.
         # For the standard chat completion, we use the base OpenAI logic.
-        text, tool_calls, usage = await super().generate(prompt, image=image)
+        text, tool_calls, usage = await super().generate(prompt, image=image, tools=tools)
         
         # OpenRouter specific: If the response includes 'usage' with 'cost', we should use it.
         # In our current OpenAIAdapter, we only extract tokens.
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class CachedResponse(BaseModel):
+    model_name: str
+    provider: str
+    text: str
+    tool_calls: list[Any]
+    usage: dict[str, Any]
+    created_at: float
+
+
+# 调用方在最后一条消息末尾注入的运行时元数据 (当前时间、Agent ID 等) 以此标题开头。
+# 该段落每次请求都不同，不参与请求键，否则同一任务的请求永远无法命中缓存或合并。
+VOLATILE_HEADING = "## Metadata\n\n"
+
+
+def _stable_prompt(prompt: Any) -> Any:
+    """去掉最后一条消息末尾的运行时元数据段落"""
+    if isinstance(prompt, str):
+        cut = prompt.rfind(VOLATILE_HEADING)
+        return prompt[:cut] if cut >= 0 else prompt
+    if isinstance(prompt, list) and prompt and isinstance(prompt[-1], dict):
+        content = prompt[-1].get("content")
+        if isinstance(content, str) and VOLATILE_HEADING in content:
+            return [*prompt[:-1], {**prompt[-1], "content": _stable_prompt(content)}]
+    return prompt
+
+
+def request_key(
+    model_name: str,
+    prompt: Any,
+    image: str | None = None,
+    require_caps: list[str] | None = None,
+    require_thinking: bool = False,
+    *,
+    tools: list[dict[str, Any]] | None = None,
+) -> str:
+    """对请求进行规范化序列化并计算内容哈希；运行时元数据段落不参与计算"""
+    payload = {
+        "model_name": model_name,
+        "prompt": _stable_prompt(prompt),
+        "image": image,
+        "caps": sorted(require_caps or []),
+        "thinking": require_thinking,
+    }
+    if tools:
+        payload["tools"] = tools
+    canonical = json.dumps(
+        payload,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float | None = 3600.0,
+        storage_dir: str | None = None,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+        exclude_models: list[str] | None = None,
+    ):
+        """
+        内容寻址的响应缓存：内存 LRU + 可选磁盘层 (按总大小淘汰最旧条目)。
+        exclude_models 中的逻辑模型不参与缓存。
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.storage_dir = Path(storage_dir) if storage_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.exclude_models = set(exclude_models or [])
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._disk_index: dict[str, tuple[float, int]] = {}
+        self.hits = 0
+        self.misses = 0
+        if self.storage_dir:
+            self.storage_dir.mkdir(parents=True, exist_ok=True)
+            for path in self.storage_dir.glob("*.json"):
+                stat = path.stat()
+                self._disk_index[path.stem] = (stat.st_mtime, stat.st_size)
+
+    def enabled_for(self, model_name: str) -> bool:
+        return model_name not in self.exclude_models
+
+    def _expired(self, entry: CachedResponse) -> bool:
+        return self.ttl is not None and time.time() - entry.created_at > self.ttl
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = self._read_disk(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self.invalidate(key)
+            self.misses += 1
+            return None
+        self._memory.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(
+        self,
+        key: str,
+        model_name: str,
+        provider: str,
+        *,
+        text: str,
+        tool_calls: list[Any],
+        usage: dict[str, Any],
+    ) -> None:
+        entry = CachedResponse(
+            model_name=model_name,
+            provider=provider,
+            text=text,
+            tool_calls=tool_calls,
+            usage={k: v for k, v in usage.items() if k != "hedge_losers"},
+            created_at=time.time(),
+        )
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def invalidate(self, key: str) -> None:
+        self._memory.pop(key, None)
+        self._drop_disk(key)
+
+    def _drop_disk(self, key: str) -> None:
+        if self.storage_dir and key in self._disk_index:
+            self._disk_index.pop(key)
+            (self.storage_dir / f"{key}.json").unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for key in list(self._disk_index):
+            self.invalidate(key)
+        self._memory.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk_index),
+            "disk_bytes": sum(size for _, size in self._disk_index.values()),
+        }
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> CachedResponse | None:
+        if not self.storage_dir or key not in self._disk_index:
+            return None
+        try:
+            with open(self.storage_dir / f"{key}.json", encoding="utf-8") as f:
+                return CachedResponse(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            self._disk_index.pop(key, None)
+            return None
+
+    def _write_disk(self, key: str, entry: CachedResponse) -> None:
+        if not self.storage_dir:
+            return
+        try:
+            payload = entry.model_dump_json()
+        except ValueError:
+            return
+        path = self.storage_dir / f"{key}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        self._disk_index[key] = (time.time(), len(payload.encode("utf-8")))
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        total = sum(size for _, size in self._disk_index.values())
+        for key, (_, size) in sorted(self._disk_index.items(), key=lambda item: item[1][0]):
+            if total <= self.max_disk_bytes:
+                break
+            self._drop_disk(key)
+            total -= size
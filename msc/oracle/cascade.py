@@ -0,0 +1,40 @@
+import re
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+# 校验回调：(text, tool_calls) → 失败原因；None 表示响应可接受
+ResponseValidator = Callable[[str, list[Any]], str | None]
+
+_CONFIDENCE_RE = re.compile(r"confidence\s*[:=]\s*(\d+(?:\.\d+)?)\s*(%?)", re.I)
+
+
+class CascadeConfig(BaseModel):
+    """级联路由：按 models 顺序 (由廉价到强力) 依次尝试，响应未通过校验时升级到下一级"""
+    models: list[str]
+    min_confidence: float = 0.5
+
+
+class CascadeStats(BaseModel):
+    requests: int = 0
+    # 未由第一级模型完成的请求数
+    escalated: int = 0
+    served: dict[str, int] = Field(default_factory=dict)
+    reasons: dict[str, int] = Field(default_factory=dict)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            **self.model_dump(),
+            "escalation_rate": self.escalated / self.requests if self.requests else 0.0,
+        }
+
+
+def parse_confidence(text: str) -> float | None:
+    """提取模型自报的置信度 (如 "Confidence: 0.4" 或 "confidence=40%")，取最后一次出现"""
+    matches = _CONFIDENCE_RE.findall(text or "")
+    if not matches:
+        return None
+    value, percent = matches[-1]
+    confidence = float(value)
+    return confidence / 100 if percent or confidence > 1 else confidence
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import time
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from msc.oracle.transport import get_transport
+
+OPENROUTER_MODELS_URL = "https://openrouter.ai/api/v1/models"
+DEFAULT_CACHE_PATH = Path.home() / ".msc" / "cache" / "openrouter_models.json"
+
+
+class CatalogUnavailableError(RuntimeError):
+    """无法获取模型目录，且没有可回退的缓存或 fixture 数据"""
+
+
+class ModelEntry(BaseModel):
+    id: str
+    name: str = ""
+    pricing: dict[str, float]
+    context_window: int = 0
+    created: int | None = None
+    description: str = ""
+
+
+def parse_models(data: list[dict[str, Any]]) -> dict[str, ModelEntry]:
+    """将 OpenRouter /models 列表转换为按模型 ID 索引的条目 (价格单位 $/1M tokens)"""
+    models: dict[str, ModelEntry] = {}
+    for m in data:
+        model_id = m.get("id")
+        if not model_id:
+            continue
+        p = m.get("pricing") or {}
+        try:
+            pricing = {
+                "input_1m": round(float(p.get("prompt", 0)) * 1000000, 4),
+                "output_1m": round(float(p.get("completion", 0)) * 1000000, 4),
+            }
+            if p.get("input_cache_read"):
+                pricing["cache_read_1m"] = round(float(p["input_cache_read"]) * 1000000, 4)
+            if p.get("input_cache_write"):
+                pricing["cache_write_1m"] = round(float(p["input_cache_write"]) * 1000000, 4)
+        except (TypeError, ValueError):
+            continue
+        models[model_id] = ModelEntry(
+            id=model_id,
+            name=m.get("name") or model_id,
+            pricing=pricing,
+            context_window=int(m.get("context_length") or 0),
+            created=m.get("created"),
+            description=m.get("description") or "",
+        )
+    return models
+
+
+class ModelCatalog:
+    def __init__(
+        self,
+        url: str = OPENROUTER_MODELS_URL,
+        cache_path: str | Path | None = None,
+        ttl: float = 6 * 3600,
+        fixture_path: str | Path | None = None,
+    ):
+        """
+        共享的模型目录：一次下载、按模型 ID 建立索引，磁盘缓存带 TTL 与 ETag 重新验证。
+        离线时回退到缓存文件或本地 fixture。
+        """
+        self.url = url
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.ttl = ttl
+        self.fixture_path = Path(fixture_path) if fixture_path else None
+        self._models: dict[str, ModelEntry] = {}
+        self._aliases: dict[str, str] = {}
+        self._raw: list[dict[str, Any]] = []
+        self._etag: str | None = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._load_offline()
+
+    @property
+    def is_fresh(self) -> bool:
+        return bool(self._models) and time.time() - self._fetched_at < self.ttl
+
+    def get(self, model_id: str) -> ModelEntry | None:
+        entry = self._models.get(model_id)
+        if entry is None and model_id in self._aliases:
+            entry = self._models.get(self._aliases[model_id])
+        return entry
+
+    def models(self) -> list[ModelEntry]:
+        return list(self._models.values())
+
+    async def refresh(self, force: bool = False) -> None:
+        """
+        下载或重新验证目录。离线或服务端出错时沿用已加载的缓存数据；
+        没有任何可用数据时抛出 CatalogUnavailableError。
+        """
+        # 并发调用共享同一次下载
+        async with self._lock:
+            if self.is_fresh and not force:
+                return
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            try:
+                response = await get_transport().client().get(self.url, headers=headers)
+            except Exception as e:
+                if not self._models:
+                    raise CatalogUnavailableError(f"Failed to fetch {self.url}: {e}") from e
+                return
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                self._fetched_at = time.time()
+                self._save()
+                return
+            if response.status_code != HTTPStatus.OK:
+                if not self._models:
+                    raise CatalogUnavailableError(f"Failed to fetch {self.url}: HTTP {response.status_code}")
+                return
+            etag = response.headers.get("etag")
+            self._index(response.json().get("data", []))
+            self._etag = etag if isinstance(etag, str) else None
+            self._fetched_at = time.time()
+            self._save()
+
+    def apply_to(self, adapter: Any, override: bool = False) -> bool:
+        """
+        为适配器填充价格与上下文窗口。override=False 时不覆盖手动配置的非零价格；
+        上下文窗口只在未配置时填充，override 不影响手动配置的窗口。
+        """
+        entry = self.get(adapter.model_name)
+        if entry is None:
+            return False
+        pricing = adapter.pricing
+        for key, value in entry.pricing.items():
+            if override or not pricing.get(key):
+                pricing[key] = value
+        if entry.context_window and not getattr(adapter, "context_window", None):
+            adapter.context_window = entry.context_window
+        return True
+
+    def _index(self, data: list[dict[str, Any]]) -> None:
+        self._raw = data
+        self._models = parse_models(data)
+        # 直连 Provider 的模型 ID 通常不带 vendor 前缀 (如 "claude-3.5-sonnet")
+        self._aliases = {}
+        for model_id in self._models:
+            self._aliases.setdefault(model_id.split("/", 1)[-1], model_id)
+
+    def _load_offline(self) -> None:
+        for path in (self.cache_path, self.fixture_path):
+            if path is None or not path.exists():
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._index(payload.get("data", []))
+            if path == self.cache_path:
+                self._etag = payload.get("etag")
+                self._fetched_at = float(payload.get("fetched_at", 0.0))
+            return
+
+    def _save(self) -> None:
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"etag": self._etag, "fetched_at": self._fetched_at, "data": self._raw}
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+# 进程级共享目录，默认使用磁盘缓存；置于容器中，configure_catalog 替换时无需 global 声明
+_shared: dict[str, ModelCatalog] = {"catalog": ModelCatalog(cache_path=DEFAULT_CACHE_PATH)}
+
+
+def get_catalog() -> ModelCatalog:
+    return _shared["catalog"]
+
+
+def configure_catalog(**kwargs: Any) -> ModelCatalog:
+    """替换进程级共享目录；未指定 cache_path 时使用 DEFAULT_CACHE_PATH，传入 None 关闭磁盘缓存"""
+    kwargs.setdefault("cache_path", DEFAULT_CACHE_PATH)
+    catalog = _shared["catalog"] = ModelCatalog(**kwargs)
+    return catalog
@@ -0,0 +1,18 @@
+from typing import Any
+
+
+class BudgetExceededError(ValueError):
+    """所有候选 Provider 的预估费用均超出剩余 Gas 预算"""
+
+
+def provider_pricing(provider: Any) -> dict[str, float]:
+    pricing = getattr(provider, "pricing", None)
+    return pricing if isinstance(pricing, dict) else {}
+
+
+def estimate_cost(pricing: dict[str, float], input_tokens: int, output_tokens: int) -> float:
+    """按 $/1M tokens 价格估算一次请求的费用 (与 Session 的 Gas 计费口径一致)"""
+    return (
+        input_tokens * pricing.get("input_1m", 0)
+        + output_tokens * pricing.get("output_1m", 0)
+    ) / 1_000_000
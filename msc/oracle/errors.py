@@ -0,0 +1,132 @@
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from enum import StrEnum
+from http import HTTPStatus
+
+import httpx
+from pydantic import BaseModel
+
+from msc.oracle.tokens import ContextWindowExceededError
+
+
+class ErrorKind(StrEnum):
+    TRANSIENT = "transient"
+    RATE_LIMITED = "rate_limited"
+    CONTEXT_OVERFLOW = "context_overflow"
+    AUTH = "auth"
+    # Provider 侧的问题 (如 404 模型不存在)：不重试，转移到下一个候选者
+    UNAVAILABLE = "unavailable"
+    # 请求本身不合法 (非上下文溢出的 400)：换 Provider 也不会成功，立即失败
+    FATAL = "fatal"
+    # 无法识别的异常：保持原有语义，直接故障转移而不重试
+    UNKNOWN = "unknown"
+
+
+class ClassifiedError(BaseModel):
+    kind: ErrorKind
+    status_code: int | None = None
+    retry_after: float | None = None
+
+
+_CONTEXT_OVERFLOW_RE = re.compile(
+    r"context[ _-]?(length|window)|maximum context|too many tokens|prompt is too long|token limit|input is too long",
+    re.I,
+)
+# SDK 的连接/超时异常 (openai / anthropic 的 APIConnectionError、APITimeoutError 等)
+_CONNECTION_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+_TRANSIENT_STATUSES = {HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.CONFLICT, HTTPStatus.TOO_EARLY}
+
+
+def _status_code(exc: BaseException) -> int | None:
+    # openai / anthropic: status_code；google-genai: code；httpx: response.status_code
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After (秒数或 HTTP 日期)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers is None or not hasattr(headers, "get"):
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if isinstance(retry_after_ms, str):
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    return parse_retry_after(retry_after) if isinstance(retry_after, str) else None
+
+
+def classify_error(exc: BaseException) -> ClassifiedError:
+    """将各 SDK 抛出的异常归类，决定重试、故障转移或立即失败"""
+    if isinstance(exc, ContextWindowExceededError):
+        return ClassifiedError(kind=ErrorKind.CONTEXT_OVERFLOW)
+
+    status = _status_code(exc)
+    if status is not None:
+        if status == HTTPStatus.TOO_MANY_REQUESTS:
+            return ClassifiedError(kind=ErrorKind.RATE_LIMITED, status_code=status, retry_after=_retry_after(exc))
+        if status in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+            return ClassifiedError(kind=ErrorKind.AUTH, status_code=status)
+        if status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE or (
+            status == HTTPStatus.BAD_REQUEST and _CONTEXT_OVERFLOW_RE.search(str(exc))
+        ):
+            return ClassifiedError(kind=ErrorKind.CONTEXT_OVERFLOW, status_code=status)
+        if status in _TRANSIENT_STATUSES or status >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            return ClassifiedError(kind=ErrorKind.TRANSIENT, status_code=status, retry_after=_retry_after(exc))
+        if status == HTTPStatus.BAD_REQUEST:
+            return ClassifiedError(kind=ErrorKind.FATAL, status_code=status)
+        if status == HTTPStatus.NOT_FOUND:
+            return ClassifiedError(kind=ErrorKind.UNAVAILABLE, status_code=status)
+
+    if isinstance(exc, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return ClassifiedError(kind=ErrorKind.TRANSIENT)
+    if any(cls.__name__ in _CONNECTION_ERROR_NAMES for cls in type(exc).__mro__):
+        return ClassifiedError(kind=ErrorKind.TRANSIENT)
+    return ClassifiedError(kind=ErrorKind.UNKNOWN)
+
+
+class RetryPolicy(BaseModel):
+    """
+    同一 Provider 上的重试策略：指数退避 + full jitter，优先遵循服务端的 Retry-After。
+    Retry-After 超过 max_retry_after 时不再等待，直接转移到下一个候选者。
+    """
+    max_retries: int = 2
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    max_retry_after: float = 30.0
+
+    def delay(self, error: ClassifiedError, attempt: int) -> float | None:
+        """返回第 attempt 次重试 (从 0 开始) 前的等待秒数；None 表示不应在同一 Provider 上重试"""
+        if error.kind not in (ErrorKind.TRANSIENT, ErrorKind.RATE_LIMITED) or attempt >= self.max_retries:
+            return None
+        if error.retry_after is not None:
+            return error.retry_after if error.retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def counts_against_provider(error: ClassifiedError) -> bool:
+    """请求本身的问题 (参数错误 / 超出上下文) 不应计入 Provider 健康度"""
+    return error.kind not in (ErrorKind.FATAL, ErrorKind.CONTEXT_OVERFLOW)
+
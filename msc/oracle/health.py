@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from enum import StrEnum
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class BreakerState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class ProviderStats(BaseModel):
+    ewma_latency: float | None = None
+    error_rate: float = 0.0
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    state: BreakerState = BreakerState.CLOSED
+    opened_at: float | None = None
+    last_updated: float = 0.0
+
+
+class HealthTracker:
+    def __init__(
+        self,
+        *,
+        alpha: float = 0.2,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        error_penalty: float = 4.0,
+        storage_path: str | None = None,
+        persist_interval: float = 30.0,
+    ):
+        """
+        Provider 健康度追踪：EWMA 延迟、EWMA 错误率与三态熔断器 (closed/open/half-open)。
+        storage_path 非空时统计数据会持久化到磁盘，重启后用于热启动排序。
+        """
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.error_penalty = error_penalty
+        self.storage_path = Path(storage_path) if storage_path else None
+        self.persist_interval = persist_interval
+        self._stats: dict[str, ProviderStats] = {}
+        self._probing: set[str] = set()
+        self._last_saved = 0.0
+        self.load()
+
+    def get(self, name: str) -> ProviderStats:
+        return self._stats.setdefault(name, ProviderStats())
+
+    def allow(self, name: str) -> bool:
+        """判断是否允许向该 Provider 发起请求；冷却结束的 open 熔断器转入 half-open 并放行一次探测。"""
+        stats = self.get(name)
+        if stats.state == BreakerState.CLOSED:
+            return True
+        if stats.state == BreakerState.OPEN:
+            if stats.opened_at is not None and time.time() - stats.opened_at < self.cooldown:
+                return False
+            stats.state = BreakerState.HALF_OPEN
+        if name in self._probing:
+            return False
+        self._probing.add(name)
+        return True
+
+    def record_success(self, name: str, latency: float) -> None:
+        stats = self.get(name)
+        stats.ewma_latency = latency if stats.ewma_latency is None else (
+            self.alpha * latency + (1 - self.alpha) * stats.ewma_latency
+        )
+        stats.error_rate = (1 - self.alpha) * stats.error_rate
+        stats.successes += 1
+        stats.consecutive_failures = 0
+        stats.state = BreakerState.CLOSED
+        stats.opened_at = None
+        self._touch(name, stats)
+
+    def record_failure(self, name: str) -> None:
+        stats = self.get(name)
+        stats.error_rate = self.alpha + (1 - self.alpha) * stats.error_rate
+        stats.failures += 1
+        stats.consecutive_failures += 1
+        if stats.state == BreakerState.HALF_OPEN or stats.consecutive_failures >= self.failure_threshold:
+            stats.state = BreakerState.OPEN
+            stats.opened_at = time.time()
+        self._touch(name, stats)
+
+    def release(self, name: str) -> None:
+        """释放 half-open 探测名额 (例如请求被取消，既非成功也非失败)。"""
+        self._probing.discard(name)
+
+    def score(self, name: str) -> float:
+        stats = self.get(name)
+        latency = stats.ewma_latency if stats.ewma_latency is not None else 0.0
+        return latency * (1 + self.error_penalty * stats.error_rate) + stats.error_rate
+
+    def rank(self, names: list[str]) -> list[str]:
+        # 稳定排序：健康度相同 (如均无历史数据) 时保持配置中的优先级顺序
+        return sorted(names, key=lambda n: (self.get(n).state == BreakerState.HALF_OPEN, self.score(n)))
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {
+            name: {**stats.model_dump(mode="json"), "score": self.score(name)}
+            for name, stats in self._stats.items()
+        }
+
+    def _touch(self, name: str, stats: ProviderStats) -> None:
+        self._probing.discard(name)
+        stats.last_updated = time.time()
+        if self.storage_path and time.time() - self._last_saved >= self.persist_interval:
+            self.save()
+
+    def persist_to(self, storage_path: str) -> None:
+        """为运行中的追踪器指定存储路径并从中热启动；内存中已有的统计优先"""
+        current = self._stats
+        self.storage_path = Path(storage_path)
+        self.load()
+        self._stats.update(current)
+
+    def save(self) -> None:
+        if not self.storage_path:
+            return
+        self.storage_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {name: stats.model_dump(mode="json") for name, stats in self._stats.items()}
+        tmp_path = self.storage_path.with_suffix(self.storage_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.storage_path)
+        self._last_saved = time.time()
+
+    def load(self) -> None:
+        if not self.storage_path or not self.storage_path.exists():
+            return
+        try:
+            with open(self.storage_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._stats = {name: ProviderStats(**raw) for name, raw in data.items()}
+        except (OSError, ValueError, TypeError):
+            self._stats = {}
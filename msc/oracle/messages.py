@@ -0,0 +1,40 @@
+from typing import Any
+
+
+def as_messages(prompt: Any) -> list[dict[str, Any]]:
+    """统一 prompt 形态：纯文本视为单条 user 消息"""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
+
+
+def text_of(msg: dict[str, Any]) -> str:
+    content = msg.get("content")
+    if content is None:
+        return ""
+    return content if isinstance(content, str) else str(content)
+
+
+def split_system(messages: list[dict[str, Any]]) -> tuple[str | None, list[dict[str, Any]]]:
+    """拆出首条 system 消息，作为 Provider 的原生 system 参数"""
+    if messages and messages[0].get("role") == "system":
+        return text_of(messages[0]), messages[1:]
+    return None, messages
+
+
+def native_tool_calls(messages: list[dict[str, Any]]) -> dict[str, str]:
+    """
+    返回 assistant 消息中以原生方式发起的工具调用 (id → 工具名)。
+    只有这些调用对应的 tool 消息可以以原生 tool result 回传，文本解析出的调用需退化为 user 文本。
+    """
+    calls: dict[str, str] = {}
+    for msg in messages:
+        if msg.get("role") == "assistant":
+            for call in msg.get("tool_calls") or []:
+                if call.get("id"):
+                    calls[call["id"]] = call.get("name", "")
+    return calls
+
+
+def tool_result_text(msg: dict[str, Any]) -> str:
+    return f"Tool result ({msg.get('tool_call_id', 'unknown')}):\n{text_of(msg)}"
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        # asyncio.Lock 按 FIFO 唤醒等待者，保证排队公平
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_sec)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_sec)
+                self._refill()
+            self.tokens -= amount
+
+    def debit(self, amount: float) -> None:
+        """事后按实际用量补扣 (允许负余额，后续请求将等待更久)"""
+        self._refill()
+        self.tokens -= amount
+
+
+class ProviderLimiter:
+    def __init__(self, rpm: int | None = None, tpm: int | None = None, max_in_flight: int | None = None):
+        """单个 Provider 的 RPM/TPM 令牌桶与并发上限，超额请求排队而非报错"""
+        self.requests = TokenBucket(rpm, rpm / 60) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm / 60) if tpm else None
+        self.in_flight = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.active = 0
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int = 0) -> AsyncIterator[None]:
+        started = time.monotonic()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        acquired = False
+        try:
+            if self.in_flight is not None:
+                await self.in_flight.acquire()
+                acquired = True
+            if self.requests is not None:
+                await self.requests.acquire(1)
+            if self.tokens is not None and estimated_tokens:
+                await self.tokens.acquire(estimated_tokens)
+        except BaseException:
+            if acquired and self.in_flight is not None:
+                self.in_flight.release()
+            raise
+        finally:
+            self.queue_depth -= 1
+        wait = time.monotonic() - started
+        self.total_requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self.in_flight is not None:
+                self.in_flight.release()
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        if self.tokens is not None and actual_tokens > estimated_tokens:
+            self.tokens.debit(actual_tokens - estimated_tokens)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.active,
+            "requests": self.total_requests,
+            "avg_wait": self.total_wait / self.total_requests if self.total_requests else 0.0,
+            "max_wait": self.max_wait,
+        }
+
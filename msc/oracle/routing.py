@@ -0,0 +1,87 @@
+from typing import Any
+
+VISION = 1 << 0
+THINKING = 1 << 1
+TOOLS = 1 << 2
+
+
+class RoutingIndex:
+    def __init__(self, providers: list[Any] | None = None):
+        """
+        预计算的路由索引：model_name → [(provider, mask)]。
+        能力标签与 vision/thinking/tools 标志被打包为位掩码，候选查询退化为一次字典命中加掩码测试。
+        """
+        self._cap_bits: dict[str, int] = {}
+        self._entries: dict[str, list[tuple[Any, int]]] = {}
+        for provider in providers or []:
+            self.add(provider)
+
+    def _cap_bit(self, cap: str) -> int:
+        bit = self._cap_bits.get(cap)
+        if bit is None:
+            bit = 1 << (len(self._cap_bits) + 3)
+            self._cap_bits[cap] = bit
+        return bit
+
+    def provider_mask(self, provider: Any) -> int:
+        info = provider.model_info
+        mask = 0
+        if info.has_vision:
+            mask |= VISION
+        if info.has_thinking:
+            mask |= THINKING
+        if getattr(info, "has_tools", False):
+            mask |= TOOLS
+        for cap in provider.capabilities:
+            mask |= self._cap_bit(cap)
+        return mask
+
+    def required_mask(self, require_caps: list[str] | None, image: bool, require_thinking: bool) -> int | None:
+        """计算请求所需掩码；若要求了任何 Provider 都未声明的能力标签则返回 None"""
+        mask = 0
+        for cap in require_caps or []:
+            bit = self._cap_bits.get(cap)
+            if bit is None:
+                return None
+            mask |= bit
+        if image:
+            mask |= VISION
+        if require_thinking:
+            mask |= THINKING
+        if "tool" in (require_caps or []):
+            mask |= TOOLS
+        return mask
+
+    def add(self, provider: Any) -> None:
+        self._entries.setdefault(provider.model_name, []).append((provider, self.provider_mask(provider)))
+
+    def remove(self, provider: Any) -> None:
+        for model_name, entries in list(self._entries.items()):
+            remaining = [(p, m) for p, m in entries if p is not provider]
+            if remaining:
+                self._entries[model_name] = remaining
+            else:
+                del self._entries[model_name]
+
+    def rebuild(self, providers: list[Any]) -> None:
+        self._entries.clear()
+        for provider in providers:
+            self.add(provider)
+
+    def lookup(
+        self,
+        model_name: str,
+        require_caps: list[str] | None = None,
+        image: bool = False,
+        require_thinking: bool = False,
+    ) -> list[Any]:
+        entries = self._entries.get(model_name)
+        if not entries:
+            return []
+        required = self.required_mask(require_caps, image, require_thinking)
+        if required is None:
+            return []
+        return [provider for provider, mask in entries if mask & required == required]
+
+    def model_names(self) -> list[str]:
+        return list(self._entries)
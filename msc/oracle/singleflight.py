@@ -0,0 +1,52 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        """
+        合并相同键的并发请求：同一时刻只有一个上游调用 (leader)，其余调用者等待并共享其结果。
+        上游调用在独立任务中运行，个别调用者被取消不会影响其他等待者；
+        最后一个等待者离开时取消上游调用，避免无人计费的请求继续运行。
+        """
+        self._inflight: dict[str, asyncio.Task[Any]] = {}
+        self._waiters: dict[str, int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """返回 (结果, 是否为合并调用)；上游异常会传播给所有等待者"""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        finally:
+            self._waiters[key] -= 1
+            if self._waiters[key] == 0:
+                del self._waiters[key]
+                if not task.done():
+                    # 先移出 in-flight 表，使随后的同键请求发起新的上游调用而非加入被取消的任务
+                    self._forget(key, task)
+                    task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task[Any]) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时避免 "exception was never retrieved"
+        if task.done() and not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, Any]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
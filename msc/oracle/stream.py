@@ -0,0 +1,59 @@
+import json
+from collections.abc import AsyncIterator
+from typing import Any, Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class StreamChunk(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    type: Literal["text", "tool_call", "usage"]
+    text: str = ""
+    # tool_call 片段：同一 index 的片段按顺序拼接 arguments
+    index: int = 0
+    tool_call_id: str | None = None
+    tool_name: str | None = None
+    arguments: str = ""
+    parameters: dict[str, Any] | None = None
+    usage: dict[str, Any] = Field(default_factory=dict)
+    provider: Any = Field(default=None, exclude=True)
+
+
+async def collect_stream(
+    chunks: AsyncIterator[StreamChunk],
+) -> tuple[str, list[Any], dict[str, Any], Any]:
+    """将流式片段还原为 generate 的返回结构 (text, tool_calls, usage, provider)"""
+    text_parts: list[str] = []
+    calls: dict[int, dict[str, Any]] = {}
+    usage: dict[str, Any] = {}
+    provider: Any = None
+    async for chunk in chunks:
+        if chunk.type == "text":
+            text_parts.append(chunk.text)
+        elif chunk.type == "tool_call":
+            call = calls.setdefault(chunk.index, {"name": "", "arguments": "", "parameters": None})
+            if chunk.tool_name:
+                call["name"] = chunk.tool_name
+            if chunk.tool_call_id:
+                call["id"] = chunk.tool_call_id
+            call["arguments"] += chunk.arguments
+            if chunk.parameters is not None:
+                call["parameters"] = chunk.parameters
+        else:
+            usage.update(chunk.usage)
+            provider = chunk.provider or provider
+
+    tool_calls = []
+    for _, call in sorted(calls.items()):
+        parameters = call["parameters"]
+        if parameters is None:
+            try:
+                parameters = json.loads(call["arguments"] or "{}")
+            except json.JSONDecodeError:
+                continue
+        tool_call = {"name": call["name"], "parameters": parameters}
+        if call.get("id"):
+            tool_call["id"] = call["id"]
+        tool_calls.append(tool_call)
+    return "".join(text_parts), tool_calls, usage, provider
@@ -0,0 +1,78 @@
+import json
+import re
+from collections.abc import Callable
+from typing import Any
+
+
+class ContextWindowExceededError(ValueError):
+    """请求的估算 Token 数超出了所有候选 Provider 的上下文窗口"""
+
+
+# CJK 字符通常各占约 1 个 Token，其余文本按 ~4 字符/Token 估算
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+# 每条消息的角色/分隔符开销 (与 OpenAI chat 格式的经验值一致)
+MESSAGE_OVERHEAD = 4
+
+
+def heuristic_count(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _flatten(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # 多模态 content blocks 仅计入文本部分
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block) for block in content
+        )
+    return json.dumps(content, ensure_ascii=False, default=str)
+
+
+class TokenEstimator:
+    def __init__(self, counter: Callable[[str], int] | None = None, alpha: float = 0.2):
+        """
+        本地 Token 估算器。counter 可替换为任意分词器 (如 tiktoken 的 len(enc.encode(text)))，
+        缺省使用启发式计数。每个 Provider 维护一个由实际 usage 校准的 EWMA 系数。
+        """
+        self.counter = counter or heuristic_count
+        self.alpha = alpha
+        self._ratios: dict[str, float] = {}
+
+    def count(self, prompt: Any) -> int:
+        """未校准的原始估算，支持纯文本或消息列表"""
+        if isinstance(prompt, str):
+            return self.counter(prompt) + 1
+        if isinstance(prompt, list):
+            total = 0
+            for msg in prompt:
+                if isinstance(msg, dict):
+                    total += MESSAGE_OVERHEAD + self.counter(_flatten(msg.get("content", "")))
+                else:
+                    total += self.counter(_flatten(msg))
+            return total + 1
+        return self.counter(_flatten(prompt)) + 1
+
+    def ratio(self, provider_name: str) -> float:
+        return self._ratios.get(provider_name, 1.0)
+
+    def scale(self, raw: int, provider_name: str) -> int:
+        return int(raw * self.ratio(provider_name) + 0.5)
+
+    def estimate(self, prompt: Any, provider_name: str | None = None) -> int:
+        raw = self.count(prompt)
+        return raw if provider_name is None else self.scale(raw, provider_name)
+
+    def calibrate(self, provider_name: str, estimated_raw: int, actual_input_tokens: int) -> None:
+        """以 Provider 报告的 input_tokens 校准系数 (estimated_raw 为未校准估算值)"""
+        if estimated_raw <= 0 or actual_input_tokens <= 0:
+            return
+        observed = actual_input_tokens / estimated_raw
+        previous = self._ratios.get(provider_name)
+        self._ratios[provider_name] = (
+            observed if previous is None else (1 - self.alpha) * previous + self.alpha * observed
+        )
+
+    def snapshot(self) -> dict[str, float]:
+        return dict(self._ratios)
@@ -0,0 +1,140 @@
+import asyncio
+import importlib.util
+import weakref
+from typing import Any
+
+import httpx
+from pydantic import BaseModel
+
+
+class TransportConfig(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 600.0
+    http2: bool = True
+    proxy: str | None = None
+    trust_env: bool = True
+
+
+class _LoopBoundClient(httpx.AsyncClient):
+    """
+    交给 SDK 客户端的代理：每次发送时转发到当前事件循环的连接池。
+    连接绑定于创建它的事件循环，多次 asyncio.run 或 pytest 的逐测试事件循环各自使用独立的池；
+    aclose 为空操作，连接池的生命周期由 TransportManager 管理。
+    """
+
+    def __init__(self, manager: "TransportManager") -> None:
+        super().__init__()
+        self._manager = manager
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await self._manager.client().send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        return None
+
+
+class TransportManager:
+    def __init__(self, config: TransportConfig | None = None) -> None:
+        """
+        进程级共享 HTTP 传输层：所有 Provider 适配器复用 keep-alive 连接池，
+        避免每个实例各自进行 DNS/TLS 握手。h2 可用时启用 HTTP/2。
+        连接池按事件循环分别创建 (连接不能跨事件循环复用)，关闭后下次使用时重建。
+        """
+        self.config = config or TransportConfig()
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = (
+            weakref.WeakKeyDictionary()
+        )
+        # 不在事件循环中创建的客户端 (如同步代码中的探测)
+        self._detached: httpx.AsyncClient | None = None
+        self._shared: _LoopBoundClient | None = None
+
+    def configure(self, config: TransportConfig) -> None:
+        if any(not c.is_closed for c in self._live_clients()):
+            raise RuntimeError("Transport already in use; call aclose() before reconfiguring")
+        self.config = config
+        self._clients.clear()
+        self._detached = None
+
+    def _live_clients(self) -> list[httpx.AsyncClient]:
+        clients = list(self._clients.values())
+        if self._detached is not None:
+            clients.append(self._detached)
+        return clients
+
+    @property
+    def http2_enabled(self) -> bool:
+        return self.config.http2 and importlib.util.find_spec("h2") is not None
+
+    def shared_client(self) -> httpx.AsyncClient:
+        """供 SDK 构造函数使用的长期句柄：不随事件循环或 aclose 失效"""
+        if self._shared is None:
+            self._shared = _LoopBoundClient(self)
+        return self._shared
+
+    def client(self) -> httpx.AsyncClient:
+        """返回当前事件循环的连接池，首次使用或已关闭时创建"""
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        client = self._clients.get(loop) if loop is not None else self._detached
+        if client is None or client.is_closed:
+            client = self._create()
+            if loop is not None:
+                self._clients[loop] = client
+            else:
+                self._detached = client
+        return client
+
+    def _create(self) -> httpx.AsyncClient:
+        cfg = self.config
+        return httpx.AsyncClient(
+            http2=self.http2_enabled,
+            limits=httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(cfg.read_timeout, connect=cfg.connect_timeout),
+            proxy=cfg.proxy,
+            trust_env=cfg.trust_env,
+            follow_redirects=True,
+        )
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环 (及游离) 的连接池；其他事件循环的池若其循环已关闭则直接丢弃"""
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        for owner, client in list(self._clients.items()):
+            if owner is loop:
+                await client.aclose()
+            elif not owner.is_closed():
+                # 属于其他仍在运行的事件循环：只能由该循环关闭
+                continue
+            del self._clients[owner]
+        if self._detached is not None:
+            await self._detached.aclose()
+            self._detached = None
+
+
+_transport = TransportManager()
+
+
+def get_transport() -> TransportManager:
+    return _transport
+
+
+def shared_client_kwargs(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """为 SDK 客户端注入共享连接池，调用方显式传入 http_client 时保持不变"""
+    if "http_client" not in kwargs:
+        kwargs = {**kwargs, "http_client": _transport.shared_client()}
+    return kwargs
+
+
+async def close_transport() -> None:
+    await _transport.aclose()
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock
+
+from msc.core.bridge import ApprovalRequiredEvent, EventBus, LogEvent, SessionUpdateEvent
+from msc.core.og import OrchestrationGateway, Session, SessionStatus
+
+
+def test_subscription_drops_oldest_but_keeps_approvals():
+    """
+    验证队满时丢弃最旧的可丢弃事件，审批请求永不丢弃
+    """
+    bus = EventBus()
+    sub = bus.subscribe(maxsize=2)
+    bus.publish(ApprovalRequiredEvent(request_id="r1", agent_id="a", action="write_file"))
+    bus.publish(LogEvent(agent_id="a", content="one"))
+    bus.publish(LogEvent(agent_id="a", content="two"))
+    bus.publish(ApprovalRequiredEvent(request_id="r2", agent_id="a", action="execute"))
+
+    events = [sub.get_nowait() for _ in range(len(sub))]
+    assert [e.method for e in events] == ["msc/approval_required", "msc/log", "msc/approval_required"]
+    assert events[1].content == "two"
+    assert sub.dropped == 1
+
+
+def test_subscription_drop_newest_and_method_filter():
+    bus = EventBus()
+    sub = bus.subscribe(maxsize=1, policy="drop_newest", methods=["msc/log"])
+    bus.publish(SessionUpdateEvent(agent_id="a", status="running"))
+    bus.publish(LogEvent(agent_id="a", content="first"))
+    bus.publish(LogEvent(agent_id="a", content="second"))
+
+    assert len(sub) == 1
+    assert sub.get_nowait().content == "first"
+    assert sub.dropped == 1
+
+
+def test_subscription_coalesces_deltas_and_status():
+    """
+    验证待投递的流式增量被拼接，状态快照只保留最新一条
+    """
+    bus = EventBus()
+    sub = bus.subscribe()
+    bus.publish(LogEvent(agent_id="a", content="Hel", type="delta"))
+    bus.publish(SessionUpdateEvent(agent_id="a", status="running"))
+    bus.publish(LogEvent(agent_id="a", content="lo", type="delta"))
+    bus.publish(SessionUpdateEvent(agent_id="a", status="completed"))
+
+    events = [sub.get_nowait() for _ in range(len(sub))]
+    assert [e.to_message() for e in events] == [
+        {"method": "msc/log", "params": {"agent_id": "a", "content": "Hello", "type": "delta"}},
+        {"method": "msc/session_update", "params": {"agent_id": "a", "status": "completed", "active_agents": []}},
+    ]
+    assert sub.coalesced == 2
+
+    # 已取出的增量不再参与合并
+    bus.publish(LogEvent(agent_id="a", content="!", type="delta"))
+    assert sub.get_nowait().content == "!"
+
+
+@pytest.mark.asyncio
+async def test_slow_bridge_does_not_block_emit(tmp_path):
+    """
+    验证 Bridge 发送缓慢时 emit 立即返回，积压的增量在送达前被合并
+    """
+    release = asyncio.Event()
+    sent = []
+
+    async def slow_send(message):
+        await release.wait()
+        sent.append(message)
+
+    bridge = AsyncMock()
+    bridge.send_message.side_effect = slow_send
+    og = OrchestrationGateway(bridge=bridge, storage_root=str(tmp_path / "sessions"))
+    for i in range(100):
+        og.emit(LogEvent(agent_id="a", content=str(i % 10), type="delta"))
+    await asyncio.sleep(0)
+    assert og.bus.stats()["subscribers"][0]["depth"] <= 1
+
+    release.set()
+    await og.flush_events()
+    assert "".join(m["params"]["content"] for m in sent) == "0123456789" * 10
+    await og.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_approval_and_abort_round_trip(tmp_path):
+    """
+    验证关闭自动批准后权限请求等待 msc/approve，msc/abort 终止代理并拒绝其待审批请求
+    """
+    bridge = AsyncMock()
+    og = OrchestrationGateway(bridge=bridge, storage_root=str(tmp_path / "sessions"))
+    og.auto_approve = False
+
+    pending = asyncio.create_task(og.request_permission("a", "execute", {"command": "ls"}))
+    await asyncio.sleep(0)
+    await og.flush_events()
+    request = bridge.send_message.call_args.args[0]
+    assert request["method"] == "msc/approval_required"
+    await og.handle_bridge_message({
+        "method": "msc/approve",
+        "params": {"request_id": request["params"]["request_id"], "approved": True}
+    })
+    assert await pending is True
+
+    session = Session(session_id="s", agent_id="a", oracle=AsyncMock(), gateway=og, workspace_root=str(tmp_path))
+    og.agent_registry["a"] = session
+    await session.start()
+    pending = asyncio.create_task(og.request_permission("a", "execute", {"command": "rm -rf build"}))
+    await asyncio.sleep(0)
+    await og.handle_bridge_message({"method": "msc/abort", "params": {"agent_id": "a"}})
+
+    assert await pending is False
+    assert session.status == SessionStatus.FAILED
+    await og.flush_events()
+    updates = [c.args[0] for c in bridge.send_message.call_args_list if c.args[0]["method"] == "msc/session_update"]
+    assert updates[-1]["params"]["status"] == SessionStatus.FAILED.value
+    await og.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_auto_approve_logs_instead_of_requesting_approval(tmp_path):
+    """验证自动批准模式下不向界面发出审批请求，仅记录日志"""
+    bridge = AsyncMock()
+    og = OrchestrationGateway(bridge=bridge, storage_root=str(tmp_path / "sessions"))
+
+    assert await og.request_permission("a", "execute", {"command": "ls"}) is True
+    await og.flush_events()
+    methods = [c.args[0]["method"] for c in bridge.send_message.call_args_list]
+    assert methods == ["msc/log"]
+    await og.shutdown()
@@ -117,3 +117,146 @@ def test_metadata_collection():
     assert os.path.exists(metadata.workspace_root)
     # 验证 gas_used 初始为 0
     assert provider.gas_used == 0.0
+
+def test_context_history_trimmed_to_token_budget(mock_metadata, anamnesis_config):
+    """验证给定 token_budget 时从最早的历史开始裁剪，且不保留孤立的 tool 响应"""
+    factory = ContextFactory(anamnesis_config, mock_metadata)
+    history = [
+        {"role": "user", "content": "old " * 500},
+        {"role": "assistant", "content": "call"},
+        {"role": "tool", "content": "result " * 100, "tool_call_id": "1"},
+        {"role": "assistant", "content": "recent"},
+    ]
+
+    full = factory.build_messages("Task", "Mode", "", "", history, [])
+    budget = factory.estimator.count(full) - factory.estimator.count([history[0]])
+    trimmed = factory.build_messages("Task", "Mode", "", "", history, [], token_budget=budget)
+
+    assert len(trimmed) == len(full) - 3
+    assert trimmed[1]["content"] == "recent"
+    assert factory.estimator.count(trimmed) <= budget
+
+def test_native_tools_drop_textual_samples(mock_metadata, anamnesis_config):
+    """验证原生工具模式下 System Prompt 不再包含文本工具调用示例"""
+    factory = ContextFactory(anamnesis_config, mock_metadata)
+
+    textual = factory.build_messages("Task", "Mode", "", "", [], [])
+    native = factory.build_messages("Task", "Mode", "", "", [], [], native_tools=True)
+
+    assert "Tool Call Samples" in textual[0]["content"]
+    assert "Tool Call Samples" not in native[0]["content"]
+    assert factory.estimator.count(native) < factory.estimator.count(textual)
+
+@pytest.mark.parametrize("use_inotify", [False, True])
+def test_rules_cache_rereads_only_changed_files(tmp_path, use_inotify):
+    """验证规则缓存：未变化时返回同一快照，只重新读取变化的文件，并感知新建的规则目录"""
+    from msc.core.anamnesis.discover import RulesCache
+
+    (tmp_path / "AGENTS.md").write_text("Use tabs.", encoding="utf-8")
+    (tmp_path / "CLAUDE.md").write_text("Be brief.", encoding="utf-8")
+    cache = RulesCache(str(tmp_path), use_inotify=use_inotify)
+    if use_inotify and cache._watcher is None:
+        pytest.skip("inotify unavailable")
+
+    bundle = cache.get()
+    assert bundle.as_dict() == {"AGENTS.md": "Use tabs.", "CLAUDE.md": "Be brief."}
+    assert "### AGENTS.md\n\nUse tabs." in bundle.rendered
+    assert cache.get() is bundle
+    assert cache.reads == 2
+
+    (tmp_path / "AGENTS.md").write_text("Use four spaces.", encoding="utf-8")
+    updated = cache.get()
+    assert updated.as_dict()["AGENTS.md"] == "Use four spaces."
+    assert updated.content_hash != bundle.content_hash
+    assert cache.reads == 3
+
+    rules_dir = tmp_path / ".msc" / "rules"
+    rules_dir.mkdir(parents=True)
+    cache.get()
+    (rules_dir / "style.md").write_text("No globals.", encoding="utf-8")
+    assert cache.get().as_dict()["style.md"] == "No globals."
+
+    (tmp_path / "CLAUDE.md").unlink()
+    assert "CLAUDE.md" not in cache.get().as_dict()
+    cache.close()
+
+def test_gateway_shares_rules_cache_per_workspace(tmp_path):
+    from unittest.mock import MagicMock
+    from msc.core.og import OrchestrationGateway
+
+    og = OrchestrationGateway(bridge=MagicMock(), storage_root=str(tmp_path / "sessions"))
+    assert og.rules_for(str(tmp_path)) is og.rules_for(str(tmp_path / "."))
+    assert og.rules_for(str(tmp_path)) is not og.rules_for(str(tmp_path / "other"))
+
+@pytest.mark.asyncio
+async def test_session_closes_only_its_own_rules_cache(tmp_path):
+    """验证 Session 停止时关闭自建的规则缓存，不关闭网关共享的缓存"""
+    from unittest.mock import MagicMock
+    from msc.core.og import OrchestrationGateway, Session
+
+    og = OrchestrationGateway(bridge=MagicMock(), storage_root=str(tmp_path / "sessions"))
+    shared = Session(session_id="s", agent_id="a", oracle=MagicMock(), gateway=og, workspace_root=str(tmp_path))
+    await shared.start()
+    cache = shared.rules_cache
+    await shared.stop()
+    assert shared.rules_cache is cache is og.rules_for(str(tmp_path))
+
+    own = Session(session_id="s", agent_id="b", oracle=MagicMock(), gateway=None, workspace_root=str(tmp_path))
+    await own.start()
+    cache = own.rules_cache
+    cache.close = MagicMock(wraps=cache.close)
+    await own.stop()
+    cache.close.assert_called_once()
+    assert own.rules_cache is None
+
+def test_runtime_facts_read_proc_and_cache(tmp_path, monkeypatch):
+    """验证终端信息从 /proc 读取而不派生子进程，并在 TTL 内被多个 MetadataProvider 共享"""
+    import subprocess
+    from msc.core.anamnesis.metadata import RuntimeFacts
+
+    proc = tmp_path / "proc"
+    for pid, comm in [("1", "init"), ("42", "bash"), ("43", "python3"), ("self", "bash")]:
+        (proc / pid).mkdir(parents=True)
+        (proc / pid / "comm").write_text(comm + "\n", encoding="utf-8")
+    (proc / "44").mkdir()  # 扫描期间已退出的进程 (comm 不可读)
+
+    def forbid(*args, **kwargs):
+        raise AssertionError("subprocess spawned")
+    monkeypatch.setattr(subprocess, "check_output", forbid)
+
+    facts = RuntimeFacts(ttl=60, proc_root=str(proc))
+    first = MetadataProvider("agent-a", facts=facts).collect()
+    (proc / "45").mkdir()
+    (proc / "45" / "comm").write_text("zsh\n", encoding="utf-8")
+    second = MetadataProvider("agent-b", facts=facts).collect()
+
+    assert first.active_terminals == [{"name": "bash"}]
+    assert second.active_terminals == first.active_terminals
+    assert facts.refreshes == 1
+    assert second.resource_limits["cpu_count"] >= 1
+
+    facts.invalidate()
+    assert MetadataProvider("agent-a", facts=facts).collect().active_terminals == [{"name": "bash"}, {"name": "zsh"}]
+
+    # 工作目录不随共享事实缓存，切换后立即反映在元数据中
+    monkeypatch.chdir(tmp_path)
+    assert MetadataProvider("agent-a", facts=facts).collect().workspace_root == str(tmp_path)
+
+def test_request_key_ignores_runtime_metadata(anamnesis_config):
+    """
+    验证不同 Agent、不同时刻组装的相同任务请求具有相同的请求键 (可命中缓存与合并)，
+    而任务内容不同的请求键不同
+    """
+    from msc.oracle.cache import request_key
+
+    def build(agent_id: str, task: str):
+        metadata = SessionMetadata(agent_id=agent_id, workspace_root=os.getcwd(), start_time=datetime.now())
+        factory = ContextFactory(anamnesis_config, metadata)
+        history = [{"role": "user", "content": task}]
+        return factory.build_messages("Task", "Mode", "", "", history, [])
+
+    first = build("agent-1", "Summarize README")
+    second = build("agent-2", "Summarize README")
+    assert first != second
+    assert request_key("gpt-4", first) == request_key("gpt-4", second)
+    assert request_key("gpt-4", first) != request_key("gpt-4", build("agent-1", "Summarize CHANGELOG"))
@@ -0,0 +1,79 @@
+import os
+from datetime import datetime
+from unittest.mock import patch
+
+from msc.core.anamnesis.context import ContextFactory
+from msc.core.anamnesis.store import MessageStore
+from msc.core.anamnesis.types import AnamnesisConfig, SessionMetadata
+from msc.core.og import Session
+
+
+def test_message_store_indexes_and_since():
+    """验证消息存储的去重索引、role / tool_call_id 索引与按 seq 增量查询"""
+    store = MessageStore([{"role": "system", "content": "sys"}])
+    store.append({"role": "user", "content": "Hello"})
+    store.append({"role": "assistant", "content": "call", "tool_calls": [{"id": "c1"}]})
+    store.append({"role": "tool", "content": "done", "tool_call_id": "c1"})
+
+    assert store == [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "Hello"},
+        {"role": "assistant", "content": "call", "tool_calls": [{"id": "c1"}]},
+        {"role": "tool", "content": "done", "tool_call_id": "c1"},
+    ]
+    assert store.has_content("Hello") and not store.has_content("Bye")
+    assert store.by_role("user") == [{"role": "user", "content": "Hello"}]
+    assert store.by_tool_call_id("c1")["content"] == "done"
+
+    seen = store.last_seq
+    store.append({"role": "user", "content": "Next"})
+    assert store.since(seen) == [{"role": "user", "content": "Next"}]
+    # 切片保留 seq 与 lineage
+    assert store[1:].seq_at(0) == store.seq_at(1)
+    assert store[1:].id_at(0) == store.id_at(1)
+
+
+def test_message_store_reindexes_after_rewrite():
+    """验证非追加修改后重建索引：保留消息原有的 seq 与 id，只为新消息分配新 seq"""
+    store = MessageStore([{"role": "user", "content": "a"}, {"role": "user", "content": "b"}])
+    b_id = store.id_at(1)
+    before = store.last_seq
+    del store[0]
+
+    assert not store.has_content("a")
+    assert store.by_role("user") == [{"role": "user", "content": "b"}]
+    assert store.id_at(0) == b_id
+
+    store.insert(0, {"role": "system", "content": "sys"})
+    assert store.id_at(1) == b_id
+    assert store.seq_at(0) > before
+    # seq 不再沿列表顺序递增时 since 仍按 seq 过滤
+    assert store.since(before) == [{"role": "system", "content": "sys"}]
+    assert store.last_seq == store.seq_at(0)
+
+
+def test_session_history_is_indexed():
+    """验证 Session.history 以列表初始化时转换为消息存储"""
+    session = Session(
+        session_id="s", agent_id="a", oracle=None, gateway=None, workspace_root=".",
+        history=[{"role": "user", "content": "Hello"}]
+    )
+    assert isinstance(session.history, MessageStore)
+    assert session.history.has_content("Hello")
+
+
+def test_context_factory_reuses_per_message_work():
+    """验证 ContextFactory 按 seq 缓存规范化结果，每轮只处理新增消息，且缓存不被下游修改污染"""
+    metadata = SessionMetadata(agent_id="test-agent", workspace_root=os.getcwd(), start_time=datetime.now())
+    factory = ContextFactory(AnamnesisConfig(), metadata)
+    history = MessageStore([{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi"}])
+
+    first = factory.build_messages("Task", "Mode", "", "", history, [], token_budget=100_000)
+    history.append({"role": "user", "content": "More"})
+    with patch("msc.core.anamnesis.context.copy.deepcopy", side_effect=lambda m: dict(m)) as deepcopy:
+        second = factory.build_messages("Task", "Mode", "", "", history, [], token_budget=100_000)
+
+    assert deepcopy.call_count == 1
+    assert second[1:3] == first[1:3]
+    assert second[3]["content"].startswith("More\n\n")
+    assert history[2]["content"] == "More"
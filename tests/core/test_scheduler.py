@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from msc.core.scheduler import AgentPriority, AgentScheduler, TurnSlot
+
+
+@pytest.mark.asyncio
+async def test_scheduler_enforces_global_and_per_parent_limits():
+    """
+    验证同时进行的轮次不超过全局上限，同一父代理的子代理不超过父代理上限
+    """
+    scheduler = AgentScheduler(max_concurrent=3, max_per_parent=2)
+    peak = {"total": 0, "main-agent": 0, "current": 0, "children": 0}
+
+    async def turn(agent_id: str):
+        await scheduler.acquire(agent_id)
+        try:
+            peak["current"] += 1
+            peak["total"] = max(peak["total"], peak["current"])
+            if scheduler.parent_of(agent_id) == "main-agent":
+                peak["children"] += 1
+                peak["main-agent"] = max(peak["main-agent"], peak["children"])
+            await asyncio.sleep(0.01)
+        finally:
+            if scheduler.parent_of(agent_id) == "main-agent":
+                peak["children"] -= 1
+            peak["current"] -= 1
+            scheduler.release(agent_id)
+
+    for i in range(6):
+        scheduler.set_parent(f"agent-{i}", "main-agent" if i < 4 else "agent-0")
+    await asyncio.gather(*(turn(f"agent-{i}") for i in range(6)))
+
+    assert peak["total"] == 3
+    assert peak["main-agent"] == 2
+    assert scheduler.stats()["active_turns"] == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_admits_by_priority():
+    """
+    验证槽位释放后按 主代理 > 高优先级 > 后台子代理 的顺序放行
+    """
+    scheduler = AgentScheduler(max_concurrent=1)
+    await scheduler.acquire("agent-busy")
+    order = []
+
+    async def turn(agent_id: str):
+        await scheduler.acquire(agent_id)
+        order.append(agent_id)
+        scheduler.release(agent_id)
+
+    tasks = [asyncio.create_task(turn(a)) for a in ("agent-bg", "agent-urgent", "main-agent")]
+    await asyncio.sleep(0)
+    scheduler.prioritize("agent-urgent", AgentPriority.HIGH)
+    assert scheduler.stats()["waiting_turns"] == 3
+
+    scheduler.release("agent-busy")
+    await asyncio.gather(*tasks)
+    assert order == ["main-agent", "agent-urgent", "agent-bg"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_tracks_and_cancels_loops():
+    """
+    验证循环句柄可观测、可取消；尚未开始的重复唤醒被合并为同一任务
+    """
+    scheduler = AgentScheduler()
+    started = asyncio.Event()
+
+    async def loop():
+        started.set()
+        await asyncio.sleep(10)
+
+    first = scheduler.spawn("agent-1", loop(), parent="main-agent")
+    duplicate = scheduler.spawn("agent-1", loop())
+    assert duplicate is first
+
+    await started.wait()
+    assert scheduler.snapshot() == [
+        {"agent_id": "agent-1", "parent": "main-agent", "priority": "background", "state": "running", "turns": 0}
+    ]
+    assert scheduler.cancel("agent-1") is True
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert scheduler.handles == {}
+    assert scheduler.cancel("agent-1") is False
+
+
+@pytest.mark.asyncio
+async def test_turn_slot_release_is_idempotent():
+    """验证轮次槽位可提前归还且重复归还不会多释放；无调度器时为空操作"""
+    scheduler = AgentScheduler(max_concurrent=1)
+    slot = TurnSlot(scheduler, "agent-1")
+    await slot.acquire()
+    assert scheduler.stats()["active_turns"] == 1
+    slot.release()
+    slot.release()
+    assert scheduler.stats()["active_turns"] == 0
+
+    noop = TurnSlot(None, "agent-1")
+    await noop.acquire()
+    noop.release()
+    assert noop.held is False
@@ -1,6 +1,7 @@
 import pytest
 import os
 import asyncio
+import json
 from unittest.mock import MagicMock, AsyncMock
 from msc.core.og import OrchestrationGateway, Session, SessionStatus
 from msc.core.anamnesis.session import SessionManager
@@ -24,7 +25,7 @@ async def test_session_lifecycle_and_gas_tracking(mock_oracle, mock_bridge, tmp_
     """
     验证 Session 生命周期管理与 Gas 计费逻辑
     """
-    og = OrchestrationGateway(bridge=mock_bridge)
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
     workspace = str(tmp_path)
     
     session = Session(
@@ -92,7 +93,7 @@ async def test_og_message_routing(mock_bridge, mock_oracle, tmp_path):
     """
     验证 OG 的消息路由逻辑 (msc/chat)
     """
-    og = OrchestrationGateway(bridge=mock_bridge)
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
     workspace = str(tmp_path)
     
     # 预注册一个 Session
@@ -122,3 +123,333 @@ async def test_og_message_routing(mock_bridge, mock_oracle, tmp_path):
         await og.handle_bridge_message(msg)
         # 验证消息已加入历史
         assert any(m.get("content") == "New user message" for m in session.history)
+
+@pytest.mark.asyncio
+async def test_session_streaming_relays_deltas_to_bridge(mock_bridge, tmp_path):
+    """
+    验证流式模式：文本增量实时推送到 Bridge，原生工具调用被还原为 ToolCall 并执行
+    """
+    from msc.oracle.stream import StreamChunk
+
+    provider = MagicMock(pricing={"input_1m": 1.0, "output_1m": 2.0})
+
+    async def fake_stream(**kwargs):
+        yield StreamChunk(type="text", text="Finishing ")
+        yield StreamChunk(type="text", text="now.")
+        yield StreamChunk(type="tool_call", index=0, tool_name="complete_task", arguments='{"summary": "Done"}')
+        yield StreamChunk(type="usage", usage={"input_tokens": 100, "output_tokens": 50}, provider=provider)
+
+    oracle = MagicMock()
+    oracle.generate_stream = fake_stream
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
+    session = Session(
+        session_id="stream-session",
+        agent_id="main-agent",
+        oracle=oracle,
+        gateway=og,
+        workspace_root=str(tmp_path),
+        stream=True
+    )
+    await session.start()
+    await session.run_loop("Start task")
+
+    assert session.status == SessionStatus.COMPLETED
+    assert session.metadata_provider.gas_used == pytest.approx(0.0002)
+    await og.flush_events()
+    messages = [c.args[0] for c in mock_bridge.send_message.call_args_list]
+    deltas = [m["params"]["content"] for m in messages if m["method"] == "msc/log" and m["params"]["type"] == "delta"]
+    # 转发较慢时相邻增量会被合并，拼接后的文本不变
+    assert "".join(deltas) == "Finishing now."
+
+def test_gas_prices_cache_reads_and_writes_separately():
+    pricing = {"input_1m": 3.0, "output_1m": 15.0, "cache_write_1m": 3.75, "cache_read_1m": 0.3}
+    usage = {
+        "input_tokens": 1_000,
+        "output_tokens": 1_000,
+        "cache_creation_input_tokens": 10_000,
+        "cache_read_input_tokens": 100_000,
+    }
+    expected = (1_000 * 3.0 + 1_000 * 15.0 + 10_000 * 3.75 + 100_000 * 0.3) / 1_000_000
+    assert Session._compute_gas(usage, pricing) == pytest.approx(expected)
+    assert Session._compute_gas({**usage, "cached": True}, pricing) == 0.0
+
+@pytest.mark.asyncio
+async def test_session_passes_remaining_gas_as_budget(mock_oracle, mock_bridge, tmp_path):
+    """验证 gas_limit 非零时将剩余预算传给 Oracle 以在请求前约束路由"""
+    from msc.core.anamnesis.parser import ToolCall
+
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
+    session = Session(
+        session_id="budget-session",
+        agent_id="main-agent",
+        oracle=mock_oracle,
+        gateway=og,
+        workspace_root=str(tmp_path)
+    )
+    await session.start()
+    session.metadata_provider.set_pfms_status("gpt-4", gas_used=0.25, gas_limit=1.0)
+    mock_oracle.generate.side_effect = [
+        ("Done.", [ToolCall(name="complete_task", parameters={"summary": "Done"}, id="call_1")], {"input_tokens": 0, "output_tokens": 0}, MagicMock(pricing={}))
+    ]
+
+    await session.run_loop("Start task")
+
+    assert mock_oracle.generate.call_args.kwargs["budget"] == pytest.approx(0.75)
+
+def test_validate_turn_requires_valid_tool_call():
+    """验证级联校验：无工具调用或参数不合法的响应被拒绝"""
+    assert Session._validate_turn("Just chatting.", []) == "no_tool_call"
+    assert Session._validate_turn('{"name": "write_file", "parameters": {"path": "a.txt"}}', []) == "invalid_args"
+    assert Session._validate_turn("", [{"name": "complete_task", "parameters": {"summary": "Done"}}]) is None
+    # 无法构造为 ToolCall 的原生调用 (如参数为 None) 同样按参数不合法拒绝
+    assert Session._validate_turn("", [{"name": "list_files", "parameters": None}]) == "invalid_args"
+
+def test_tool_plan_splits_conflicting_calls(tmp_path):
+    """验证冲突分析：同一路径的写入、serial 的 execute 与 complete_task 切分到不同批次"""
+    from msc.core.tools.base import ToolContext
+    from msc.core.tools.dispatcher import ToolDispatcher
+
+    context = ToolContext(agent_id="a", workspace_root=str(tmp_path), oracle=None, allowed_paths=[str(tmp_path)])
+    calls = [
+        ("list_files", {"path": "."}),
+        ("execute", {"command": "echo 1"}),
+        ("execute", {"command": "echo 2"}),
+        ("write_file", {"path": "a.txt", "content": "1"}),
+        ("write_file", {"path": "b.txt", "content": "2"}),
+        ("apply_diff", {"path": "a.txt", "diff": "..."}),
+        ("execute", {"command": "make", "serial": True}),
+        ("list_files", {"path": "src"}),
+        ("complete_task", {"summary": "Done"}),
+    ]
+
+    # 首个 list_files 读取工作区根目录，与其后的写入冲突
+    assert ToolDispatcher.plan(context, calls) == [[0, 1, 2], [3, 4], [5], [6], [7], [8]]
+
+    # 普通 execute 视为读取整个工作区：排在此前的写入之后，其后的写入也等它完成
+    calls = [
+        ("apply_diff", {"path": "a.txt", "diff": "..."}),
+        ("execute", {"command": "pytest"}),
+        ("execute", {"command": "ruff check", "cwd": "src"}),
+        ("write_file", {"path": "b.txt", "content": "2"}),
+    ]
+    assert ToolDispatcher.plan(context, calls) == [[0], [1, 2], [3]]
+
+@pytest.mark.asyncio
+async def test_session_runs_independent_tools_concurrently(mock_oracle, mock_bridge, tmp_path):
+    """验证互不冲突的工具调用并发执行 (受信号量限制)，结果按原始顺序写入历史"""
+    from unittest.mock import patch
+    from msc.core.anamnesis.parser import ToolCall
+
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
+    session = Session(
+        session_id="parallel-session",
+        agent_id="main-agent",
+        oracle=mock_oracle,
+        gateway=og,
+        workspace_root=str(tmp_path),
+        max_parallel_tools=2
+    )
+    await session.start()
+    calls = [ToolCall(name="execute", parameters={"command": f"echo {i}"}, id=f"call_{i}") for i in range(3)]
+    calls.append(ToolCall(name="complete_task", parameters={"summary": "Done"}, id="call_done"))
+    mock_oracle.generate.side_effect = [
+        ("Running.", calls, {"input_tokens": 0, "output_tokens": 0}, MagicMock(pricing={}))
+    ]
+    running = 0
+    peak = 0
+    order = []
+
+    async def fake_dispatch(context, name, parameters):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # 先发起的调用更晚完成，验证结果仍按原始顺序写入
+        await asyncio.sleep(0.03 - 0.01 * len(order))
+        order.append(name)
+        running -= 1
+        return f"{name} {parameters.get('command', '')}".strip()
+
+    with patch("msc.core.og.ToolDispatcher.dispatch", side_effect=fake_dispatch):
+        await session.run_loop("Start task")
+
+    tool_msgs = [m for m in session.history if m["role"] == "tool"]
+    assert [m["tool_call_id"] for m in tool_msgs] == ["call_0", "call_1", "call_2", "call_done"]
+    assert tool_msgs[0]["content"] == "execute echo 0"
+    assert peak == 2
+    assert order[-1] == "complete_task"
+    assert session.status == SessionStatus.COMPLETED
+
+def test_session_journal_appends_and_compacts(tmp_path):
+    """验证会话日志只追加增量，后台合并为快照后仍可完整回放"""
+    manager = SessionManager(str(tmp_path / "sessions"), fsync="always", compact_after=4)
+    metadata = SessionMetadata(agent_id="agent-1", model_name="gpt-4")
+    history = [{"role": "system", "content": "sys"}]
+    manager.save_session("s1", metadata, history)
+
+    snapshot_path, journal_path = manager._paths("s1", "agent-1")
+    snapshot = snapshot_path.read_text(encoding="utf-8")
+
+    history.append({"role": "user", "content": "Hello"})
+    metadata.gas_used = 0.5
+    manager.save_session("s1", metadata, history)
+    # 快照不变，日志追加一条元数据增量与一条消息
+    assert snapshot_path.read_text(encoding="utf-8") == snapshot
+    lines = journal_path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["type"] for line in lines] == ["metadata", "message"]
+    assert json.loads(lines[0])["data"] == {"gas_used": 0.5}
+
+    for i in range(3):
+        history.append({"role": "assistant", "content": f"step {i}"})
+        manager.save_session("s1", metadata, history)
+    manager.wait_compaction("s1", "agent-1")
+    manager.close()
+
+    # 第 4 条记录触发合并，其后的记录保留在日志尾部
+    assert json.loads(snapshot_path.read_text(encoding="utf-8"))["seq"] == 4
+    assert [json.loads(line)["seq"] for line in journal_path.read_text(encoding="utf-8").splitlines()] == [5]
+    record = SessionManager(str(tmp_path / "sessions")).load_session("s1", "agent-1")
+    assert record.history == history
+    assert record.metadata.gas_used == 0.5
+
+def test_session_journal_tolerates_torn_tail_and_rewrites(tmp_path):
+    """验证崩溃导致的残缺日志尾部被忽略；历史被改写时重写快照"""
+    manager = SessionManager(str(tmp_path / "sessions"))
+    metadata = SessionMetadata(agent_id="agent-1")
+    history = [{"role": "user", "content": "Hello"}]
+    manager.save_session("s1", metadata, history)
+    history.append({"role": "assistant", "content": "Hi"})
+    manager.save_session("s1", metadata, history)
+
+    _, journal_path = manager._paths("s1", "agent-1")
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 3, "type": "mess')
+
+    record = manager.load_session("s1", "agent-1")
+    assert record.history == history
+
+    # 新进程首次写入时以快照覆盖残缺日志
+    history.append({"role": "user", "content": "Again"})
+    restarted = SessionManager(str(tmp_path / "sessions"))
+    restarted.save_session("s1", metadata, history)
+    restarted.save_session("s1", metadata, history[:1])
+    assert restarted.load_session("s1", "agent-1").history == history[:1]
+
+def test_session_journal_seq_survives_restart(tmp_path):
+    """验证 seq 跨进程续接：新进程写出快照后、删除旧日志前崩溃，旧日志记录不会被重复回放"""
+    manager = SessionManager(str(tmp_path / "sessions"))
+    metadata = SessionMetadata(agent_id="agent-1")
+    history = [{"role": "system", "content": "s"}]
+    manager.save_session("s1", metadata, history)
+    for i in range(3):
+        history.append({"role": "user", "content": f"m{i}"})
+        manager.save_session("s1", metadata, history)
+    _, journal_path = manager._paths("s1", "agent-1")
+    stale_journal = journal_path.read_text(encoding="utf-8")
+
+    history.append({"role": "user", "content": "m3"})
+    SessionManager(str(tmp_path / "sessions")).save_session("s1", metadata, history)
+    # 模拟崩溃：旧日志未被删除
+    journal_path.write_text(stale_journal, encoding="utf-8")
+
+    record = SessionManager(str(tmp_path / "sessions")).load_session("s1", "agent-1")
+    assert [m["content"] for m in record.history] == ["s", "m0", "m1", "m2", "m3"]
+
+@pytest.mark.asyncio
+async def test_persistence_service_coalesces_writes_off_loop(tmp_path):
+    """验证后台写入服务：写入在线程池中执行，同一 Agent 的多次登记合并，flush 后落盘"""
+    import threading
+    import time
+    from msc.core.anamnesis.persistence import PersistenceService
+
+    class SlowManager(SessionManager):
+        def save_session(self, session_id, metadata, history):
+            saves.append((threading.current_thread() is threading.main_thread(), len(history)))
+            time.sleep(0.05)
+            return super().save_session(session_id, metadata, history)
+
+    saves = []
+    service = PersistenceService(SlowManager(str(tmp_path / "sessions")))
+    metadata = SessionMetadata(agent_id="agent-1")
+    history = [{"role": "user", "content": "Hello"}]
+    source = lambda: (metadata, history)
+
+    service.mark_dirty("s1", "agent-1", source)
+    await asyncio.sleep(0.01)
+    # 第一次写入进行中，其后的登记合并为一次写入
+    for i in range(5):
+        history.append({"role": "assistant", "content": f"step {i}"})
+        service.mark_dirty("s1", "agent-1", source)
+    assert service.stats()["queue_depth"] == 1
+
+    await service.flush()
+    stats = service.stats()
+    await service.close()
+
+    assert saves == [(False, 1), (False, 6)]
+    assert stats["writes"] == 2 and stats["coalesced"] == 4 and stats["queue_depth"] == 0
+    assert stats["write_latency_avg"] >= 0.05
+    assert SessionManager(str(tmp_path / "sessions")).load_session("s1", "agent-1").history == history
+
+@pytest.mark.asyncio
+async def test_persistence_failures_are_reported_through_gateway(mock_bridge, tmp_path):
+    """验证写入失败不打印到 stdout，而是作为 error 日志事件发布给 Bridge"""
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
+    og.session_manager.save_session = MagicMock(side_effect=OSError("disk full"))
+    og.persistence.mark_dirty("s1", "agent-1", lambda: (SessionMetadata(agent_id="agent-1"), []))
+    await og.persistence.flush()
+    await og.flush_events()
+
+    assert og.persistence.stats()["errors"] == 1
+    message = mock_bridge.send_message.call_args.args[0]
+    assert message["method"] == "msc/log"
+    assert message["params"]["type"] == "error" and "disk full" in message["params"]["content"]
+    await og.shutdown()
+
+@pytest.mark.asyncio
+async def test_gateway_persists_oracle_health_on_shutdown(mock_bridge, tmp_path):
+    """验证网关为 Session 的 Oracle 指定健康统计存储，并在 shutdown 时写出节流期内的统计"""
+    from msc.oracle import Oracle
+
+    storage_root = tmp_path / "sessions"
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(storage_root))
+    oracle = Oracle(providers=[])
+    session = Session(session_id="s1", agent_id="main-agent", oracle=oracle, gateway=og, workspace_root=str(tmp_path))
+    await session.start()
+    assert oracle.health.storage_path == storage_root / "oracle_stats.json"
+
+    oracle.health.persist_interval = 3600
+    oracle.health.record_success("p1", 0.5)
+    oracle.health.record_success("p1", 0.5)
+    await og.shutdown()
+
+    saved = json.loads((storage_root / "oracle_stats.json").read_text(encoding="utf-8"))
+    assert saved["p1"]["successes"] == 2
+
+@pytest.mark.asyncio
+async def test_scheduler_slot_is_released_during_tool_execution(mock_oracle, mock_bridge, tmp_path):
+    """验证调度槽位只覆盖 Oracle 请求，工具执行期间不占用全局并发名额"""
+    from msc.core.anamnesis.parser import ToolCall
+
+    og = OrchestrationGateway(bridge=mock_bridge, storage_root=str(tmp_path / "sessions"))
+    session = Session(
+        session_id="slot-session",
+        agent_id="main-agent",
+        oracle=mock_oracle,
+        gateway=og,
+        workspace_root=str(tmp_path)
+    )
+    await session.start()
+    mock_oracle.generate.side_effect = [
+        ("Done.", [ToolCall(name="complete_task", parameters={"summary": "Done"}, id="call_1")], {"input_tokens": 0, "output_tokens": 0}, MagicMock(pricing={}))
+    ]
+    active = []
+
+    async def execute_tools(tool_calls):
+        active.append(og.scheduler.stats()["active_turns"])
+        return ["ok"] * len(tool_calls)
+
+    session._execute_tools = execute_tools
+    await session.run_loop("Start task")
+
+    assert active == [0]
+    assert og.scheduler.stats()["active_turns"] == 0
@@ -113,6 +113,7 @@ async def test_subagent_orchestration_protocol_closure():
         await asyncio.sleep(1)
     
     # 5. 最终状态审计
+    await og.persistence.flush()
     record = og.session_manager.load_session(main_session.session_id, "main-agent")
     assert record is not None
     assert len(record.history) > 2
@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from msc.oracle import catalog
+from msc.oracle.stream import StreamChunk
+
+
+class FakeProvider:
+    """
+    可配置的测试 Provider：generate 为包装真实协程的 AsyncMock，
+    既可断言调用次数，也能模拟延迟、异常、并发与取消。
+    修改 response 即可改变后续调用的返回值；stream=True 时额外提供 generate_stream。
+    """
+
+    def __init__(
+        self,
+        name,
+        model_name="gpt-4",
+        *,
+        caps=None,
+        vision=False,
+        thinking=False,
+        tools=False,
+        pricing=None,
+        context_window=None,
+        rate_limits=None,
+        text=None,
+        tool_calls=None,
+        usage=None,
+        delay=0.0,
+        error=None,
+        stream=False,
+        chunks=None,
+        stream_error=None,
+    ):
+        self.name = name
+        self.model_name = model_name
+        self.capabilities = caps or []
+        self.model_info = SimpleNamespace(has_vision=vision, has_thinking=thinking, has_tools=tools)
+        self.pricing = pricing or {"input_1m": 1.0, "output_1m": 2.0}
+        self.context_window = context_window
+        self.rate_limits = rate_limits or {}
+        self.response = (
+            f"Response from {name}" if text is None else text,
+            tool_calls or [],
+            usage or {"input_tokens": 10, "output_tokens": 5},
+        )
+        self.delay = delay
+        self.error = error
+        self.stream_error = stream_error
+        self.chunks = chunks
+        self.cancelled = False
+        self.concurrent = 0
+        self.peak_concurrent = 0
+        self.generate = AsyncMock(side_effect=self._generate)
+        if stream:
+            self.generate_stream = self._generate_stream
+
+    async def _generate(self, *_args, **_kwargs):
+        self.concurrent += 1
+        self.peak_concurrent = max(self.peak_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.concurrent -= 1
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+    async def _generate_stream(self, *_args, **_kwargs):
+        if self.error is not None:
+            raise self.error
+        text, _, usage = self.response
+        for chunk in self.chunks or [StreamChunk(type="text", text=text)]:
+            yield chunk
+            if self.stream_error is not None:
+                raise self.stream_error
+        yield StreamChunk(type="usage", usage=usage)
+
+
+@pytest.fixture
+def make_provider():
+    return FakeProvider
+
+
+@pytest.fixture(autouse=True)
+def isolated_catalog(tmp_path, monkeypatch):
+    """共享模型目录默认缓存在用户目录下；测试改用临时目录，避免读写开发机上的缓存"""
+    shared = catalog.ModelCatalog(cache_path=tmp_path / "openrouter_models.json")
+    monkeypatch.setitem(catalog._shared, "catalog", shared)
+    return shared
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from msc.oracle import Oracle
+from msc.oracle.cache import ResponseCache, request_key
+
+
+def test_request_key_is_canonical():
+    messages = [{"role": "user", "content": "hi"}]
+    assert request_key("gpt-4", messages, require_caps=["a", "b"]) == request_key("gpt-4", messages, require_caps=["b", "a"])
+    assert request_key("gpt-4", messages) != request_key("gpt-4o", messages)
+
+
+@pytest.mark.asyncio
+async def test_oracle_cache_hit_skips_provider_and_tags_usage(make_provider):
+    """
+    验证响应缓存：相同请求第二次命中缓存，不再调用 Provider，
+    返回原始 usage 并标记 cached 以便 Gas 计费跳过。
+    """
+    provider = make_provider(
+        "p1", text="cached text", tool_calls=[{"name": "list_files", "parameters": {}}], usage={"input_tokens": 10, "output_tokens": 5}
+    )
+    oracle = Oracle(providers=[provider], cache=ResponseCache())
+    messages = [{"role": "user", "content": "list files"}]
+
+    first = await oracle.generate("gpt-4", messages)
+    second = await oracle.generate("gpt-4", messages)
+
+    assert provider.generate.await_count == 1
+    assert second[0] == first[0]
+    assert second[1] == first[1]
+    assert second[2]["cached"] is True
+    assert second[2]["input_tokens"] == first[2]["input_tokens"]
+    assert "cached" not in first[2]
+    assert second[3] is provider
+
+
+@pytest.mark.asyncio
+async def test_oracle_cache_respects_model_opt_out(make_provider):
+    provider = make_provider("p1")
+    oracle = Oracle(providers=[provider], cache=ResponseCache(exclude_models=["gpt-4"]))
+    repeats = 2
+
+    for _ in range(repeats):
+        await oracle.generate("gpt-4", "hi")
+
+    assert provider.generate.await_count == repeats
+
+
+def test_cache_ttl_expiry_and_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    for key in ["a", "b", "c"]:
+        cache.put(key, "gpt-4", "p1", text=key, tool_calls=[], usage={})
+
+    assert cache.get("a") is None
+    assert cache.get("c").text == "c"
+    time.sleep(0.06)
+    assert cache.get("c") is None
+
+
+def test_disk_tier_survives_restart_and_evicts_by_size(tmp_path):
+    cache = ResponseCache(storage_dir=str(tmp_path), max_disk_bytes=10_000)
+    cache.put("k1", "gpt-4", "p1", text="hello", tool_calls=[], usage={"input_tokens": 1})
+
+    restored = ResponseCache(storage_dir=str(tmp_path))
+    assert restored.get("k1").text == "hello"
+
+    small = ResponseCache(storage_dir=str(tmp_path / "small"), max_disk_bytes=400)
+    small.put("old", "gpt-4", "p1", text="x" * 200, tool_calls=[], usage={})
+    time.sleep(0.01)
+    small.put("new", "gpt-4", "p1", text="y" * 200, tool_calls=[], usage={})
+    assert not (tmp_path / "small" / "old.json").exists()
+    assert (tmp_path / "small" / "new.json").exists()
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+from msc.oracle import Oracle
+from msc.oracle.adapters.gemini import GeminiAdapter
+from msc.oracle.cascade import CascadeConfig, parse_confidence
+
+
+def needs_tool_call(_text, tool_calls):
+    return None if tool_calls else "no_tool_call"
+
+
+def make_oracle(make_provider, cheap_text, cheap_calls=None):
+    cheap = make_provider("cheap", "flash-lite", text=cheap_text, tool_calls=cheap_calls, pricing={"input_1m": 0.1, "output_1m": 0.4})
+    strong = make_provider("strong", "pro", text="Strong answer", tool_calls=[{"name": "complete_task", "parameters": {"summary": "ok"}}])
+    cascades = {"auto": CascadeConfig(models=["flash-lite", "pro"], min_confidence=0.6)}
+    return Oracle([cheap, strong], cascades=cascades), cheap, strong
+
+
+@pytest.mark.asyncio
+async def test_cascade_serves_valid_cheap_response(make_provider):
+    """验证廉价模型响应通过校验时不升级"""
+    oracle, cheap, strong = make_oracle(make_provider, "Listing files", [{"name": "list_files", "parameters": {}}])
+
+    _, _, usage, provider = await oracle.generate("auto", "hi", validate=needs_tool_call)
+
+    assert provider is cheap
+    strong.generate.assert_not_called()
+    assert usage["cascade"] == {"name": "auto", "model": "flash-lite", "escalations": []}
+    assert oracle.cascade_stats()["auto"]["escalation_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_cascade_escalates_on_validation_failure_and_low_confidence(make_provider):
+    """验证无工具调用或自报低置信度时升级到强模型，且被拒绝的响应计入费用"""
+    oracle, cheap, strong = make_oracle(make_provider, "I am not sure what to do.")
+
+    text, _, usage, provider = await oracle.generate("auto", "hi", validate=needs_tool_call)
+
+    assert provider is strong and text == "Strong answer"
+    assert usage["cascade"]["escalations"] == ["no_tool_call"]
+    assert usage["cascade_rejected"][0]["provider"] == "cheap"
+
+    cheap.response = ("Maybe. Confidence: 0.3", [{"name": "list_files", "parameters": {}}], {"input_tokens": 1, "output_tokens": 1})
+    _, _, usage, provider = await oracle.generate("auto", "hi", validate=needs_tool_call)
+    assert provider is strong
+    assert usage["cascade"]["escalations"] == ["low_confidence"]
+
+    stats = oracle.cascade_stats()["auto"]
+    assert stats["requests"] == cheap.generate.await_count
+    assert stats["served"] == {"pro": strong.generate.await_count}
+    assert stats["reasons"] == {"no_tool_call": 1, "low_confidence": 1}
+    assert stats["escalation_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_cascade_escalates_when_validator_raises(make_provider):
+    """验证校验器抛出异常 (如工具调用参数无法构造) 时按拒绝处理并升级，而非把异常抛给调用方"""
+    oracle, _, strong = make_oracle(make_provider, "Listing files", [{"name": "list_files", "parameters": None}])
+
+    def build_calls(_text, tool_calls):
+        # 参数为 None 时 dict() 抛出 TypeError，模拟校验器构造工具调用失败
+        return None if all(dict(call["parameters"]) is not None for call in tool_calls) else "invalid_args"
+
+    _, _, usage, provider = await oracle.generate("auto", "hi", validate=build_calls)
+
+    assert provider is strong
+    assert usage["cascade"]["escalations"] == ["invalid_response"]
+
+
+def test_gemini_tool_call_without_args_has_empty_parameters():
+    call = SimpleNamespace(name="list_files", args=None, id=None)
+    response = SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(function_call=call)]))])
+
+    assert GeminiAdapter._extract_tool_calls(response) == [{"name": "list_files", "parameters": {}}]
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"), [("Confidence: 0.8", 0.8), ("confidence=40%", 0.4), ("Confidence: 90", 0.9)]
+)
+def test_parse_confidence_formats(text, expected):
+    assert parse_confidence(text) == expected
+
+
+def test_parse_confidence_without_self_report():
+    assert parse_confidence("no self report") is None
@@ -0,0 +1,155 @@
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from msc.oracle.catalog import (
+    DEFAULT_CACHE_PATH,
+    CatalogUnavailableError,
+    ModelCatalog,
+    configure_catalog,
+    get_catalog,
+    parse_models,
+)
+
+MODELS = [
+    {
+        "id": "anthropic/claude-3.5-sonnet",
+        "name": "Claude 3.5 Sonnet",
+        "context_length": 200000,
+        "pricing": {"prompt": "0.000003", "completion": "0.000015", "input_cache_read": "0.0000003"},
+    },
+    {"id": "openai/gpt-4o", "pricing": {"prompt": "0.0000025", "completion": "0.00001"}},
+    {"id": "broken/model", "pricing": {"prompt": "n/a"}},
+]
+CLAUDE_PRICING = {"input_1m": 3.0, "output_1m": 15.0, "cache_read_1m": 0.3}
+CLAUDE_WINDOW = 200000
+
+
+def _response(status: int, data: list | None = None, etag: str | None = None) -> MagicMock:
+    response = MagicMock()
+    response.status_code = status
+    response.headers = {"etag": etag} if etag else {}
+    response.json.return_value = {"data": data or []}
+    return response
+
+
+def test_parse_models_indexes_by_id():
+    models = parse_models(MODELS)
+
+    assert set(models) == {"anthropic/claude-3.5-sonnet", "openai/gpt-4o"}
+    entry = models["anthropic/claude-3.5-sonnet"]
+    assert entry.pricing == CLAUDE_PRICING
+    assert entry.context_window == CLAUDE_WINDOW
+
+
+def test_catalog_loads_fixture_offline_and_resolves_alias(tmp_path):
+    """验证离线时从 fixture 加载，且无 vendor 前缀的模型名可命中"""
+    fixture = tmp_path / "models.json"
+    fixture.write_text(json.dumps({"data": MODELS}))
+
+    catalog = ModelCatalog(fixture_path=fixture)
+
+    assert catalog.get("gpt-4o").id == "openai/gpt-4o"
+    assert not catalog.is_fresh
+
+
+@pytest.mark.asyncio
+async def test_catalog_revalidates_with_etag(tmp_path):
+    cache_path = tmp_path / "cache.json"
+    catalog = ModelCatalog(cache_path=cache_path, ttl=0)
+
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.return_value = _response(200, MODELS, etag='"v1"')
+        await catalog.refresh()
+        mock_get.return_value = _response(304)
+        await catalog.refresh()
+
+    assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+    assert catalog.get("openai/gpt-4o") is not None
+
+    # 新实例从磁盘缓存恢复数据与 ETag
+    reloaded = ModelCatalog(cache_path=cache_path, ttl=3600)
+    assert reloaded.is_fresh
+    assert reloaded.get("anthropic/claude-3.5-sonnet").pricing == CLAUDE_PRICING
+
+
+@pytest.mark.asyncio
+async def test_shared_catalog_downloads_once_for_many_adapters():
+    """验证多个 OpenRouter 实例共用一次 /models 下载"""
+    from msc.oracle.adapters.openrouter import OpenRouterAdapter
+
+    catalog = ModelCatalog()
+    adapters = [
+        OpenRouterAdapter(name=f"or{i}", model=model, api_key="sk-test", catalog=catalog)
+        for i, model in enumerate(["anthropic/claude-3.5-sonnet", "openai/gpt-4o", "openai/gpt-4o"])
+    ]
+
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.return_value = _response(200, MODELS)
+        for adapter in adapters:
+            await adapter.refresh_pricing()
+
+    assert mock_get.call_count == 1
+    assert adapters[0].pricing == CLAUDE_PRICING
+    assert adapters[2].pricing == {"input_1m": 2.5, "output_1m": 10.0}
+
+
+def test_apply_to_keeps_manual_pricing():
+    catalog = ModelCatalog()
+    catalog._index(MODELS)
+    adapter = MagicMock()
+    adapter.model_name = "claude-3.5-sonnet"
+    adapter.pricing = {"input_1m": 1.0, "output_1m": 0.0}
+    adapter.context_window = None
+
+    assert catalog.apply_to(adapter)
+    assert adapter.pricing["input_1m"] == 1.0
+    assert adapter.pricing["output_1m"] == CLAUDE_PRICING["output_1m"]
+    assert adapter.context_window == CLAUDE_WINDOW
+
+
+def test_apply_to_override_keeps_configured_context_window():
+    """验证刷新价格 (override=True) 时仍保留手动配置的上下文窗口"""
+    catalog = ModelCatalog()
+    catalog._index(MODELS)
+    adapter = MagicMock()
+    adapter.model_name = "claude-3.5-sonnet"
+    adapter.pricing = {"input_1m": 1.0, "output_1m": 0.0}
+    configured = 8192
+    adapter.context_window = configured
+
+    assert catalog.apply_to(adapter, override=True)
+    assert adapter.pricing == CLAUDE_PRICING
+    assert adapter.context_window == configured
+
+
+@pytest.mark.asyncio
+async def test_refresh_raises_only_without_fallback_data(tmp_path):
+    """验证离线时有缓存则沿用，没有任何数据时抛出错误而非返回空目录"""
+    empty = ModelCatalog(cache_path=tmp_path / "missing.json", ttl=0)
+    fixture = tmp_path / "models.json"
+    fixture.write_text(json.dumps({"data": MODELS}))
+    cached = ModelCatalog(fixture_path=fixture, ttl=0)
+
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.side_effect = OSError("offline")
+        with pytest.raises(CatalogUnavailableError, match="offline"):
+            await empty.refresh()
+        await cached.refresh()
+
+        mock_get.side_effect = None
+        mock_get.return_value = _response(503)
+        with pytest.raises(CatalogUnavailableError, match="503"):
+            await empty.refresh()
+        await cached.refresh()
+
+    assert empty.models() == []
+    assert cached.get("gpt-4o") is not None
+
+
+def test_shared_catalog_uses_disk_cache_by_default():
+    configured = configure_catalog(fixture_path=None)
+    assert configured.cache_path == DEFAULT_CACHE_PATH
+    assert get_catalog() is configured
+    assert configure_catalog(cache_path=None).cache_path is None
@@ -0,0 +1,143 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from google.genai import errors
+
+from msc.oracle.adapters.gemini import GeminiAdapter
+
+SYSTEM = "Stable system prompt. " * 400
+
+
+def make_adapter(**kwargs):
+    adapter = GeminiAdapter(name="gm", model="gemini-2.5-flash", api_key="sk-test", context_caching=True, **kwargs)
+    adapter.client = MagicMock()
+    names = iter(f"cachedContents/{i}" for i in range(100))
+    adapter.client.aio.caches.create = AsyncMock(side_effect=lambda **_kw: SimpleNamespace(name=next(names)))
+    adapter.client.aio.caches.delete = AsyncMock()
+    usage = SimpleNamespace(prompt_token_count=5000, cached_content_token_count=4800, candidates_token_count=20)
+    response = SimpleNamespace(text="ok", candidates=[], usage_metadata=usage)
+    adapter.client.aio.models.generate_content = AsyncMock(return_value=response)
+    return adapter
+
+
+def messages(system=SYSTEM, turn="hi"):
+    return [{"role": "system", "content": system}, {"role": "user", "content": turn}]
+
+
+@pytest.mark.asyncio
+async def test_stable_prefix_reuses_cached_content_handle():
+    """验证相同 system 前缀只创建一次缓存句柄，请求中不再重复发送 system_instruction"""
+    adapter = make_adapter()
+
+    await adapter.generate(messages(turn="first"))
+    _, _, usage = await adapter.generate(messages(turn="second"))
+
+    adapter.client.aio.caches.create.assert_awaited_once()
+    config = adapter.client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.cached_content == "cachedContents/0"
+    assert config.system_instruction is None
+    assert usage == {"input_tokens": 200, "output_tokens": 20, "cache_read_input_tokens": 4800}
+
+
+@pytest.mark.asyncio
+async def test_cached_content_ttl_and_cleanup():
+    adapter = make_adapter(cache_max_entries=1)
+
+    await adapter.generate(messages())
+    # 句柄过期后重新创建
+    key = next(iter(adapter._cached_contents))
+    adapter._cached_contents[key] = ("cachedContents/0", 0.0)
+    await adapter.generate(messages())
+    assert adapter._cached_contents[key][0] == "cachedContents/1"
+
+    # 前缀变化时超出上限的旧句柄被删除
+    await adapter.generate(messages(system=SYSTEM + "changed rules"))
+    adapter.client.aio.caches.delete.assert_awaited_once_with(name="cachedContents/1")
+
+    await adapter.close_caches()
+    adapter.client.aio.caches.delete.assert_awaited_with(name="cachedContents/2")
+    assert adapter._cached_contents == {}
+
+
+@pytest.mark.asyncio
+async def test_short_prefix_is_sent_inline():
+    adapter = make_adapter()
+
+    await adapter.generate(messages(system="short"))
+
+    adapter.client.aio.caches.create.assert_not_awaited()
+    config = adapter.client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.system_instruction == "short"
+
+
+@pytest.mark.asyncio
+async def test_transient_cache_failure_is_retried_and_stale_handle_dropped():
+    """验证暂时性错误不会永久禁用缓存，服务端拒绝的句柄被丢弃并以完整内容重发"""
+    adapter = make_adapter()
+    adapter.client.aio.caches.create.side_effect = [
+        errors.ServerError(503, {"error": {"message": "unavailable"}}),
+        SimpleNamespace(name="cachedContents/0"),
+        SimpleNamespace(name="cachedContents/1"),
+    ]
+
+    await adapter.generate(messages())
+    config = adapter.client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.cached_content is None
+    await adapter.generate(messages())
+    config = adapter.client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.cached_content == "cachedContents/0"
+
+    response = adapter.client.aio.models.generate_content.return_value
+    adapter.client.aio.models.generate_content.side_effect = [
+        errors.ClientError(404, {"error": {"message": "CachedContent not found"}}),
+        response,
+    ]
+    text, _, _ = await adapter.generate(messages())
+    assert text == "ok"
+    config = adapter.client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.system_instruction == SYSTEM
+    assert adapter._cached_contents == {}
+
+    adapter.client.aio.models.generate_content.side_effect = None
+    await adapter.generate(messages())
+    config = adapter.client.aio.models.generate_content.call_args.kwargs["config"]
+    assert config.cached_content == "cachedContents/1"
+
+
+@pytest.mark.asyncio
+async def test_unsupported_prefix_is_remembered():
+    adapter = make_adapter()
+    adapter.client.aio.caches.create.side_effect = errors.ClientError(400, {"error": {"message": "too small"}})
+
+    await adapter.generate(messages())
+    await adapter.generate(messages())
+
+    adapter.client.aio.caches.create.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_request_waiting_on_lock_reuses_handle_being_stored():
+    """验证创建完成与句柄登记之间到达的请求复用该句柄，而非重复创建一个不受追踪的缓存"""
+    adapter = make_adapter()
+    created = asyncio.Event()
+
+    async def create(**_kwargs):
+        await created.wait()
+        return SimpleNamespace(name="cachedContents/0")
+
+    adapter.client.aio.caches.create.side_effect = create
+    first = asyncio.create_task(adapter.generate(messages(turn="first")))
+    while not adapter._creating:
+        await asyncio.sleep(0)
+    async with adapter._cache_lock:
+        second = asyncio.create_task(adapter.generate(messages(turn="second")))
+        await asyncio.sleep(0.01)
+        created.set()
+        await asyncio.sleep(0.01)
+    await asyncio.gather(first, second)
+
+    adapter.client.aio.caches.create.assert_awaited_once()
+    assert [name for name, _ in adapter._cached_contents.values()] == ["cachedContents/0"]
+    assert adapter._creating == {}
@@ -0,0 +1,48 @@
+import pytest
+
+from msc.oracle import BudgetExceededError, Oracle
+
+
+@pytest.mark.asyncio
+async def test_cost_routing_prefers_cheapest_provider(make_provider):
+    """验证 cost 路由忽略配置顺序，优先选择预估费用最低者"""
+    premium = make_provider("premium", pricing={"input_1m": 15.0, "output_1m": 75.0})
+    budget = make_provider("budget", pricing={"input_1m": 0.5, "output_1m": 1.5})
+    oracle = Oracle([premium, budget], routing="cost")
+
+    _, _, _, provider = await oracle.generate("gpt-4", "hello")
+
+    assert provider is budget
+    premium.generate.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_cost_routing_breaks_ties_by_latency(make_provider):
+    slow = make_provider("slow", pricing={"input_1m": 1.0, "output_1m": 1.0})
+    fast = make_provider("fast", pricing={"input_1m": 1.0, "output_1m": 1.0})
+    oracle = Oracle([slow, fast], routing="cost")
+    oracle.health.record_success("slow", 5.0)
+    oracle.health.record_success("fast", 0.1)
+
+    _, _, _, provider = await oracle.generate("gpt-4", "hello")
+
+    assert provider is fast
+
+
+@pytest.mark.asyncio
+async def test_budget_downgrades_then_refuses(make_provider):
+    """验证剩余预算不足时降级到便宜的 Provider，全部超出时拒绝发起请求"""
+    premium = make_provider("premium", pricing={"input_1m": 15.0, "output_1m": 75.0})
+    cheap = make_provider("cheap", pricing={"input_1m": 0.5, "output_1m": 1.5})
+    oracle = Oracle([premium, cheap], expected_output_tokens=1000)
+
+    _, _, _, provider = await oracle.generate("gpt-4", "hello")
+    assert provider is premium
+
+    _, _, _, provider = await oracle.generate("gpt-4", "hello", budget=0.01)
+    assert provider is cheap
+
+    with pytest.raises(BudgetExceededError):
+        await oracle.generate("gpt-4", "hello", budget=0.0001)
+    assert premium.generate.call_count == 1
+    assert cheap.generate.call_count == 1
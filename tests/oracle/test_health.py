@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from msc.oracle import Oracle
+from msc.oracle.health import BreakerState, HealthTracker
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown():
+    """
+    验证熔断器状态机：连续失败达到阈值后 open，冷却结束后 half-open 仅放行一次探测，
+    探测成功后恢复 closed。
+    """
+    tracker = HealthTracker(failure_threshold=2, cooldown=0.05)
+
+    tracker.record_failure("p1")
+    assert tracker.allow("p1")
+    tracker.record_failure("p1")
+    assert tracker.get("p1").state == BreakerState.OPEN
+    assert not tracker.allow("p1")
+
+    time.sleep(0.06)
+    assert tracker.allow("p1")
+    assert tracker.get("p1").state == BreakerState.HALF_OPEN
+    assert not tracker.allow("p1")
+
+    tracker.record_success("p1", 0.1)
+    assert tracker.get("p1").state == BreakerState.CLOSED
+
+
+def test_rank_prefers_healthy_and_fast_providers():
+    tracker = HealthTracker()
+    tracker.record_success("slow", 2.0)
+    tracker.record_success("fast", 0.2)
+    tracker.record_success("flaky", 0.2)
+    tracker.record_failure("flaky")
+
+    assert tracker.rank(["slow", "flaky", "fast"]) == ["fast", "flaky", "slow"]
+    # 无历史数据时保持配置顺序
+    assert tracker.rank(["b", "a"]) == ["b", "a"]
+
+
+def test_stats_persist_and_warm_start(tmp_path):
+    path = tmp_path / "oracle_stats.json"
+    tracker = HealthTracker(storage_path=str(path), persist_interval=0)
+    tracker.record_success("p1", 0.5)
+    tracker.record_failure("p2")
+
+    restored = HealthTracker(storage_path=str(path))
+    assert restored.get("p1").ewma_latency == pytest.approx(0.5)
+    assert restored.get("p2").failures == 1
+
+
+@pytest.mark.asyncio
+async def test_oracle_skips_open_breaker_and_exposes_stats(make_provider):
+    p1 = make_provider("p1", error=RuntimeError("Provider p1 failed"))
+    p2 = make_provider("p2")
+    oracle = Oracle(providers=[p1, p2], health=HealthTracker(failure_threshold=1, cooldown=60))
+
+    for _ in range(2):
+        _, _, _, provider = await oracle.generate("gpt-4", "Hello")
+        assert provider is p2
+    p1.generate.assert_awaited_once()
+
+    stats = oracle.provider_stats()
+    assert stats["p1"]["state"] == "open"
+    assert stats["p2"]["successes"] == p2.generate.await_count
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from msc.oracle import Oracle
+
+
+@pytest.mark.asyncio
+async def test_hedge_fires_backup_and_cancels_slow_primary(make_provider):
+    """
+    验证对冲模式：首选 Provider 超过阈值未返回时并发发起备选请求，
+    取最先返回者并取消落败请求，落败者仍出现在 usage 中用于 Gas 计费。
+    """
+    slow = make_provider("slow", delay=5.0)
+    fast = make_provider("fast", delay=0.01)
+
+    oracle = Oracle(providers=[slow, fast], hedge_percentile=0.95, hedge_delay=0.05)
+    text, _, usage, provider = await asyncio.wait_for(oracle.generate("gpt-4", "Hello"), timeout=2)
+
+    assert provider.name == "fast"
+    assert text == "Response from fast"
+    assert slow.cancelled
+    losers = usage["hedge_losers"]
+    assert losers[0]["provider"] == "slow"
+    assert losers[0]["cancelled"] is True
+    # 被取消者的输入已被 Provider 计费，按校准后的估算计入
+    assert losers[0]["estimated"] is True
+    assert losers[0]["input_tokens"] == oracle.estimate_tokens("Hello", slow) > 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_not_fired_when_primary_is_fast(make_provider):
+    p1 = make_provider("p1", delay=0.0)
+    p2 = make_provider("p2", delay=0.0)
+
+    oracle = Oracle(providers=[p1, p2], hedge_percentile=0.95, hedge_delay=1.0)
+    _, _, usage, provider = await oracle.generate("gpt-4", "Hello")
+
+    assert provider.name == "p1"
+    p2.generate.assert_not_called()
+    assert "hedge_losers" not in usage
+
+
+@pytest.mark.asyncio
+async def test_hedge_fails_over_immediately_on_error(make_provider):
+    broken = make_provider("broken", error=RuntimeError("Provider broken failed"))
+    backup = make_provider("backup")
+
+    oracle = Oracle(providers=[broken, backup], hedge_percentile=0.95, hedge_delay=10.0)
+    _, _, _, provider = await asyncio.wait_for(oracle.generate("gpt-4", "Hello"), timeout=1)
+
+    assert provider.name == "backup"
+
+
+@pytest.mark.asyncio
+async def test_hedge_delay_follows_observed_latency_percentile(make_provider):
+    configured = 3.0
+    p1 = make_provider("p1")
+    oracle = Oracle(providers=[p1], hedge_percentile=0.5, hedge_delay=configured)
+
+    assert oracle._hedge_delay_for(p1) == configured
+    for latency in [0.1, 0.2, 0.3, 0.4, 0.5]:
+        oracle._record_latency(p1, latency)
+    assert oracle._hedge_delay_for(p1) == pytest.approx(0.3)
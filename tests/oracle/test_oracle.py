@@ -177,3 +177,99 @@ async def test_ollama_default_url():
     
     adapter = OllamaAdapter(name="local", model="llama3")
     assert str(adapter.client.base_url) == "http://localhost:11434/v1/"
+
+
+def test_anthropic_prompt_caching_breakpoints():
+    """验证 Anthropic 提示缓存：system 与稳定历史前缀末尾设置 cache_control，尾部易变消息不设断点"""
+    from msc.oracle.adapters.anthropic import AnthropicAdapter
+
+    adapter = AnthropicAdapter(name="ant", model="claude-3.5-sonnet", api_key="sk-test")
+    messages = [
+        {"role": "system", "content": "Big stable system prompt"},
+        {"role": "user", "content": "Do the task"},
+        {"role": "assistant", "content": "Calling a tool"},
+        {"role": "tool", "content": "ok", "tool_call_id": "call_1"},
+        {"role": "assistant", "content": "Next step"},
+        {"role": "user", "content": "## Metadata\nCurrent Time: now"},
+    ]
+
+    request = adapter._build_request(messages, None)
+
+    assert request["system"] == [
+        {"type": "text", "text": "Big stable system prompt", "cache_control": {"type": "ephemeral"}}
+    ]
+    roles = [m["role"] for m in request["messages"]]
+    assert roles == ["user", "assistant", "user", "assistant", "user"]
+    assert request["messages"][-2]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in request["messages"][-1]["content"][-1]
+
+    plain = AnthropicAdapter(name="ant", model="claude-3.5-sonnet", api_key="sk-test", prompt_caching=False)
+    assert "cache_control" not in plain._build_request(messages, None)["system"][0]
+
+NATIVE_HISTORY = [
+    {"role": "system", "content": "System prompt"},
+    {"role": "user", "content": "List files"},
+    {"role": "assistant", "content": "", "tool_calls": [{"id": "call_1", "name": "list_files", "parameters": {"path": "."}}]},
+    {"role": "tool", "content": "a.txt", "tool_call_id": "call_1"},
+    {"role": "assistant", "content": "{\"name\": \"execute\", \"parameters\": {}}"},
+    {"role": "tool", "content": "done", "tool_call_id": "call_parsed"},
+]
+TOOLS = [{"name": "list_files", "description": "List files", "parameters": {"type": "object", "properties": {"path": {"type": "string"}}}}]
+
+def test_openai_native_messages_and_tools():
+    """验证 OpenAI 适配器保留角色结构，原生工具调用以 tool_calls/tool 消息回传，文本解析的调用退化为 user 文本"""
+    from msc.oracle.adapters.openai import OpenAIAdapter
+
+    adapter = OpenAIAdapter(name="oa", model="gpt-4", api_key="sk-test")
+    messages = adapter._build_messages(NATIVE_HISTORY, None)
+
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "tool", "assistant", "user"]
+    assert messages[2]["tool_calls"][0]["function"] == {"name": "list_files", "arguments": '{"path": "."}'}
+    assert messages[3] == {"role": "tool", "tool_call_id": "call_1", "content": "a.txt"}
+    assert messages[5]["content"].startswith("Tool result (call_parsed)")
+    assert adapter._build_tools(TOOLS) == {"tools": [{"type": "function", "function": TOOLS[0]}]}
+    assert adapter._build_tools(None) == {}
+
+def test_anthropic_native_tool_blocks():
+    from msc.oracle.adapters.anthropic import AnthropicAdapter
+
+    adapter = AnthropicAdapter(name="ant", model="claude-3.5-sonnet", api_key="sk-test", prompt_caching=False)
+    request = adapter._build_request(NATIVE_HISTORY, None, TOOLS)
+
+    assert request["tools"] == [{"name": "list_files", "description": "List files", "input_schema": TOOLS[0]["parameters"]}]
+    assert request["messages"][1]["content"] == [
+        {"type": "tool_use", "id": "call_1", "name": "list_files", "input": {"path": "."}}
+    ]
+    assert request["messages"][2]["content"][0] == {"type": "tool_result", "tool_use_id": "call_1", "content": "a.txt"}
+    assert request["messages"][-1]["content"][0]["text"].startswith("Tool result (call_parsed)")
+
+def test_gemini_system_instruction_and_function_response():
+    from msc.oracle.adapters.gemini import GeminiAdapter
+
+    adapter = GeminiAdapter(name="gm", model="gemini-2.5-flash", api_key="sk-test")
+    system, contents = adapter._build_contents(NATIVE_HISTORY, None)
+    config = adapter._build_config(system, TOOLS)
+
+    assert config.system_instruction == "System prompt"
+    assert [c.role for c in contents] == ["user", "model", "user", "model", "user"]
+    assert contents[1].parts[0].function_call.name == "list_files"
+    assert contents[2].parts[0].function_response.name == "list_files"
+    assert config.tools[0].function_declarations[0].name == "list_files"
+
+@pytest.mark.asyncio
+async def test_oracle_passes_tools_only_to_native_tool_providers():
+    from msc.oracle import Oracle
+
+    native = create_complex_mock_provider("native", "gpt-4", [])
+    native.model_info = MagicMock(has_vision=False, has_thinking=False, has_tools=True)
+    textual = create_complex_mock_provider("textual", "gpt-4", [])
+    textual.model_info = MagicMock(has_vision=False, has_thinking=False, has_tools=False)
+    oracle = Oracle(providers=[native, textual])
+
+    await oracle.generate("gpt-4", "hi", tools=TOOLS)
+    assert native.generate.call_args.kwargs["tools"] == TOOLS
+    assert oracle.supports_native_tools("gpt-4") is False
+
+    oracle.remove_provider(native)
+    await oracle.generate("gpt-4", "hi", tools=TOOLS)
+    assert "tools" not in textual.generate.call_args.kwargs
@@ -1,7 +1,12 @@
 import pytest
 import asyncio
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import openai
+
 from msc.oracle import Oracle, ChatProvider
+from msc.oracle.errors import ErrorKind, RetryPolicy, classify_error, parse_retry_after
 
 class MockProvider(ChatProvider):
     def __init__(self, name, model_name, fail_count=0, error_type=Exception):
@@ -28,7 +33,7 @@ class MockProvider(ChatProvider):
         self.calls += 1
         if self.calls <= self.fail_count:
             raise self.error_type(f"Simulated failure {self.calls}")
-        return f"Success from {self.name}"
+        return f"Success from {self.name}", [], {"input_tokens": 1, "output_tokens": 1}
 
 @pytest.mark.asyncio
 async def test_oracle_failover_on_error():
@@ -38,7 +43,7 @@ async def test_oracle_failover_on_error():
     oracle = Oracle(providers=[p1, p2])
     result = await oracle.generate(model_name="gpt-4", prompt="hello")
     
-    assert result == "Success from p2"
+    assert result[0] == "Success from p2"
     assert p1.calls == 1
     assert p2.calls == 1
 
@@ -49,3 +54,120 @@ async def test_oracle_all_fail_raises_last_error():
     oracle = Oracle(providers=[p1])
     with pytest.raises(ValueError, match="Simulated failure 1"):
         await oracle.generate(model_name="gpt-4", prompt="hello")
+
+
+def status_error(status, message="error", headers=None):
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return openai.APIStatusError(message, response=response, body=None)
+
+class ScriptedProvider(MockProvider):
+    """按脚本依次抛出异常，脚本耗尽后返回成功"""
+    def __init__(self, name, model_name, errors):
+        super().__init__(name, model_name)
+        self.errors = list(errors)
+
+    async def generate(self, prompt, image=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"Success from {self.name}", [], {"input_tokens": 1, "output_tokens": 1}
+
+def test_classify_error_kinds():
+    assert classify_error(status_error(503)).kind == ErrorKind.TRANSIENT
+    assert classify_error(status_error(401)).kind == ErrorKind.AUTH
+    assert classify_error(status_error(400, "This model's maximum context length is 8192 tokens")).kind == ErrorKind.CONTEXT_OVERFLOW
+    assert classify_error(status_error(400, "invalid tool schema")).kind == ErrorKind.FATAL
+    assert classify_error(status_error(404, "model not found")).kind == ErrorKind.UNAVAILABLE
+    assert classify_error(status_error(422)).kind == ErrorKind.UNKNOWN
+    assert classify_error(httpx.ConnectError("refused")).kind == ErrorKind.TRANSIENT
+    assert classify_error(ValueError("boom")).kind == ErrorKind.UNKNOWN
+
+    limited = classify_error(status_error(429, headers={"retry-after": "7"}))
+    assert limited.kind == ErrorKind.RATE_LIMITED
+    assert limited.retry_after == 7.0
+    assert classify_error(status_error(429, headers={"retry-after-ms": "250"})).retry_after == 0.25
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(max_retries=10, base_delay=1.0, max_delay=4.0)
+    transient = classify_error(status_error(503))
+
+    delays = [policy.delay(transient, attempt) for attempt in range(6)]
+    assert all(0 <= d <= min(4.0, 2 ** i) for i, d in enumerate(delays))
+    assert policy.delay(transient, 10) is None
+    assert policy.delay(classify_error(status_error(401)), 0) is None
+
+@pytest.mark.asyncio
+async def test_transient_error_retried_on_same_provider():
+    """验证 503 在同一 Provider 上退避重试，而非立即转移"""
+    p1 = ScriptedProvider("p1", "gpt-4", [status_error(503), status_error(502)])
+    p2 = ScriptedProvider("p2", "gpt-4", [])
+    oracle = Oracle(providers=[p1, p2], retry=RetryPolicy(base_delay=0.001))
+
+    text, _, _, provider = await oracle.generate(model_name="gpt-4", prompt="hello")
+
+    assert text == "Success from p1"
+    assert p1.calls == 3
+    assert p2.calls == 0
+
+@pytest.mark.asyncio
+async def test_rate_limit_honours_retry_after():
+    p1 = ScriptedProvider("p1", "gpt-4", [status_error(429, headers={"retry-after": "3"})])
+    oracle = Oracle(providers=[p1])
+
+    with patch("msc.oracle.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        text, _, _, _ = await oracle.generate(model_name="gpt-4", prompt="hello")
+
+    assert text == "Success from p1"
+    mock_sleep.assert_awaited_once_with(3.0)
+
+@pytest.mark.asyncio
+async def test_long_retry_after_fails_over_immediately():
+    p1 = ScriptedProvider("p1", "gpt-4", [status_error(429, headers={"retry-after": "3600"})])
+    p2 = ScriptedProvider("p2", "gpt-4", [])
+    oracle = Oracle(providers=[p1, p2])
+
+    text, _, _, _ = await oracle.generate(model_name="gpt-4", prompt="hello")
+
+    assert text == "Success from p2"
+    assert p1.calls == 1
+
+@pytest.mark.asyncio
+async def test_fatal_error_not_retried_on_other_providers():
+    """验证请求本身错误 (400) 不会在每个 Provider 上重复尝试，且不计入健康度"""
+    p1 = ScriptedProvider("p1", "gpt-4", [status_error(400, "invalid tool schema")])
+    p2 = ScriptedProvider("p2", "gpt-4", [])
+    oracle = Oracle(providers=[p1, p2])
+
+    with pytest.raises(openai.APIStatusError):
+        await oracle.generate(model_name="gpt-4", prompt="hello")
+
+    assert p1.calls == 1
+    assert p2.calls == 0
+    assert oracle.health.get("p1").failures == 0
+
+@pytest.mark.asyncio
+async def test_auth_error_fails_over_without_retry():
+    p1 = ScriptedProvider("p1", "gpt-4", [status_error(401)])
+    p2 = ScriptedProvider("p2", "gpt-4", [])
+    oracle = Oracle(providers=[p1, p2])
+
+    text, _, _, _ = await oracle.generate(model_name="gpt-4", prompt="hello")
+
+    assert text == "Success from p2"
+    assert p1.calls == 1
+    assert oracle.health.get("p1").failures == 1
+
+@pytest.mark.asyncio
+async def test_model_not_found_fails_over():
+    """验证 404 (模型在该 Provider 上不存在) 属于 Provider 侧问题，转移到下一个候选者"""
+    p1 = ScriptedProvider("p1", "gpt-4", [status_error(404, "model not found")])
+    p2 = ScriptedProvider("p2", "gpt-4", [])
+    oracle = Oracle(providers=[p1, p2])
+
+    text, _, _, _ = await oracle.generate(model_name="gpt-4", prompt="hello")
+
+    assert text == "Success from p2"
+    assert p1.calls == 1
+    assert oracle.health.get("p1").failures == 1
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+
+from msc.oracle import Oracle
+from msc.oracle.ratelimit import ProviderLimiter, TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight_queues_instead_of_failing(make_provider):
+    """
+    验证并发上限：超出 max_in_flight 的请求排队等待而非报错，并上报排队深度与等待时间
+    """
+    delay, requests = 0.05, 3
+    provider = make_provider("p1", rate_limits={"max_in_flight": 1}, delay=delay)
+    oracle = Oracle(providers=[provider])
+
+    results = await asyncio.gather(*[oracle.generate("gpt-4", f"task {i}") for i in range(requests)])
+
+    assert len(results) == requests
+    assert provider.peak_concurrent == 1
+    stats = oracle.rate_limit_stats()["p1"]
+    assert stats["requests"] == requests
+    assert stats["max_queue_depth"] == requests - 1
+    assert stats["max_wait"] > delay
+    assert stats["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    capacity, refill_per_sec = 2, 20
+    bucket = TokenBucket(capacity=capacity, refill_per_sec=refill_per_sec)
+    for _ in range(capacity):
+        await bucket.acquire()
+
+    started = time.monotonic()
+    await bucket.acquire()
+    # 留出计时误差
+    assert time.monotonic() - started >= 0.8 / refill_per_sec
+
+
+@pytest.mark.asyncio
+async def test_tpm_settle_debits_underestimated_usage():
+    limiter = ProviderLimiter(tpm=6000)
+    async with limiter.slot(estimated_tokens=100):
+        pass
+    limiter.settle(estimated_tokens=100, actual_tokens=600)
+
+    assert limiter.tokens.tokens == pytest.approx(6000 - 600, abs=5)
+
+
+@pytest.mark.asyncio
+async def test_providers_without_limits_are_not_governed(make_provider):
+    requests = 3
+    provider = make_provider("free", delay=0.05)
+    oracle = Oracle(providers=[provider])
+
+    await asyncio.gather(*[oracle.generate("gpt-4", f"task {i}") for i in range(requests)])
+
+    assert provider.peak_concurrent == requests
+    assert oracle.rate_limit_stats() == {}
@@ -0,0 +1,50 @@
+import pytest
+
+from msc.oracle import Oracle
+from msc.oracle.routing import THINKING, TOOLS, VISION, RoutingIndex
+
+
+def test_index_packs_flags_and_caps_into_masks(make_provider):
+    index = RoutingIndex()
+    p = make_provider("p", caps=["green-tea", "tool"], vision=True, tools=True)
+    index.add(p)
+
+    mask = index.provider_mask(p)
+    assert mask & VISION and mask & TOOLS and not mask & THINKING
+    assert index.lookup("gpt-4", ["green-tea"], image=True) == [p]
+    assert index.lookup("gpt-4", require_thinking=True) == []
+    assert index.lookup("gpt-4", ["unknown-cap"]) == []
+    assert index.lookup("gpt-5") == []
+
+
+def test_tool_requirement_needs_tag_and_native_support(make_provider):
+    index = RoutingIndex()
+    tagged_only = make_provider("tagged", caps=["tool"], tools=False)
+    native = make_provider("native", caps=["tool"], tools=True)
+    index.rebuild([tagged_only, native])
+
+    assert index.lookup("gpt-4", ["tool"]) == [native]
+
+
+@pytest.mark.asyncio
+async def test_oracle_index_updates_incrementally(make_provider):
+    p1 = make_provider("p1")
+    oracle = Oracle(providers=[p1])
+
+    with pytest.raises(ValueError, match="No provider found for claude"):
+        await oracle.generate("claude", "hi")
+
+    p2 = make_provider("p2", "claude", caps=["green-tea"])
+    oracle.add_provider(p2)
+    _, _, _, provider = await oracle.generate("claude", "hi", require_caps=["green-tea"])
+    assert provider is p2
+
+    oracle.remove_provider(p2)
+    with pytest.raises(ValueError):
+        await oracle.generate("claude", "hi")
+
+    p3 = make_provider("p3", "claude")
+    oracle.reload_providers([p3])
+    _, _, _, provider = await oracle.generate("claude", "hi")
+    assert provider is p3
+    assert oracle.providers == [p3]
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from msc.core.og import Session
+from msc.oracle import Oracle
+from msc.oracle.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_share_one_call(make_provider):
+    """验证相同的并发请求只产生一次上游调用，usage 只归属一次"""
+    callers = 4
+    provider = make_provider("p1", usage={"input_tokens": 100, "output_tokens": 10}, delay=0.05)
+    oracle = Oracle([provider])
+
+    results = await asyncio.gather(*[oracle.generate("gpt-4", "same task") for _ in range(callers)])
+
+    provider.generate.assert_awaited_once()
+    assert all(text == "Response from p1" for text, _, _, _ in results)
+    coalesced = [usage.get("coalesced", False) for _, _, usage, _ in results]
+    assert coalesced.count(False) == 1 and coalesced.count(True) == callers - 1
+    total_gas = sum(Session._compute_gas(usage, provider.pricing) for _, _, usage, _ in results)
+    assert total_gas == Session._compute_gas({"input_tokens": 100, "output_tokens": 10}, provider.pricing)
+    assert oracle.single_flight.stats() == {"leaders": 1, "coalesced": callers - 1, "in_flight": 0}
+
+
+@pytest.mark.asyncio
+async def test_distinct_or_sequential_requests_are_not_coalesced(make_provider):
+    provider = make_provider("p1", delay=0.01)
+    oracle = Oracle([provider])
+
+    prompts = ["task a", "task b"]
+    await asyncio.gather(*[oracle.generate("gpt-4", prompt) for prompt in prompts])
+    await oracle.generate("gpt-4", "task a")
+    made = len(prompts) + 1
+    assert provider.generate.await_count == made
+
+    uncoalesced = Oracle([provider], coalesce=False)
+    await asyncio.gather(*[uncoalesced.generate("gpt-4", "task a") for _ in range(2)])
+    assert provider.generate.await_count == made + 2
+
+
+@pytest.mark.asyncio
+async def test_coalesced_callers_share_errors_and_survive_leader_cancellation(make_provider):
+    """验证上游异常传播给所有等待者，且发起者被取消不影响其他等待者"""
+    failing = make_provider("p1", delay=0.05, error=ValueError("boom"))
+    oracle = Oracle([failing])
+    results = await asyncio.gather(*[oracle.generate("gpt-4", "x") for _ in range(2)], return_exceptions=True)
+    failing.generate.assert_awaited_once()
+    assert all(isinstance(r, ValueError) for r in results)
+
+    provider = make_provider("p1", delay=0.05)
+    oracle = Oracle([provider])
+    leader = asyncio.create_task(oracle.generate("gpt-4", "x"))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(oracle.generate("gpt-4", "x"))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    text, _, usage, _ = await follower
+    assert text == "Response from p1" and usage["coalesced"]
+    provider.generate.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_upstream_call_is_cancelled_when_every_waiter_leaves():
+    """验证所有等待者都被取消 (如 msc/abort) 时上游调用随之取消，之后的同键请求重新发起"""
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def upstream():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "late"
+
+    flight = SingleFlight()
+    waiters = [asyncio.create_task(flight.do("k", upstream)) for _ in range(2)]
+    await started.wait()
+    waiters[0].cancel()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+
+    waiters[1].cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert not flight.in_flight("k")
+
+    async def fresh():
+        return "fresh"
+
+    assert await flight.do("k", fresh) == ("fresh", False)
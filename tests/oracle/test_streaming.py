@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from msc.oracle import Oracle
+from msc.oracle.stream import StreamChunk, collect_stream
+
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_first_token(make_provider):
+    p1 = make_provider("p1", stream=True, error=RuntimeError("Provider p1 failed"))
+    p2 = make_provider("p2", stream=True, usage={"input_tokens": 3, "output_tokens": 4})
+    oracle = Oracle(providers=[p1, p2])
+
+    text, tool_calls, usage, provider = await collect_stream(oracle.generate_stream("gpt-4", "Hello"))
+
+    assert text == "Response from p2"
+    assert tool_calls == []
+    assert usage == {"input_tokens": 3, "output_tokens": 4}
+    assert provider is p2
+    p2.generate.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stream_error_after_first_token_is_not_failed_over(make_provider):
+    p1 = make_provider("p1", stream=True, stream_error=RuntimeError("stream broken"))
+    p2 = make_provider("p2", stream=True)
+    oracle = Oracle(providers=[p1, p2])
+
+    received = []
+    with pytest.raises(RuntimeError, match="stream broken"):
+        async for chunk in oracle.generate_stream("gpt-4", "Hello"):
+            received.append(chunk)
+    assert received[0].text == "Response from p1"
+
+
+@pytest.mark.asyncio
+async def test_collect_stream_joins_tool_call_fragments(make_provider):
+    chunks = [
+        StreamChunk(type="text", text="Thinking... "),
+        StreamChunk(type="tool_call", index=0, tool_call_id="c1", tool_name="list_files", arguments='{"pa'),
+        StreamChunk(type="tool_call", index=0, arguments='th": "."}'),
+        StreamChunk(type="text", text="done"),
+    ]
+    provider = make_provider("p1", stream=True, chunks=chunks)
+    oracle = Oracle(providers=[provider])
+
+    text, tool_calls, _, _ = await collect_stream(oracle.generate_stream("gpt-4", "Hello"))
+
+    assert text == "Thinking... done"
+    assert tool_calls == [{"name": "list_files", "parameters": {"path": "."}, "id": "c1"}]
+
+
+@pytest.mark.asyncio
+async def test_non_streaming_provider_falls_back_to_generate(make_provider):
+    legacy = make_provider("legacy", text="full text", usage={"input_tokens": 1, "output_tokens": 2})
+    oracle = Oracle(providers=[legacy])
+
+    text, _, usage, provider = await collect_stream(oracle.generate_stream("gpt-4", "Hello"))
+
+    assert text == "full text"
+    assert usage == legacy.response[2]
+    assert provider is legacy
+
+
+@pytest.mark.asyncio
+async def test_openai_adapter_stream_parses_deltas():
+    from msc.oracle.adapters.openai import OpenAIAdapter
+
+    adapter = OpenAIAdapter(name="oa", model="gpt-4", api_key="sk-test")
+
+    def delta_chunk(content=None, tool_calls=None):
+        delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+
+    fn = SimpleNamespace(name="execute", arguments='{"command": "ls"}')
+    raw = [
+        delta_chunk(content="Hel"),
+        delta_chunk(content="lo"),
+        delta_chunk(tool_calls=[SimpleNamespace(index=0, id="call_1", function=fn)]),
+        SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=7, completion_tokens=9)),
+    ]
+
+    async def fake_stream():
+        for item in raw:
+            yield item
+
+    adapter.client = MagicMock()
+    adapter.client.chat.completions.create = AsyncMock(return_value=fake_stream())
+
+    chunks = [c async for c in adapter.generate_stream("hi")]
+
+    assert [c.text for c in chunks if c.type == "text"] == ["Hel", "lo"]
+    assert chunks[-1].usage == {"input_tokens": 7, "output_tokens": 9}
+    kwargs = adapter.client.chat.completions.create.call_args.kwargs
+    assert kwargs["stream"] is True
@@ -0,0 +1,68 @@
+import pytest
+
+from msc.oracle import ContextWindowExceededError, Oracle
+from msc.oracle.tokens import MESSAGE_OVERHEAD, TokenEstimator, heuristic_count
+
+
+def test_estimator_counts_messages_and_cjk():
+    estimator = TokenEstimator()
+
+    assert estimator.count("a" * 400) == 400 // 4 + 1
+    assert estimator.count("你好世界") == len("你好世界") + 1
+    messages = [{"role": "system", "content": "a" * 40}, {"role": "user", "content": [{"type": "text", "text": "b" * 40}]}]
+    assert estimator.count(messages) == 2 * (MESSAGE_OVERHEAD + heuristic_count("a" * 40)) + 1
+
+
+def test_estimator_calibrates_per_provider():
+    estimator = TokenEstimator(counter=len, alpha=0.5)
+    estimator.calibrate("p1", 100, 200)
+    estimator.calibrate("p1", 100, 100)
+
+    ratio = (2.0 + 1.0) / 2
+    assert estimator.ratio("p1") == ratio
+    assert estimator.ratio("p2") == 1.0
+    assert estimator.estimate("x" * 99, "p1") == int((99 + 1) * ratio)
+
+
+@pytest.mark.asyncio
+async def test_oracle_skips_providers_with_small_context_window(make_provider):
+    """验证窗口不足的候选者在发起请求前即被跳过"""
+    small = make_provider("small", context_window=50)
+    large = make_provider("large", context_window=10000)
+    oracle = Oracle([small, large])
+
+    with pytest.raises(ContextWindowExceededError):
+        await oracle.generate("gpt-4", "a" * 100000)
+
+    _, _, _, provider = await oracle.generate("gpt-4", "a" * 1000)
+
+    assert provider is large
+    small.generate.assert_not_called()
+
+
+def test_context_budget_uses_raw_units_and_reserves_output(make_provider):
+    """验证历史裁剪预算预留输出空间并按校准系数换算为原始估算单位，裁剪后的请求不会被判定超出窗口"""
+    window, output = 2000, 500
+    provider = make_provider("p", context_window=window)
+    oracle = Oracle([provider], expected_output_tokens=output)
+    assert oracle.context_budget("gpt-4") == window - output
+
+    ratio = 1.5
+    oracle.estimator.calibrate("p", 1000, int(1000 * ratio))
+    budget = oracle.context_budget("gpt-4")
+    assert budget == int((window - output) / ratio)
+    assert oracle.estimator.scale(budget, "p") + output <= window
+    assert oracle.context_budget("gpt-4", output_tokens=0) == int(window / ratio)
+
+
+@pytest.mark.asyncio
+async def test_oracle_calibrates_from_reported_usage(make_provider):
+    prompt = "a" * 1000
+    reported = 502
+    provider = make_provider("p", usage={"input_tokens": reported, "output_tokens": 1})
+    oracle = Oracle([provider])
+
+    await oracle.generate("gpt-4", prompt)
+
+    assert oracle.estimator.ratio("p") == reported / oracle.estimator.count(prompt)
+    assert oracle.estimate_tokens(prompt, provider) == reported
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+
+from msc.oracle.transport import TransportConfig, TransportManager, get_transport
+
+
+def test_adapters_share_one_connection_pool():
+    """验证所有适配器复用同一个进程级连接池"""
+    from msc.oracle.adapters.anthropic import AnthropicAdapter
+    from msc.oracle.adapters.openai import OpenAIAdapter
+
+    shared = get_transport().shared_client()
+    p1 = OpenAIAdapter(name="a", model="gpt-4", api_key="sk-test")
+    p2 = OpenAIAdapter(name="b", model="gpt-4", api_key="sk-test")
+    p3 = AnthropicAdapter(name="c", model="claude", api_key="sk-test")
+
+    assert p1.client._client is shared
+    assert p2.client._client is shared
+    assert p3.client._client is shared
+
+
+@pytest.mark.asyncio
+async def test_transport_applies_limits_and_closes_cleanly():
+    manager = TransportManager(TransportConfig(max_connections=7, http2=False))
+    client = manager.client()
+
+    assert client is manager.client()
+    assert client._transport._pool._max_connections == 7
+
+    await manager.aclose()
+    assert client.is_closed
+    assert manager.client() is not client
+    await manager.aclose()
+
+
+def test_reconfigure_requires_close():
+    manager = TransportManager()
+    manager.client()
+    with pytest.raises(RuntimeError):
+        manager.configure(TransportConfig(max_connections=1))
+
+
+def test_pools_are_per_event_loop_and_rebuilt_after_close():
+    """
+    验证连接池按事件循环分别创建：多次 asyncio.run 不会复用已关闭循环的连接；
+    aclose 后 SDK 持有的共享句柄继续可用
+    """
+    manager = TransportManager(TransportConfig(http2=False))
+    created = []
+
+    def create():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, text="ok")))
+        created.append(client)
+        return client
+
+    manager._create = create
+    shared = manager.shared_client()
+
+    async def fetch():
+        response = await shared.get("https://example.invalid/")
+        return response.text, manager.client()
+
+    first_text, first = asyncio.run(fetch())
+    second_text, second = asyncio.run(fetch())
+    assert first_text == second_text == "ok"
+    assert first is not second
+
+    async def fetch_close_fetch():
+        _, before = await fetch()
+        # 网关 shutdown 关闭连接池；SDK 关闭其客户端时不影响共享池
+        await manager.aclose()
+        await shared.aclose()
+        text, after = await fetch()
+        return text, before, after
+
+    text, before, after = asyncio.run(fetch_close_fetch())
+    assert text == "ok"
+    assert before.is_closed
+    assert after is not before and not after.is_closed
+    assert len(created) == 4
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+from msc.oracle import Oracle
+
+
+class StubServer:
+    """最小化的本地 HTTP 桩服务，记录请求并按路径返回固定响应"""
+
+    def __init__(self, slow_paths=()):
+        self.requests = []
+        self.slow_paths = set(slow_paths)
+        self.server = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def _handle(self, reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head.decode().split("\r\n")
+        method, path, _ = request_line.split(" ", 2)
+        headers = dict(line.split(": ", 1) for line in header_lines if ": " in line)
+        length = int(headers.get("content-length") or headers.get("Content-Length") or 0)
+        body = await reader.readexactly(length) if length else b""
+        self.requests.append((method, path, json.loads(body) if body else None))
+
+        if path in self.slow_paths:
+            await asyncio.sleep(5)
+        payload = json.dumps({"object": "list", "data": []} if path.endswith("/models") else {"done": True}).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+            + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_warmup_preloads_ollama_and_seeds_health():
+    """验证预热会请求 Ollama 预加载模型 (keep_alive)，并以测得延迟初始化健康排序"""
+    from msc.oracle.adapters.ollama import OllamaAdapter
+    from msc.oracle.adapters.openai import OpenAIAdapter
+
+    async with StubServer() as stub:
+        ollama = OllamaAdapter(name="local", model="qwen3:8b", base_url=f"{stub.base_url}/v1", keep_alive="1h")
+        remote = OpenAIAdapter(name="remote", model="qwen3:8b", api_key="sk-test", base_url=f"{stub.base_url}/v1")
+        oracle = Oracle([ollama, remote])
+
+        results = await oracle.warmup(timeout=5)
+
+    assert results["local"]["ok"] and results["remote"]["ok"]
+    assert ("POST", "/api/generate", {"model": "qwen3:8b", "keep_alive": "1h"}) in stub.requests
+    assert ("GET", "/v1/models", None) in stub.requests
+    assert oracle.health.get("local").ewma_latency == pytest.approx(results["local"]["latency"])
+
+
+@pytest.mark.asyncio
+async def test_warmup_marks_dead_and_slow_endpoints():
+    """验证不可达与超出截止时间的 Provider 被记为失败，且预热不会超过截止时间太久"""
+    from msc.oracle.adapters.openai import OpenAIAdapter
+
+    async with StubServer(slow_paths={"/slow/v1/models"}) as stub:
+        healthy = OpenAIAdapter(name="healthy", model="m", api_key="sk-test", base_url=f"{stub.base_url}/v1")
+        slow = OpenAIAdapter(name="slow", model="m", api_key="sk-test", base_url=f"{stub.base_url}/slow/v1")
+        dead = OpenAIAdapter(name="dead", model="m", api_key="sk-test", base_url=f"http://127.0.0.1:{unused_port()}/v1")
+        oracle = Oracle([slow, dead, healthy])
+
+        started = asyncio.get_running_loop().time()
+        results = await oracle.warmup(timeout=0.5)
+        elapsed = asyncio.get_running_loop().time() - started
+
+    assert elapsed < 2
+    assert results["healthy"]["ok"]
+    assert results["slow"] == {"ok": False, "error": "timeout"}
+    assert not results["dead"]["ok"]
+    assert oracle.health.get("dead").failures == 1
+    # 健康的 Provider 在排序中领先于失败者
+    assert oracle.health.rank(["slow", "dead", "healthy"])[0] == "healthy"